@@ -3,11 +3,13 @@ from django.urls import path
 from django.shortcuts import redirect
 from django.contrib import messages
 from django.http import HttpResponse
-from .models import ActivityEventField, ActivityEvent, SyncTask
+from .models import ActivityEventField, ActivityEvent, SyncTask, SyncCheckpoint
 from django.utils import timezone
 from .populate_activity_fields_functions import populate_activity_fields
 from .fetch_activity_events_functions import get_json_from_activity_events_api, process_activity_events
 from .generate_csv_functions import write_csv_to_http
+from .index_functions import sync_activity_events_indexes
+from .tasks import sync_indexes
 from django.core.exceptions import FieldError
 from . import app_settings as aps
 
@@ -30,6 +32,7 @@ class ActivityEventFieldAdmin(admin.ModelAdmin):
         urls = super().get_urls()
         custom_urls = [
             path('admin_populate_activity_fields/', self.admin_site.admin_view(self.admin_populate_activity_fields), name='admin-populate-activity-fields'),
+            path('admin_sync_activity_events_indexes/', self.admin_site.admin_view(self.admin_sync_activity_events_indexes), name='admin-sync-activity-events-indexes'),
         ]
         return custom_urls + urls
 
@@ -40,6 +43,18 @@ class ActivityEventFieldAdmin(admin.ModelAdmin):
         except Exception as e:
             self.message_user(request, f"Error occurred: {e}", messages.ERROR)
         return redirect('admin:activity_events_activityeventfield_changelist')  # Redirect to the changelist view
+
+    def admin_sync_activity_events_indexes(self, request):
+        try:
+            planned = sync_activity_events_indexes(dry_run=True)
+            # Index builds can take minutes on large tables, so they run in the Celery worker
+            task = sync_indexes.delay()
+            created = ', '.join(planned['created_indexes']) or 'none'
+            dropped = ', '.join(planned['dropped_indexes']) or 'none'
+            self.message_user(request, f"Index synchronization started (task {task.id}). Indexes to create: {created}. Indexes to drop: {dropped}.", messages.SUCCESS)
+        except Exception as e:
+            self.message_user(request, f"Error occurred: {e}", messages.ERROR)
+        return redirect('admin:activity_events_activityeventfield_changelist')
     
 
 class ActivityEventAdmin(admin.ModelAdmin):
@@ -65,7 +80,9 @@ class ActivityEventAdmin(admin.ModelAdmin):
         end_datetime = timezone.now()
         start_datetime = end_datetime - timezone.timedelta(hours=1)
         try:
-            get_json_from_activity_events_api(start_datetime, end_datetime)
+            _, failed_requests = get_json_from_activity_events_api(start_datetime, end_datetime)
+            if failed_requests:
+                raise Exception(failed_requests[0]['error'])
             success_message = "Successfully received response from API Activity Events."
             self.message_user(request, success_message, messages.SUCCESS)
         except Exception as e:
@@ -81,9 +98,10 @@ class ActivityEventAdmin(admin.ModelAdmin):
                 raise Exception(f'details:{result}')
             n_created = result.get('n_created_records')
             n_updated = result.get('n_updated_records')
+            n_unchanged = result.get('n_unchanged_records')
             start = result.get('start_datetime').strftime("%Y-%m-%d %H:%M:%S")
             end = result.get('end_datetime').strftime("%Y-%m-%d %H:%M:%S")
-            message = f"Success retrieving activity events. Period: {start} - {end}. Created: {n_created}. Updated: {n_updated}."                       
+            message = f"Success retrieving activity events. Period: {start} - {end}. Created: {n_created}. Updated: {n_updated}. Unchanged: {n_unchanged}."                       
             self.message_user(request, message, messages.SUCCESS)
         except Exception as e:
             self.message_user(request, f"Error occurred: {e}", messages.ERROR)
@@ -119,8 +137,16 @@ class SyncTaskAdmin(admin.ModelAdmin):
     list_display = ('taskuuid', 'taskname', 'status', 'result', 'started_at', 'created_at')
     search_fields = ('taskname', 'status', 'result')
     list_filter = ('taskname', 'status', 'started_at', 'created_at')        
+
+
+class SyncCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('taskname', 'day', 'window_start', 'window_end', 'status', 'n_pages', 'n_records', 'watermark', 'task_id', 'updated_at')
+    search_fields = ('taskname', 'status', 'task_id')
+    list_filter = ('taskname', 'status', 'day', 'updated_at')
+    readonly_fields = ('created_at', 'updated_at')
     
 
 admin.site.register(ActivityEventField, ActivityEventFieldAdmin)
 admin.site.register(ActivityEvent, ActivityEventAdmin)
-admin.site.register(SyncTask, SyncTaskAdmin)
\ No newline at end of file
+admin.site.register(SyncTask, SyncTaskAdmin)
+admin.site.register(SyncCheckpoint, SyncCheckpointAdmin)
\ No newline at end of file
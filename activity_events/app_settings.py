@@ -2,12 +2,40 @@ from django.conf import settings
 
 ACTIVITY_EVENTS_FETCH_TASK_NAME = 'activity_events.tasks.fetch_and_update_activity_events'
 
+ACTIVITY_EVENTS_API_BASE_URL = getattr(settings, 'ACTIVITY_EVENTS_API_BASE_URL', 'https://api.powerbi.com')
 ACTIVITY_EVENTS_FETCH_MAX_PAST_DAYS =  getattr(settings, 'ACTIVITY_EVENTS_FETCH_MAX_PAST_DAYS', 15)
 ACTIVITY_EVENTS_FETCH_BUFFER_HOURS = getattr(settings, 'ACTIVITY_EVENTS_FETCH_BUFFER_HOURS', 8)
+ACTIVITY_EVENTS_FETCH_USE_WATERMARK = getattr(settings, 'ACTIVITY_EVENTS_FETCH_USE_WATERMARK', True)
+ACTIVITY_EVENTS_FETCH_LATENESS_MINUTES = getattr(settings, 'ACTIVITY_EVENTS_FETCH_LATENESS_MINUTES', 60)
+ACTIVITY_EVENTS_FETCH_MAX_WORKERS = getattr(settings, 'ACTIVITY_EVENTS_FETCH_MAX_WORKERS', 1)
+ACTIVITY_EVENTS_FETCH_TASK_MAX_RETRIES = getattr(settings, 'ACTIVITY_EVENTS_FETCH_TASK_MAX_RETRIES', 3)
+ACTIVITY_EVENTS_FETCH_TASK_RETRY_DELAY_SECONDS = getattr(settings, 'ACTIVITY_EVENTS_FETCH_TASK_RETRY_DELAY_SECONDS', 300)
+ACTIVITY_EVENTS_API_MAX_REQUESTS_PER_HOUR = getattr(settings, 'ACTIVITY_EVENTS_API_MAX_REQUESTS_PER_HOUR', 200)
+ACTIVITY_EVENTS_API_BURST = getattr(settings, 'ACTIVITY_EVENTS_API_BURST', 20)
+ACTIVITY_EVENTS_API_MAX_RETRIES = getattr(settings, 'ACTIVITY_EVENTS_API_MAX_RETRIES', 5)
+ACTIVITY_EVENTS_API_BACKOFF_BASE_SECONDS = getattr(settings, 'ACTIVITY_EVENTS_API_BACKOFF_BASE_SECONDS', 2)
+ACTIVITY_EVENTS_API_BACKOFF_MAX_SECONDS = getattr(settings, 'ACTIVITY_EVENTS_API_BACKOFF_MAX_SECONDS', 120)
 ACTIVITY_EVENTS_PAGINATED_BY =  getattr(settings, 'ACTIVITY_EVENTS_PAGINATED_BY', 50)
+ACTIVITY_EVENTS_COUNT_MODE = getattr(settings, 'ACTIVITY_EVENTS_COUNT_MODE', 'estimated')
+ACTIVITY_EVENTS_STREAM_CHUNK_SIZE = getattr(settings, 'ACTIVITY_EVENTS_STREAM_CHUNK_SIZE', 2000)
+ACTIVITY_EVENTS_API_FAST_SERIALIZATION = getattr(settings, 'ACTIVITY_EVENTS_API_FAST_SERIALIZATION', True)
 ACTIVITY_EVENTS_N_FIELDS = getattr(settings, 'ACTIVITY_EVENTS_N_FIELDS', 30)
 ACTIVITY_EVENTS_FOLDER = getattr(settings, 'ACTIVITY_EVENTS_FOLDER', 'activity_events')
 ACTIVITY_EVENTS_CHART_MAX_PAST_DAYS = getattr(settings, 'ACTIVITY_EVENTS_CHART_MAX_PAST_DAYS', 365)
+ACTIVITY_EVENTS_SAVE_BATCH_SIZE = getattr(settings, 'ACTIVITY_EVENTS_SAVE_BATCH_SIZE', 1000)
+ACTIVITY_EVENTS_BULK_LOADER = getattr(settings, 'ACTIVITY_EVENTS_BULK_LOADER', 'copy')
+ACTIVITY_EVENTS_PARTITION_MONTHS_AHEAD = getattr(settings, 'ACTIVITY_EVENTS_PARTITION_MONTHS_AHEAD', 3)
+ACTIVITY_EVENTS_PURGE_BATCH_SIZE = getattr(settings, 'ACTIVITY_EVENTS_PURGE_BATCH_SIZE', 5000)
+ACTIVITY_EVENTS_PURGE_SLEEP_SECONDS = getattr(settings, 'ACTIVITY_EVENTS_PURGE_SLEEP_SECONDS', 0.1)
+ACTIVITY_EVENTS_PURGE_ARCHIVE = getattr(settings, 'ACTIVITY_EVENTS_PURGE_ARCHIVE', False)
+ACTIVITY_EVENTS_PURGE_ARCHIVE_FOLDER = getattr(settings, 'ACTIVITY_EVENTS_PURGE_ARCHIVE_FOLDER', 'activity_events_purged')
+ACTIVITY_EVENTS_CHANGE_FEED_BATCH_SIZE = getattr(settings, 'ACTIVITY_EVENTS_CHANGE_FEED_BATCH_SIZE', 5000)
+ACTIVITY_EVENTS_SEARCH_INDEX = getattr(settings, 'ACTIVITY_EVENTS_SEARCH_INDEX', False)
+ACTIVITY_EVENTS_FACETS = getattr(settings, 'ACTIVITY_EVENTS_FACETS', True)
+ACTIVITY_EVENTS_ROLLUPS = getattr(settings, 'ACTIVITY_EVENTS_ROLLUPS', True)
+ACTIVITY_EVENTS_ARCHIVE_PAGES = getattr(settings, 'ACTIVITY_EVENTS_ARCHIVE_PAGES', False)
+ACTIVITY_EVENTS_ARCHIVE_FOLDER = getattr(settings, 'ACTIVITY_EVENTS_ARCHIVE_FOLDER', 'activity_events_archive')
+ACTIVITY_EVENTS_ARCHIVE_COMPRESSLEVEL = getattr(settings, 'ACTIVITY_EVENTS_ARCHIVE_COMPRESSLEVEL', 6)
 
 MEDIA_ROOT =  getattr(settings, 'MEDIA_ROOT')
 TIME_ZONE = getattr(settings, 'TIME_ZONE')
\ No newline at end of file
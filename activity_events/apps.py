@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ActivityEventsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'activity_events'
+
+    def ready(self):
+        from . import signals
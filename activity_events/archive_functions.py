@@ -0,0 +1,126 @@
+import os
+import gzip
+import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from django.db import connections
+from django.utils import timezone
+from .models import ActivityEvent
+from .common_functions import save_records_to_model
+from . import app_settings as aps
+
+
+def get_archive_path():
+    return os.path.join(aps.MEDIA_ROOT, aps.ACTIVITY_EVENTS_ARCHIVE_FOLDER)
+
+
+def archive_activity_events_page(page, window_start, task_id=None):
+    # Writes one API page as a gzip-compressed NDJSON segment, partitioned by the day of its window
+    if not page:
+        return None
+    day_path = os.path.join(get_archive_path(), window_start.strftime('%Y'), window_start.strftime('%m'), window_start.strftime('%d'))
+    os.makedirs(day_path, exist_ok=True)
+    # The timestamp comes first, so the segments of a day sort in fetch order
+    filename = f'activity_events_{timezone.now().strftime("%Y%m%d%H%M%S%f")}_{task_id or "notask"}_{uuid.uuid4().hex}.ndjson.gz'
+    file_path = os.path.join(day_path, filename)
+    # Write to a temporary name first so replays never read a partial segment
+    tmp_path = f'{file_path}.tmp'
+    with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=aps.ACTIVITY_EVENTS_ARCHIVE_COMPRESSLEVEL) as segment:
+        for item in page:
+            segment.write(json.dumps(item, separators=(',', ':')))
+            segment.write('\n')
+    os.replace(tmp_path, file_path)
+    return file_path
+
+
+def list_archived_segments(start_date=None, end_date=None):
+    # Returns the segment paths whose day partition lies between start_date and end_date (inclusive)
+    segments = []
+    archive_path = get_archive_path()
+    if not os.path.exists(archive_path):
+        return segments
+    for root, dirs, files in os.walk(archive_path):
+        dirs.sort()
+        relative = os.path.relpath(root, archive_path).split(os.sep)
+        if len(relative) != 3:
+            continue
+        try:
+            day = date(int(relative[0]), int(relative[1]), int(relative[2]))
+        except ValueError:
+            continue
+        if (start_date and day < start_date) or (end_date and day > end_date):
+            continue
+        segments.extend(os.path.join(root, filename) for filename in sorted(files) if filename.endswith('.ndjson.gz'))
+    return segments
+
+
+def iter_segment_pages(file_path, page_size):
+    # Streams a segment back in pages of at most page_size records
+    page = []
+    with gzip.open(file_path, 'rt', encoding='utf-8') as segment:
+        for line in segment:
+            if not line.strip():
+                continue
+            page.append(json.loads(line))
+            if len(page) >= page_size:
+                yield page
+                page = []
+    if page:
+        yield page
+
+
+def replay_segment(file_path, task_id):
+    result = {
+        'segment': file_path,
+        'n_created_records': 0,
+        'n_updated_records': 0,
+        'n_unchanged_records': 0,
+        'failed_records': []
+    }
+    for page in iter_segment_pages(file_path, aps.ACTIVITY_EVENTS_SAVE_BATCH_SIZE or 1000):
+        page_result = save_records_to_model(page, ActivityEvent, task_id)
+        result['n_created_records'] += page_result['n_created_records']
+        result['n_updated_records'] += page_result['n_updated_records']
+        result['n_unchanged_records'] += page_result['n_unchanged_records']
+        result['failed_records'].extend(page_result['failed_records'])
+    return result
+
+
+def replay_day_segments(segments, task_id):
+    # The segments of a day can hold successive versions of the same events, so they are
+    # replayed one after the other in filename (fetch) order and the last fetched version wins
+    try:
+        return [replay_segment(file_path, task_id) for file_path in segments]
+    finally:
+        # Each worker thread opens its own database connection
+        connections.close_all()
+
+
+def replay_activity_events(start_date=None, end_date=None, max_workers=None):
+    # Feeds archived pages back through the ingestion path, without calling the Power BI API
+    if max_workers is None:
+        max_workers = aps.ACTIVITY_EVENTS_FETCH_MAX_WORKERS
+    task_id = f"replay-{uuid.uuid4()}"
+    segments = list_archived_segments(start_date, end_date)
+    # Only different days are replayed concurrently
+    days = {}
+    for file_path in segments:
+        days.setdefault(os.path.dirname(file_path), []).append(file_path)
+
+    if days:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(days)))) as executor:
+            details = [item for day_details in executor.map(lambda day_segments: replay_day_segments(day_segments, task_id), days.values())
+                       for item in day_details]
+    else:
+        details = []
+
+    result = {
+        'task_id': task_id,
+        'n_segments': len(segments),
+        'n_created_records': sum(item['n_created_records'] for item in details),
+        'n_updated_records': sum(item['n_updated_records'] for item in details),
+        'n_unchanged_records': sum(item['n_unchanged_records'] for item in details),
+        'failed_records': [record for item in details for record in item['failed_records']]
+    }
+    return result
@@ -0,0 +1,177 @@
+import io
+import csv
+import json
+from django.db import connections, transaction, router
+from django.utils import timezone
+from . import app_settings as aps
+from .partition_functions import is_table_partitioned
+
+# NULL marker of the CSV COPY stream: every string is written quoted (an empty string as ""), so
+# only a None value is written as an unquoted empty field
+COPY_NULL = ''
+
+
+def get_bulk_loader(target_model):
+    # COPY into a staging table on PostgreSQL, executemany on SQLite, bulk_create otherwise
+    connection = connections[router.db_for_write(target_model)]
+    if aps.ACTIVITY_EVENTS_BULK_LOADER == 'copy':
+        if connection.vendor == 'postgresql':
+            return copy_upsert_rows
+        if connection.vendor == 'sqlite':
+            return executemany_upsert_rows
+    return orm_upsert_rows
+
+
+def get_conflict_fields(target_model, connection):
+    # A partitioned table can only be unique on the primary key together with the partition key
+    conflict_fields = [target_model._meta.pk.name]
+    partition_field = getattr(target_model, 'PARTITION_FIELD', None)
+    if partition_field and is_table_partitioned(connection, target_model._meta.db_table):
+        conflict_fields.append(partition_field)
+    return conflict_fields
+
+
+def get_loader_columns(target_model, connection):
+    fields = target_model._meta.concrete_fields
+    conflict_columns = [target_model._meta.get_field(name).column for name in get_conflict_fields(target_model, connection)]
+    columns = [field.column for field in fields]
+    # created_at is only set when the row is inserted
+    update_columns = [target_model._meta.get_field(name).column for name in target_model.get_upsert_update_fields()]
+    return fields, conflict_columns, columns, update_columns
+
+
+def fill_timestamps(rows, fields):
+    # auto_now / auto_now_add are not applied outside the ORM, so they are filled in here
+    now = timezone.now()
+    timestamp_indexes = [i for i, field in enumerate(fields) if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    if not timestamp_indexes:
+        return rows
+    filled_rows = []
+    for row in rows:
+        row = list(row)
+        for i in timestamp_indexes:
+            row[i] = now
+        filled_rows.append(row)
+    return filled_rows
+
+
+def get_existing_hashes(rows, target_model, pk_index):
+    return dict(target_model.objects.filter(pk__in=[row[pk_index] for row in rows]).values_list('pk', 'content_hash'))
+
+
+def orm_upsert_rows(rows, target_model, pk_index, content_hash_index):
+    # Returns the primary keys of the created rows and of the rows left unchanged
+    existing_hashes = get_existing_hashes(rows, target_model, pk_index)
+    # Rows whose content fingerprint did not change are not written again
+    changed_instances = [target_model(*row) for row in rows if existing_hashes.get(row[pk_index]) != row[content_hash_index]]
+    if changed_instances:
+        target_model.objects.bulk_create(
+            changed_instances,
+            update_conflicts=True,
+            unique_fields=get_conflict_fields(target_model, connections[router.db_for_write(target_model)]),
+            update_fields=target_model.get_upsert_update_fields()
+        )
+    created_pks = {row[pk_index] for row in rows if row[pk_index] not in existing_hashes}
+    unchanged_pks = {row[pk_index] for row in rows if existing_hashes.get(row[pk_index]) == row[content_hash_index]}
+    return created_pks, unchanged_pks
+
+
+def executemany_upsert_rows(rows, target_model, pk_index, content_hash_index):
+    # SQLite: one prepared INSERT ... ON CONFLICT statement executed for the batch of changed rows
+    connection = connections[router.db_for_write(target_model)]
+    fields, conflict_columns, columns, update_columns = get_loader_columns(target_model, connection)
+    qn = connection.ops.quote_name
+    table = qn(target_model._meta.db_table)
+    sql = (
+        f"INSERT INTO {table} ({', '.join(qn(column) for column in columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))}) "
+        f"ON CONFLICT ({', '.join(qn(column) for column in conflict_columns)}) DO UPDATE SET "
+        f"{', '.join(f'{qn(column)} = excluded.{qn(column)}' for column in update_columns)}"
+    )
+
+    existing_hashes = get_existing_hashes(rows, target_model, pk_index)
+    changed_rows = [row for row in rows if existing_hashes.get(row[pk_index]) != row[content_hash_index]]
+    if changed_rows:
+        prep_functions = [field.get_db_prep_save for field in fields]
+        params = [
+            [prep(value, connection) for prep, value in zip(prep_functions, row)]
+            for row in fill_timestamps(changed_rows, fields)
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+
+    created_pks = {row[pk_index] for row in rows if row[pk_index] not in existing_hashes}
+    unchanged_pks = {row[pk_index] for row in rows if existing_hashes.get(row[pk_index]) == row[content_hash_index]}
+    return created_pks, unchanged_pks
+
+
+def copy_upsert_rows(rows, target_model, pk_index, content_hash_index):
+    # PostgreSQL: streams the rows into a temporary staging table with COPY FROM STDIN and merges
+    # them into the target table with a single INSERT ... ON CONFLICT DO UPDATE. Rows whose
+    # content hash did not change are skipped by the conflict clause.
+    connection = connections[router.db_for_write(target_model)]
+    fields, conflict_columns, columns, update_columns = get_loader_columns(target_model, connection)
+    qn = connection.ops.quote_name
+    table = qn(target_model._meta.db_table)
+    staging_table = qn(f'{target_model._meta.db_table}_staging')
+    column_list = ', '.join(qn(column) for column in columns)
+    content_hash_column = qn(fields[content_hash_index].column)
+
+    buffer = rows_to_copy_csv(rows, fields)
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        # The staging table lives for the session and is emptied at every commit
+        cursor.execute(f"CREATE TEMPORARY TABLE IF NOT EXISTS {staging_table} (LIKE {table}) ON COMMIT DELETE ROWS")
+        cursor.execute(f"TRUNCATE {staging_table}")
+        copy_from_stdin(connection, cursor, f"COPY {staging_table} ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')", buffer)
+        cursor.execute(
+            f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {staging_table} "
+            f"ON CONFLICT ({', '.join(qn(column) for column in conflict_columns)}) DO UPDATE SET "
+            f"{', '.join(f'{qn(column)} = EXCLUDED.{qn(column)}' for column in update_columns)} "
+            f"WHERE {table}.{content_hash_column} IS DISTINCT FROM EXCLUDED.{content_hash_column} "
+            f"RETURNING {qn(target_model._meta.pk.column)}, (xmax = 0)"
+        )
+        written = cursor.fetchall()
+
+    created_pks = {pk for pk, inserted in written if inserted}
+    written_pks = {pk for pk, inserted in written}
+    unchanged_pks = {row[pk_index] for row in rows if row[pk_index] not in written_pks}
+    return created_pks, unchanged_pks
+
+
+def copy_from_stdin(connection, cursor, sql, buffer):
+    raw_cursor = cursor.cursor
+    with connection.wrap_database_errors:
+        if hasattr(raw_cursor, 'copy_expert'):
+            # psycopg2
+            raw_cursor.copy_expert(sql, buffer)
+        else:
+            # psycopg 3
+            with raw_cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+def rows_to_copy_csv(rows, fields):
+    # Only datetime and JSON columns need converting, the rest is written as is by the C csv writer
+    now = timezone.now().isoformat()
+    timestamp_indexes = [i for i, field in enumerate(fields) if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    converters = []
+    for i, field in enumerate(fields):
+        field_type = field.get_internal_type()
+        if field_type == 'JSONField':
+            converters.append((i, json.dumps))
+        elif field_type == 'DateTimeField' and i not in timestamp_indexes:
+            converters.append((i, lambda value: value.isoformat()))
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n', quoting=csv.QUOTE_STRINGS)
+    for row in rows:
+        values = list(row)
+        for i, convert in converters:
+            if values[i] is not None:
+                values[i] = convert(values[i])
+        for i in timestamp_indexes:
+            values[i] = now
+        writer.writerow(values)
+    buffer.seek(0)
+    return buffer
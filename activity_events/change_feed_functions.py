@@ -0,0 +1,78 @@
+from django.db import connections, router, transaction
+from django.utils import timezone
+from .models import ActivityEvent, ActivityEventChangeSequence
+from . import app_settings as aps
+
+
+def get_connection():
+    return connections[router.db_for_write(ActivityEvent)]
+
+
+def is_change_feed_enabled(target_model=ActivityEvent):
+    return target_model is ActivityEvent
+
+
+def assign_change_sequence(batch_size=None):
+    # Numbers the events written since the last call (change_seq is reset to NULL by every insert
+    # or real update) after the last number assigned. The counter row is written first, which
+    # serializes the numbering transactions, so a number is never committed after a higher one:
+    # a consumer that has read up to N never misses an event numbered below N later.
+    batch_size = batch_size or aps.ACTIVITY_EVENTS_CHANGE_FEED_BATCH_SIZE
+    connection = get_connection()
+    qn = connection.ops.quote_name
+    table = qn(ActivityEvent._meta.db_table)
+    id_column = qn(ActivityEvent._meta.pk.column)
+    seq_column = qn(ActivityEvent._meta.get_field('change_seq').column)
+    if connection.vendor == 'postgresql':
+        # The numbered ids are passed as arrays, whose size the planner knows: joined to a subquery,
+        # a table without statistics yet (freshly loaded) was scanned once per pending row
+        sql = (
+            f"UPDATE {table} SET {seq_column} = numbered.seq FROM unnest(%s::text[], %s::bigint[]) AS numbered(id, seq) "
+            f"WHERE {table}.{id_column} = numbered.id"
+        )
+    else:
+        sql = (
+            f"UPDATE {table} SET {seq_column} = numbered.seq FROM ("
+            f"SELECT pending.id, %s + ROW_NUMBER() OVER (ORDER BY pending.id) AS seq "
+            f"FROM (SELECT {id_column} AS id FROM {table} WHERE {seq_column} IS NULL ORDER BY {id_column} LIMIT %s) AS pending"
+            f") AS numbered WHERE {table}.{id_column} = numbered.id"
+        )
+
+    n_assigned = 0
+    while True:
+        with transaction.atomic(using=connection.alias):
+            counter = ActivityEventChangeSequence.objects.filter(pk=1)
+            if not counter.update(updated_at=timezone.now()):
+                ActivityEventChangeSequence.objects.get_or_create(pk=1)
+                counter.update(updated_at=timezone.now())
+            last_value = counter.values_list('last_value', flat=True).get()
+            if connection.vendor == 'postgresql':
+                ids = list(ActivityEvent.objects.filter(change_seq__isnull=True).order_by('pk').values_list('pk', flat=True)[:batch_size])
+                params = [ids, list(range(last_value + 1, last_value + len(ids) + 1))]
+            else:
+                params = [last_value, batch_size]
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                n_batch = cursor.rowcount
+            counter.update(last_value=last_value + n_batch)
+        n_assigned += n_batch
+        if n_batch < batch_size:
+            return n_assigned
+
+
+def get_last_change_seq():
+    return ActivityEventChangeSequence.objects.filter(pk=1).values_list('last_value', flat=True).first() or 0
+
+
+def get_changes_queryset(queryset, since, limit=None):
+    # Events of the queryset numbered after since, in sequence order, and the sequence number to
+    # resume from. The feed is bounded by the last number assigned when it is read, so rows
+    # numbered while it streams are left for the next read.
+    last_seq = get_last_change_seq()
+    queryset = queryset.filter(change_seq__gt=since, change_seq__lte=last_seq).order_by('change_seq')
+    if limit:
+        limit_seq = queryset.values_list('change_seq', flat=True)[limit - 1:limit].first()
+        if limit_seq is not None:
+            last_seq = limit_seq
+            queryset = queryset.filter(change_seq__lte=last_seq)
+    return queryset, max(last_seq, since)
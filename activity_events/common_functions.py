@@ -5,6 +5,13 @@ from django.utils.dateparse import parse_datetime
 from django.db.models import Q, CharField
 from django.db.models.functions import Lower
 from django.core.exceptions import ValidationError
+from django.db import transaction, DatabaseError
+from . import app_settings as aps
+from .bulk_load_functions import get_bulk_loader
+from .search_functions import get_search_index_filter, is_search_index_enabled, update_search_index
+from .facet_functions import get_facet_fields, snapshot_facet_values, update_facets, lock_aggregates
+from .rollup_functions import get_rollup_pairs, snapshot_rollup_values, update_rollups
+from .change_feed_functions import is_change_feed_enabled, assign_change_sequence
 
 def apply_filters_to_queryset(request_data, queryset, fields_model, target_model):
 
@@ -51,11 +58,16 @@ def apply_filters_to_queryset(request_data, queryset, fields_model, target_model
     search_fields = list(fields_model.objects.filter(search=True).values_list('fieldname', flat=True))
     search_fields = target_model.get_filtered_fields_dict(search_fields)
     filters = Q()
-        
-    for field_name in search_fields:
-        value = request_data.get('q')
-        if value:
-            filters |= Q(**{f'{field_name}__icontains': value})
+
+    value = request_data.get('q')
+    # Use the search index when it is enabled, icontains otherwise
+    search_filter = get_search_index_filter(target_model, value) if value and search_fields else None
+    if search_filter is not None:
+        filters = search_filter
+    else:
+        for field_name in search_fields:
+            if value:
+                filters |= Q(**{f'{field_name}__icontains': value})
         
     queryset = queryset.filter(filters)
 
@@ -118,29 +130,208 @@ def get_latest_successful_task_time(sync_model=None, celery_model=None, task_nam
         return None
     
 
-def save_records_to_model(data_list, target_model, task_id=None):
+def save_records_to_model(data_list, target_model, task_id=None, batch_size=None):
+    if batch_size is None:
+        batch_size = aps.ACTIVITY_EVENTS_SAVE_BATCH_SIZE
+    if batch_size:
+        return bulk_save_records_to_model(data_list, target_model, task_id, batch_size)
+
     n_created_records = 0
     n_updated_records = 0
+    n_unchanged_records = 0
     failed_records = []
+    changed_pks = []
+    facet_fields = get_facet_fields(target_model)
+    rollup_pairs = get_rollup_pairs(target_model)
+    pks = [item.get('Id') or item.get('id') for item in data_list]
 
-    for item in data_list:
-        try:
-            status = target_model.create_or_update_from_dict(
-                item, task_id=task_id)[1]
+    # One transaction under the shared lock, as in upsert_rows: the counts cannot be rebuilt or
+    # reduced by the retention between the snapshot and the update of the saved records
+    with transaction.atomic():
+        if facet_fields or rollup_pairs:
+            lock_aggregates(shared=True)
+        # Values before the save, to update the facet counts afterwards
+        old_facet_values = snapshot_facet_values(pks, facet_fields)
+        old_rollup_values = snapshot_rollup_values(pks, rollup_pairs)
+
+        for item in data_list:
+            id = item.get('Id') or item.get('id')
+            try:
+                # A record rejected by the database is rolled back to its savepoint, the others are kept
+                with transaction.atomic():
+                    try:
+                        instance, status = target_model.create_or_update_from_dict(
+                            item, task_id=task_id)
+                    except (ValueError, ValidationError) as e:
+                        failed_records.append({
+                            id: str(e)
+                        })
+                        # Records with truncated values are saved despite the error
+                        if id:
+                            changed_pks.append(id)
+                        continue
+            except DatabaseError as e:
+                failed_records.append({
+                    id: str(e)
+                })
+                continue
+            if status != 'unchanged':
+                changed_pks.append(instance.pk)
             if status == 'created':
                 n_created_records += 1
+            elif status == 'unchanged':
+                n_unchanged_records += 1
             else:
                 n_updated_records += 1
-        except (ValueError, ValidationError) as e:
-            id = item.get('Id') or item.get('id')
-            failed_records.append({
-                id: str(e)
-            })
+
+        if changed_pks and is_search_index_enabled(target_model):
+            update_search_index(changed_pks)
+        if changed_pks and facet_fields:
+            update_facets(facet_fields, old_facet_values, snapshot_facet_values(changed_pks, facet_fields))
+        if changed_pks and rollup_pairs:
+            update_rollups(rollup_pairs, old_rollup_values, snapshot_rollup_values(changed_pks, rollup_pairs))
+    # Numbered once committed
+    if changed_pks and is_change_feed_enabled(target_model):
+        assign_change_sequence()
+
+    result = {
+        'n_created_records': n_created_records,
+        'n_updated_records': n_updated_records,
+        'n_unchanged_records': n_unchanged_records,
+        'failed_records': failed_records
+    }
+
+    return result
+
+
+def bulk_save_records_to_model(data_list, target_model, task_id=None, batch_size=1000):
+    n_created_records = 0
+    n_updated_records = 0
+    n_unchanged_records = 0
+    failed_records = []
+
+    for i in range(0, len(data_list), batch_size):
+        chunk = data_list[i:i + batch_size]
+        result = bulk_upsert_chunk(chunk, target_model, task_id)
+        n_created_records += result['n_created_records']
+        n_updated_records += result['n_updated_records']
+        n_unchanged_records += result['n_unchanged_records']
+        failed_records.extend(result['failed_records'])
 
     result = {
         'n_created_records': n_created_records,
         'n_updated_records': n_updated_records,
+        'n_unchanged_records': n_unchanged_records,
+        'failed_records': failed_records
+    }
+
+    return result
+
+
+def bulk_upsert_chunk(chunk, target_model, task_id=None):
+    # Map and validate the whole chunk in memory with the precompiled mapping plan.
+    # Uniqueness is guaranteed by the upsert itself, so no per-record SELECT is needed.
+    plan = target_model.get_mapping_plan()
+    rows, truncations, failed_records = plan.map_page(chunk, task_id)
+
+    try:
+        result = upsert_rows(rows, target_model, truncations)
+    except DatabaseError:
+        # Fall back to saving one by one so a single bad row does not fail the whole chunk
+        return save_records_to_model(chunk, target_model, task_id, batch_size=0)
+
+    result['failed_records'] = failed_records + result['failed_records']
+    return result
+
+
+def save_rows_to_model(rows, target_model, batch_size=None):
+    # Loads already mapped, column-ordered row tuples (see MappingPlan.map_page) in chunks, after
+    # the checks of map_page: too long values are truncated and rows missing a required value skipped
+    if not batch_size:
+        batch_size = aps.ACTIVITY_EVENTS_SAVE_BATCH_SIZE or 1000
+    rows, truncations, failed_records = target_model.get_mapping_plan().check_rows(rows)
+    result = {
+        'n_created_records': 0,
+        'n_updated_records': 0,
+        'n_unchanged_records': 0,
         'failed_records': failed_records
     }
+    for i in range(0, len(rows), batch_size):
+        chunk = rows[i:i + batch_size]
+        try:
+            chunk_results = [upsert_rows(chunk, target_model, truncations)]
+        except DatabaseError:
+            # Fall back to saving one by one so a single bad row does not fail the whole chunk
+            chunk_results = [upsert_row(row, target_model, truncations) for row in chunk]
+        for chunk_result in chunk_results:
+            result['n_created_records'] += chunk_result['n_created_records']
+            result['n_updated_records'] += chunk_result['n_updated_records']
+            result['n_unchanged_records'] += chunk_result['n_unchanged_records']
+            result['failed_records'].extend(chunk_result['failed_records'])
+    return result
+
+
+def upsert_row(row, target_model, truncations):
+    try:
+        return upsert_rows([row], target_model, truncations)
+    except DatabaseError as e:
+        return {'n_created_records': 0, 'n_updated_records': 0, 'n_unchanged_records': 0,
+                'failed_records': [{row[target_model.get_mapping_plan().pk_index]: str(e)}]}
+
 
-    return result
\ No newline at end of file
+def upsert_rows(rows, target_model, truncations=None):
+    truncations = truncations or {}
+    failed_records = []
+    plan = target_model.get_mapping_plan()
+    pk_index = plan.pk_index
+    latest_rows = {}
+    n_occurrences = {}
+
+    for row in rows:
+        pk = row[pk_index]
+        # The last occurrence of a repeated id wins, as if saved one after another
+        latest_rows[pk] = row
+        n_occurrences.setdefault(pk, 0)
+        # Truncated values are still saved but reported as failed, as in create_or_update_from_dict
+        if pk in truncations:
+            failed_records.append({
+                pk: str(ValidationError(truncations[pk]))
+            })
+        else:
+            n_occurrences[pk] += 1
+
+    if not latest_rows:
+        return {'n_created_records': 0, 'n_updated_records': 0, 'n_unchanged_records': 0, 'failed_records': failed_records}
+
+    bulk_loader = get_bulk_loader(target_model)
+    facet_fields = get_facet_fields(target_model)
+    rollup_pairs = get_rollup_pairs(target_model)
+    with transaction.atomic():
+        # Shared with the other ingestion batches, waits for the rebuilds and the retention of the counts
+        if facet_fields or rollup_pairs:
+            lock_aggregates(shared=True)
+        old_facet_values = snapshot_facet_values(latest_rows, facet_fields)
+        old_rollup_values = snapshot_rollup_values(latest_rows, rollup_pairs)
+        created_pks, unchanged_pks = bulk_loader(list(latest_rows.values()), target_model, pk_index, plan.content_hash_index)
+        changed_pks = [pk for pk in latest_rows if pk not in unchanged_pks]
+        if is_search_index_enabled(target_model):
+            update_search_index(changed_pks)
+        # Facet and rollup counts are updated in the same transaction as the events
+        if facet_fields:
+            update_facets(facet_fields, old_facet_values, snapshot_facet_values(changed_pks, facet_fields))
+        if rollup_pairs:
+            update_rollups(rollup_pairs, old_rollup_values, snapshot_rollup_values(changed_pks, rollup_pairs))
+    # Numbered once committed (the loaders reset change_seq of the written rows)
+    if changed_pks and is_change_feed_enabled(target_model):
+        assign_change_sequence()
+
+    n_created_records = sum(1 for pk, n in n_occurrences.items() if n and pk in created_pks)
+    n_unchanged_records = sum(n for pk, n in n_occurrences.items() if pk in unchanged_pks)
+    n_updated_records = sum(n_occurrences.values()) - n_created_records - n_unchanged_records
+
+    return {
+        'n_created_records': n_created_records,
+        'n_updated_records': n_updated_records,
+        'n_unchanged_records': n_unchanged_records,
+        'failed_records': failed_records
+    }
@@ -0,0 +1,281 @@
+from collections import Counter
+from datetime import date
+from zoneinfo import ZoneInfo
+from django.db import connections, router, transaction
+from django.db.models import Q, F, Case, When, Value, Count, Min, Max, Sum, DateField
+from django.db.models.functions import Trunc
+from django.utils import timezone
+from .models import ActivityEvent, ActivityEventField, ActivityEventFacet
+from . import app_settings as aps
+
+UTC = ZoneInfo('UTC')
+
+# Key of the PostgreSQL advisory lock taken on the facet and rollup counts
+AGGREGATES_LOCK_KEY = 7306217011
+
+
+def get_connection():
+    return connections[router.db_for_write(ActivityEventFacet)]
+
+
+def lock_aggregates(shared=False):
+    # Taken in the transactions that write the facet and rollup counts: shared by the ingestion, so
+    # its batches still run concurrently, exclusive for the rebuilds and the retention, which read
+    # the events and must not miss or count twice a batch written meanwhile. Released at commit;
+    # on the other backends writers are serialized by the database itself.
+    connection = get_connection()
+    if connection.vendor != 'postgresql':
+        return
+    function = 'pg_advisory_xact_lock_shared' if shared else 'pg_advisory_xact_lock'
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {function}(%s)", [AGGREGATES_LOCK_KEY])
+
+
+def is_facet_store_enabled(target_model=ActivityEvent):
+    return aps.ACTIVITY_EVENTS_FACETS and target_model is ActivityEvent
+
+
+def get_faceted_fieldnames():
+    # Facets are read by the filter dropdowns of the list and API, and by the charts page
+    return list(ActivityEventField.objects.filter(Q(filter=True) | Q(chart=True)).values_list('fieldname', flat=True))
+
+
+def get_facet_fields(target_model=ActivityEvent):
+    # Fields whose facets have been built, {fieldname: field type}; only those are maintained
+    if not is_facet_store_enabled(target_model):
+        return {}
+    fieldnames = ActivityEventFacet.objects.filter(kind=ActivityEventFacet.RANGE, month__isnull=True).values_list('fieldname', flat=True)
+    return ActivityEvent.get_filtered_fields_dict(sorted(fieldnames))
+
+
+def to_facet_value(value):
+    return '' if value is None else str(value)
+
+
+def to_partition_month(value):
+    # First day of the creationtime month of an event, the range of its partition (cut in UTC)
+    value = value.astimezone(UTC)
+    return date(value.year, value.month, 1)
+
+
+def partition_month_expression():
+    return Trunc(ActivityEvent.PARTITION_FIELD, 'month', output_field=DateField(), tzinfo=UTC)
+
+
+def build_field_facets(fieldname, field_type, queryset=None):
+    # Computes the facets of a field from the events table, returns unsaved ActivityEventFacet objects
+    queryset = ActivityEvent.objects.all() if queryset is None else queryset
+    queryset = queryset.order_by().annotate(facet_month=partition_month_expression())
+    if field_type == 'DateTimeField':
+        months = list(queryset.values_list('facet_month').annotate(count=Count('pk'), min_value=Min(fieldname), max_value=Max(fieldname)))
+        facets = [ActivityEventFacet(fieldname=fieldname, kind=ActivityEventFacet.RANGE, month=month, count=count)
+                  for month, count, min_value, max_value in sorted(months)]
+        min_values = [min_value for month, count, min_value, max_value in months if min_value is not None]
+        max_values = [max_value for month, count, min_value, max_value in months if max_value is not None]
+        facets.append(ActivityEventFacet(fieldname=fieldname, kind=ActivityEventFacet.RANGE, count=sum(facet.count for facet in facets),
+                                         min_value=min(min_values, default=None), max_value=max(max_values, default=None)))
+        return facets
+
+    value_counts = Counter()
+    month_counts = Counter()
+    for value, month, count in queryset.values_list(fieldname, 'facet_month').annotate(count=Count('pk')):
+        value_counts[(to_facet_value(value), month)] += count
+        month_counts[month] += count
+    facets = [ActivityEventFacet(fieldname=fieldname, kind=ActivityEventFacet.VALUE, value=value, month=month, count=count)
+              for (value, month), count in sorted(value_counts.items())]
+    facets += [ActivityEventFacet(fieldname=fieldname, kind=ActivityEventFacet.RANGE, month=month, count=count)
+               for month, count in sorted(month_counts.items())]
+    facets.append(ActivityEventFacet(fieldname=fieldname, kind=ActivityEventFacet.RANGE, count=sum(month_counts.values())))
+    return facets
+
+
+def rebuild_facets(fieldnames=None):
+    # Recomputes the facets of the given fields, by default of every field flagged for filter or
+    # chart, in which case the facets of fields no longer flagged are removed
+    remove_others = fieldnames is None
+    if fieldnames is None:
+        fieldnames = get_faceted_fieldnames()
+    fields = ActivityEvent.get_filtered_fields_dict(list(fieldnames))
+    n_values = 0
+
+    with transaction.atomic(using=get_connection().alias):
+        lock_aggregates()
+        for fieldname, field_type in fields.items():
+            facets = build_field_facets(fieldname, field_type)
+            ActivityEventFacet.objects.filter(fieldname=fieldname).delete()
+            ActivityEventFacet.objects.bulk_create(facets)
+            n_values += len({facet.value for facet in facets if facet.kind == ActivityEventFacet.VALUE})
+        if remove_others:
+            ActivityEventFacet.objects.exclude(fieldname__in=list(fields)).delete()
+
+    return {'facet_fields': list(fields), 'n_values': n_values}
+
+
+def snapshot_facet_values(pks, facet_fields):
+    # Current values of the facet fields of the given events followed by their creationtime, {pk: values}
+    if not pks or not facet_fields:
+        return {}
+    rows = ActivityEvent.objects.filter(pk__in=list(pks)).order_by().values_list('pk', *facet_fields, ActivityEvent.PARTITION_FIELD)
+    return {row[0]: row[1:] for row in rows}
+
+
+def update_facets(facet_fields, old_values, new_values):
+    # Applies the changes between two snapshots of the written events (missing from old_values when created)
+    value_deltas = Counter()
+    month_deltas = Counter()
+    range_deltas = {fieldname: [0, None, None] for fieldname in facet_fields}
+    field_items = list(enumerate(facet_fields.items()))
+
+    for pk, new in new_values.items():
+        old = old_values.get(pk)
+        if old == new:
+            continue
+        old_month = None if old is None else to_partition_month(old[-1])
+        new_month = to_partition_month(new[-1])
+        for i, (fieldname, field_type) in field_items:
+            if old is None:
+                range_deltas[fieldname][0] += 1
+            if old_month != new_month:
+                if old is not None:
+                    month_deltas[(fieldname, old_month)] -= 1
+                month_deltas[(fieldname, new_month)] += 1
+            if field_type == 'DateTimeField':
+                # Ranges only widen here, they are narrowed again by the retention
+                value = new[i]
+                if value is not None:
+                    range_delta = range_deltas[fieldname]
+                    range_delta[1] = value if range_delta[1] is None else min(range_delta[1], value)
+                    range_delta[2] = value if range_delta[2] is None else max(range_delta[2], value)
+            elif old is None or old[i] != new[i] or old_month != new_month:
+                if old is not None:
+                    value_deltas[(fieldname, to_facet_value(old[i]), old_month)] -= 1
+                value_deltas[(fieldname, to_facet_value(new[i]), new_month)] += 1
+
+    apply_facet_deltas(value_deltas, month_deltas, range_deltas)
+
+
+def apply_facet_deltas(value_deltas, month_deltas, range_deltas):
+    # Increments the stored counts in a single statement per row, so concurrent ingestion
+    # workers never overwrite each other's counts
+    connection = get_connection()
+    qn = connection.ops.quote_name
+    table = qn(ActivityEventFacet._meta.db_table)
+    adapt_month = connection.ops.adapt_datefield_value
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+
+    params = [(fieldname, ActivityEventFacet.VALUE, value, adapt_month(month), delta, now)
+              for (fieldname, value, month), delta in value_deltas.items() if delta]
+    params += [(fieldname, ActivityEventFacet.RANGE, '', adapt_month(month), delta, now)
+               for (fieldname, month), delta in month_deltas.items() if delta]
+    range_deltas = sorted((fieldname, range_delta) for fieldname, range_delta in range_deltas.items()
+                          if range_delta[0] or range_delta[1] is not None)
+    if not params and not range_deltas:
+        return
+    # Rows are always locked in the same order, so that concurrent batches cannot deadlock
+    params.sort(key=lambda row: row[:4])
+
+    sql = (
+        f"INSERT INTO {table} (fieldname, kind, value, month, count, updated_at) VALUES (%s, %s, %s, %s, %s, %s) "
+        f"ON CONFLICT (fieldname, kind, value, month) DO UPDATE SET count = {table}.count + EXCLUDED.count, "
+        f"updated_at = EXCLUDED.updated_at"
+    )
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        if params:
+            cursor.executemany(sql, params)
+            # Values and months without any event left
+            ActivityEventFacet.objects.filter(month__isnull=False, count__lte=0,
+                                              fieldname__in={row[0] for row in params}).delete()
+        for fieldname, (delta, min_value, max_value) in range_deltas:
+            # The range row of the field, without month, holds the total and the min and max
+            update = {'count': F('count') + delta, 'updated_at': timezone.now()}
+            if min_value is not None:
+                update['min_value'] = Case(When(Q(min_value__isnull=True) | Q(min_value__gt=min_value), then=Value(min_value)), default=F('min_value'))
+                update['max_value'] = Case(When(Q(max_value__isnull=True) | Q(max_value__lt=max_value), then=Value(max_value)), default=F('max_value'))
+            ActivityEventFacet.objects.filter(fieldname=fieldname, kind=ActivityEventFacet.RANGE, month__isnull=True).update(**update)
+
+
+def subtract_from_facets(queryset):
+    # Called by the retention, in the transaction deleting the events of queryset, after lock_aggregates()
+    facet_fields = get_facet_fields()
+    if not facet_fields:
+        return
+    queryset = queryset.order_by().annotate(facet_month=partition_month_expression())
+    month_counts = list(queryset.values_list('facet_month').annotate(count=Count('pk')))
+    if not month_counts:
+        return
+    n_old = sum(count for month, count in month_counts)
+    value_deltas = Counter()
+    month_deltas = Counter({(fieldname, month): -count for fieldname in facet_fields for month, count in month_counts})
+    range_deltas = {fieldname: [-n_old, None, None] for fieldname in facet_fields}
+    for fieldname, field_type in facet_fields.items():
+        if field_type == 'DateTimeField':
+            continue
+        for value, month, count in queryset.values_list(fieldname, 'facet_month').annotate(count=Count('pk')):
+            value_deltas[(fieldname, to_facet_value(value), month)] -= count
+    apply_facet_deltas(value_deltas, month_deltas, range_deltas)
+
+
+def subtract_month_from_facets(month):
+    # Called by the retention before the partition of month is dropped, after lock_aggregates():
+    # the counts kept for the month are subtracted from the totals, without reading its events
+    month_counts = ActivityEventFacet.objects.filter(kind=ActivityEventFacet.RANGE, month=month).order_by('fieldname').values_list('fieldname', 'count')
+    for fieldname, count in list(month_counts):
+        ActivityEventFacet.objects.filter(fieldname=fieldname, kind=ActivityEventFacet.RANGE, month__isnull=True).update(
+            count=F('count') - count, updated_at=timezone.now())
+    ActivityEventFacet.objects.filter(month=month).delete()
+
+
+def refresh_facet_ranges():
+    # Called by the retention once the old events are deleted: the min and max of the datetime
+    # fields are recomputed (served by their indexes when the fields are flagged for filtering)
+    with transaction.atomic(using=get_connection().alias):
+        lock_aggregates()
+        for fieldname, field_type in get_facet_fields().items():
+            if field_type != 'DateTimeField':
+                continue
+            aggregates = ActivityEvent.objects.aggregate(min_value=Min(fieldname), max_value=Max(fieldname))
+            ActivityEventFacet.objects.filter(fieldname=fieldname, kind=ActivityEventFacet.RANGE, month__isnull=True).update(updated_at=timezone.now(), **aggregates)
+
+
+def read_facets(fieldnames):
+    # (fieldname, kind, value, count, min_value, max_value) rows of the stored facets, the counts
+    # of the values summed over the months
+    facets = ActivityEventFacet.objects.filter(fieldname__in=fieldnames).exclude(kind=ActivityEventFacet.RANGE, month__isnull=False)
+    return list(facets.values_list('fieldname', 'kind', 'value').annotate(
+        count=Sum('count'), min_value=Min('min_value'), max_value=Max('max_value')).order_by('fieldname', 'kind', 'value'))
+
+
+def sum_facet_months(facets):
+    # Same rows as read_facets from unsaved ActivityEventFacet objects
+    rows = {}
+    for facet in facets:
+        if facet.kind == ActivityEventFacet.RANGE and facet.month is not None:
+            continue
+        key = (facet.fieldname, facet.kind, facet.value)
+        count = rows[key][0] + facet.count if key in rows else facet.count
+        rows[key] = (count, facet.min_value, facet.max_value)
+    return [(*key, *values) for key, values in sorted(rows.items())]
+
+
+def get_facets(fieldnames):
+    # Returns {fieldname: {'count', 'min_value', 'max_value', 'values': [(value, count), ...]}} read in
+    # a single query. Fields requested for the first time are built beforehand.
+    fields = ActivityEvent.get_filtered_fields_dict(list(fieldnames))
+
+    if is_facet_store_enabled():
+        facets = read_facets(list(fields))
+        built = {facet[0] for facet in facets if facet[1] == ActivityEventFacet.RANGE}
+        missing = [fieldname for fieldname in fields if fieldname not in built]
+        if missing:
+            rebuild_facets(missing)
+            facets = read_facets(list(fields))
+    else:
+        facets = sum_facet_months(facet for fieldname, field_type in fields.items() for facet in build_field_facets(fieldname, field_type))
+
+    result = {fieldname: {'count': 0, 'min_value': None, 'max_value': None, 'values': []} for fieldname in fields}
+    for fieldname, kind, value, count, min_value, max_value in facets:
+        if kind == ActivityEventFacet.RANGE:
+            result[fieldname].update(count=count, min_value=min_value, max_value=max_value)
+        else:
+            result[fieldname]['values'].append((value, count))
+    return result
@@ -0,0 +1,170 @@
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from zoneinfo import ZoneInfo
+from .generate_fake_data_functions import generate_fake_data_list
+
+ACTIVITY_EVENTS_PATH = '/v1.0/myorg/admin/activityevents'
+
+
+class FakeActivityEventsAPI:
+    # Local stand-in for the Power BI activity events API and the Azure AD token endpoint.
+    # It follows the same paging protocol (startDateTime/endDateTime, continuationUri,
+    # lastResultSet) and serves events built by generate_fake_data_functions.
+
+    def __init__(self, events_per_day=2000, n_users=30, page_size=1000, latency_ms=0, throttle_rate=0.0,
+                 retry_after=1, error_rate=0.0, seed=None):
+        self.events_per_day = events_per_day
+        self.n_users = n_users
+        self.page_size = page_size
+        self.latency_ms = latency_ms
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.continuations = {}
+        self.lock = threading.Lock()
+        self.generation_lock = threading.Lock()
+        self.stats = {'n_token_requests': 0, 'n_page_requests': 0, 'n_events': 0, 'n_throttled': 0, 'n_errors': 0}
+
+    def create_server(self, host='127.0.0.1', port=8020):
+        api = self
+
+        class Handler(FakeActivityEventsAPIHandler):
+            fake_api = api
+
+        return ThreadingHTTPServer((host, port), Handler)
+
+    def count(self, key, value=1):
+        with self.lock:
+            self.stats[key] += value
+
+    def inject_failure(self):
+        # Returns the status code of an injected failure, or None to serve the request normally
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        with self.lock:
+            draw = self.random.random()
+        if draw < self.throttle_rate:
+            self.count('n_throttled')
+            return 429
+        if draw < self.throttle_rate + self.error_rate:
+            self.count('n_errors')
+            return 500
+        return None
+
+    def start_window(self, start_datetime, end_datetime):
+        window_seconds = (end_datetime - start_datetime).total_seconds()
+        n_events = max(0, round(self.events_per_day * window_seconds / 86400))
+        events = []
+        if n_events:
+            # Faker and the random module are shared by every request thread
+            with self.generation_lock:
+                events = generate_fake_data_list(n_events, self.n_users, start_datetime, end_datetime)
+        return self.next_page(events, 0)
+
+    def continue_window(self, token):
+        with self.lock:
+            state = self.continuations.pop(token, None)
+        if state is None:
+            return None
+        return self.next_page(*state)
+
+    def next_page(self, events, offset):
+        page = events[offset:offset + self.page_size]
+        offset += len(page)
+        token = None
+        if offset < len(events):
+            token = uuid.uuid4().hex
+            with self.lock:
+                self.continuations[token] = (events, offset)
+        self.count('n_events', len(page))
+        return page, token
+
+
+class FakeActivityEventsAPIHandler(BaseHTTPRequestHandler):
+    fake_api = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_failure(self, status):
+        if status == 429:
+            self.send_json(429, {'error': {'code': 'TooManyRequests'}}, {'Retry-After': str(self.fake_api.retry_after)})
+        else:
+            self.send_json(status, {'error': {'code': 'InternalServerError'}})
+
+    def do_POST(self):
+        # Azure AD client credentials token endpoint: /{tenant_id}/oauth2/v2.0/token
+        if not urlparse(self.path).path.endswith('/oauth2/v2.0/token'):
+            self.send_json(404, {'error': 'not_found'})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        self.fake_api.count('n_token_requests')
+        self.send_json(200, {'token_type': 'Bearer', 'expires_in': 3599, 'access_token': f'fake-{uuid.uuid4().hex}'})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != ACTIVITY_EVENTS_PATH:
+            self.send_json(404, {'error': 'not_found'})
+            return
+        if not self.headers.get('Authorization', '').startswith('Bearer '):
+            self.send_json(401, {'error': {'code': 'Unauthorized'}})
+            return
+
+        self.fake_api.count('n_page_requests')
+        failure = self.fake_api.inject_failure()
+        if failure:
+            self.send_failure(failure)
+            return
+
+        params = parse_qs(url.query)
+        if 'continuationToken' in params:
+            result = self.fake_api.continue_window(params['continuationToken'][0])
+            if result is None:
+                self.send_json(400, {'error': {'code': 'InvalidContinuationToken'}})
+                return
+        else:
+            try:
+                start_datetime = parse_api_datetime(params['startDateTime'][0])
+                end_datetime = parse_api_datetime(params['endDateTime'][0])
+            except (KeyError, ValueError):
+                self.send_json(400, {'error': {'code': 'BadRequest', 'message': 'startDateTime and endDateTime are required'}})
+                return
+            # Like the real API, a request must stay within a single UTC day
+            if start_datetime.date() != end_datetime.date() or start_datetime > end_datetime:
+                self.send_json(400, {'error': {'code': 'BadRequest', 'message': 'startDateTime and endDateTime must be in the same UTC day'}})
+                return
+            result = self.fake_api.start_window(start_datetime, end_datetime)
+
+        page, token = result
+        host = self.headers.get('Host')
+        continuation_uri = f"http://{host}{ACTIVITY_EVENTS_PATH}?continuationToken={token}" if token else None
+        self.send_json(200, {
+            'activityEventEntities': page,
+            'continuationUri': continuation_uri,
+            'continuationToken': token,
+            'lastResultSet': token is None
+        })
+
+
+def parse_api_datetime(value):
+    # Parameters are sent quoted, e.g. '2024-09-01T00:00:00.000Z'
+    value = value.strip("'").replace('Z', '')
+    return datetime.fromisoformat(value).replace(tzinfo=ZoneInfo('UTC'))
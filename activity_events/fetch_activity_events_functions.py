@@ -1,16 +1,27 @@
-import requests
 from api_credentials.util import get_access_token
-from datetime import timedelta
+from api_credentials.http_client import get_http_session, get_http_timeout
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 from django_celery_results.models import TaskResult
 from django.utils import timezone
+from django.db.models import Max, Min
 from requests.exceptions import RequestException
-from .models import ActivityEvent, SyncTask
+from .models import ActivityEvent, SyncTask, SyncCheckpoint
 from .common_functions import get_latest_successful_task_time, save_records_to_model
+from .archive_functions import archive_activity_events_page
+from .request_scheduler import get_rate_limiter, is_retryable_response, get_retry_after, get_backoff_delay
+from .partition_functions import is_activity_events_partitioned, create_future_partitions, drop_expired_partitions, get_estimated_activity_events_count
+from .purge_functions import purge_activity_events, archive_old_activity_events
+from .search_functions import is_search_index_enabled, remove_old_from_search_index
+from .facet_functions import refresh_facet_ranges
 from . import app_settings as aps
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connections
+import time
 import uuid
 
 
-def process_activity_events(n_days_before=None, task_id=None, task_name=None, sync_task=False):
+def process_activity_events(n_days_before=None, task_id=None, task_name=None, sync_task=False, resume=False):
 
     max_past_days=aps.ACTIVITY_EVENTS_FETCH_MAX_PAST_DAYS
     buffer_hours = aps.ACTIVITY_EVENTS_FETCH_BUFFER_HOURS
@@ -30,8 +41,12 @@ def process_activity_events(n_days_before=None, task_id=None, task_name=None, sy
         'celery_timestamp_field': 'date_created'}    
 
     if n_days_before is None:        
+        watermark_start = get_watermark_start_datetime() if aps.ACTIVITY_EVENTS_FETCH_USE_WATERMARK else None
         last_successful_time = get_latest_successful_task_time(**args_dict)
-        if last_successful_time is None:
+        if watermark_start is not None:
+            # Incremental fetch from the newest event already committed
+            start_datetime = max(watermark_start, end_datetime - timedelta(days=max_past_days))
+        elif last_successful_time is None:
             start_datetime = end_datetime - timedelta(days=max_past_days)
         else:            
             start_datetime = max(last_successful_time - timedelta(hours=buffer_hours), end_datetime - timedelta(days=max_past_days))
@@ -40,19 +55,22 @@ def process_activity_events(n_days_before=None, task_id=None, task_name=None, sy
         start_datetime = end_datetime - timedelta(days=n_days_before)
 
     result = process_ativity_events_between_datetimes(
-        start_datetime, end_datetime, task_id)
+        start_datetime, end_datetime, task_id, resume)
     
     result['start_datetime'] = start_datetime
     result['end_datetime'] = end_datetime
 
     created = 0
     updated = 0
+    unchanged = 0
     for item in result.get('details', []):
         created += item.get('n_created_records', 0)
         updated += item.get('n_updated_records', 0)
+        unchanged += item.get('n_unchanged_records', 0)
 
     result['n_created_records'] = created
     result['n_updated_records'] = updated
+    result['n_unchanged_records'] = unchanged
 
     if sync_task:
         status = 'success' if not result.get('has_failed_requests') and not result.get('has_failed_records') else 'failure'        
@@ -67,27 +85,26 @@ def process_activity_events(n_days_before=None, task_id=None, task_name=None, sy
     return result
 
 
-def process_ativity_events_between_datetimes(start_datetime, end_datetime, task_id):
+def process_ativity_events_between_datetimes(start_datetime, end_datetime, task_id, resume=False):
    datetime_pairs = generate_datetime_pairs(start_datetime, end_datetime)
-   result = process_ativity_events_from_dates_list(datetime_pairs, task_id)
+   result = process_ativity_events_from_dates_list(datetime_pairs, task_id, resume=resume)
    return result
 
    
-def process_ativity_events_from_dates_list(dates_list, task_id):
-    details = []
-
-    has_failed_records = False
-    has_failed_requests = False
-
-    for start, end in dates_list:
-        result = get_json_and_save_activity_events(start, end, task_id)
-        result['start_datetime'] = start
-        result['end_datetime'] = end
-        if result.get('failed_records'):
-            has_failed_records = True
-        if result.get('failed_requests'):
-            has_failed_records = True
-        details.append(result)
+def process_ativity_events_from_dates_list(dates_list, task_id, max_workers=None, resume=False):
+    if max_workers is None:
+        max_workers = aps.ACTIVITY_EVENTS_FETCH_MAX_WORKERS
+    max_workers = max(1, min(max_workers, len(dates_list)))
+
+    if max_workers == 1:
+        details = [process_activity_events_window(start, end, task_id, resume) for start, end in dates_list]
+    else:
+        # Day windows are independent, so fetch and save them concurrently
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            details = list(executor.map(lambda pair: process_activity_events_window_in_thread(*pair, task_id, resume), dates_list))
+
+    has_failed_records = any(item.get('failed_records') for item in details)
+    has_failed_requests = any(item.get('failed_requests') for item in details)
 
     result = {'has_failed_requests': has_failed_requests,
               'has_failed_records': has_failed_records,
@@ -96,6 +113,21 @@ def process_ativity_events_from_dates_list(dates_list, task_id):
     return result
 
 
+def process_activity_events_window(start, end, task_id, resume=False):
+    result = get_json_and_save_activity_events(start, end, task_id, resume)
+    result['start_datetime'] = start
+    result['end_datetime'] = end
+    return result
+
+
+def process_activity_events_window_in_thread(start, end, task_id, resume=False):
+    try:
+        return process_activity_events_window(start, end, task_id, resume)
+    finally:
+        # Each worker thread opens its own database connection
+        connections.close_all()
+
+
 def generate_datetime_pairs(start_datetime, end_datetime):
     # Generates date-time pairs for processing, where each pair represents a start and end datetime
     # Returns: List of tuples: Each tuple contains a start datetime and an end datetime for each day.
@@ -124,42 +156,205 @@ def generate_datetime_pairs(start_datetime, end_datetime):
 
 
 def get_json_from_activity_events_api(start_datetime, end_datetime):
-    api_url = 'https://api.powerbi.com/v1.0/myorg/admin/activityevents'
     all_json_data = []
-    token = get_access_token()
     failed_requests = []
-    is_cont_uri = False
+
+    for page, _ in iter_activity_events_pages(start_datetime, end_datetime, failed_requests):
+        all_json_data.extend(page)
+
+    return all_json_data, failed_requests
+
+
+def iter_activity_events_pages(start_datetime, end_datetime, failed_requests, continuation_uri=None):
+    # Yields the activityEventEntities of each page together with the continuationUri of the
+    # next one (None after the last page) as soon as it arrives, so callers can persist it
+    # before the next page is requested. Failed requests are appended to the failed_requests
+    # list provided by the caller. A continuation_uri resumes a previously interrupted window.
+    api_url = continuation_uri or f'{aps.ACTIVITY_EVENTS_API_BASE_URL}/v1.0/myorg/admin/activityevents'
+    is_cont_uri = bool(continuation_uri)
 
     while True:
         try:
-            data = fetch_activity_events(
-                start_datetime, end_datetime, token, api_url, is_cont_uri)
-            all_json_data.extend(data.get('activityEventEntities', []))
+            data = fetch_activity_events_with_retries(
+                start_datetime, end_datetime, api_url, is_cont_uri)
+        except RequestException as e:
+            # The retry budget is spent; the remaining pages cannot be reached without this one.
+            # Token and programming errors are not request failures and are raised to the caller.
+            failed_requests.append({'url': api_url, 'error': str(e)})
+            break
 
-            last_result_set = data.get('lastResultSet')
-            if last_result_set:
-                break
+        last_result_set = data.get('lastResultSet')
+        next_api_url = None if last_result_set else data.get('continuationUri')
 
-            api_url = data.get('continuationUri')
-            if not api_url:
-                break
+        yield data.get('activityEventEntities', []), next_api_url
 
-            is_cont_uri = True
-        except (Exception, RequestException) as e:
-            failed_requests.append({'url': api_url, 'error': str(e)})
+        if not next_api_url:
+            break
+
+        api_url = next_api_url
+        is_cont_uri = True
 
-    return all_json_data, failed_requests
 
+def get_json_and_save_activity_events(start_datetime, end_datetime, task_id, resume=False):
+    failed_requests = []
+    save_result = {
+        'n_created_records': 0,
+        'n_updated_records': 0,
+        'n_unchanged_records': 0,
+        'failed_records': []
+    }
 
-def get_json_and_save_activity_events(start_datetime, end_datetime, task_id):
-    data_list, failed_requests = get_json_from_activity_events_api(start_datetime, end_datetime)
-    save_result = save_records_to_model(data_list, ActivityEvent, task_id)
+    checkpoint = get_sync_checkpoint(start_datetime, end_datetime)
+    # The checkpoint of the day can be resumed when its bounds start no later than this window
+    resumable = resume and checkpoint.window_start <= start_datetime
+    completed_end = None
+
+    if resumable and checkpoint.status == 'success':
+        if checkpoint.window_end >= end_datetime:
+            # The whole window was already persisted by a previous run
+            save_result['failed_requests'] = failed_requests
+            save_result['resumed_from_page'] = checkpoint.n_pages
+            return save_result
+        completed_end = checkpoint.window_end
+    elif resumable and checkpoint.continuation_uri:
+        # The continuationUri belongs to the bounds of the interrupted run, which are completed first
+        save_result['resumed_from_page'] = checkpoint.n_pages
+        n_pages = save_sync_checkpoint_pages(checkpoint, checkpoint.window_start, checkpoint.window_end, task_id,
+                                             save_result, failed_requests, checkpoint.continuation_uri)
+        if failed_requests and not n_pages:
+            # The saved continuationUri may have expired, so fetch the whole window again
+            return get_json_and_save_activity_events(start_datetime, end_datetime, task_id, resume=False)
+        if not failed_requests:
+            completed_end = checkpoint.window_end
+
+    if not failed_requests:
+        if completed_end is None:
+            checkpoint.window_start = start_datetime
+            checkpoint.window_end = end_datetime
+            checkpoint.n_pages = 0
+            checkpoint.n_records = 0
+            save_sync_checkpoint_pages(checkpoint, start_datetime, end_datetime, task_id, save_result, failed_requests)
+        elif completed_end < end_datetime:
+            # Only the part of the day after the bounds already completed is fetched
+            checkpoint.window_end = end_datetime
+            save_sync_checkpoint_pages(checkpoint, completed_end, end_datetime, task_id, save_result, failed_requests)
+
+    checkpoint.status = 'failure' if failed_requests else 'success'
+    checkpoint.save(update_fields=['status', 'updated_at'])
 
     save_result['failed_requests'] = failed_requests
 
     return save_result
 
 
+def save_sync_checkpoint_pages(checkpoint, start_datetime, end_datetime, task_id, save_result, failed_requests, continuation_uri=None):
+    # Fetches the pages of the window, from continuation_uri when given, and persists each page
+    # before fetching the next one to keep memory bounded by page size. Returns the number of pages saved.
+    checkpoint.status = 'pending'
+    checkpoint.continuation_uri = continuation_uri or ''
+    checkpoint.task_id = task_id or ''
+    checkpoint.save()
+
+    n_pages = 0
+    for page, next_api_url in iter_activity_events_pages(start_datetime, end_datetime, failed_requests, continuation_uri):
+        if aps.ACTIVITY_EVENTS_ARCHIVE_PAGES:
+            # Keep the raw page so it can be replayed later without calling the API
+            archive_activity_events_page(page, start_datetime, task_id)
+        page_result = save_records_to_model(page, ActivityEvent, task_id)
+        save_result['n_created_records'] += page_result['n_created_records']
+        save_result['n_updated_records'] += page_result['n_updated_records']
+        save_result['n_unchanged_records'] += page_result['n_unchanged_records']
+        save_result['failed_records'].extend(page_result['failed_records'])
+        n_pages += 1
+        update_sync_checkpoint(checkpoint, next_api_url, len(page), get_max_creationtime(page))
+    return n_pages
+
+
+def get_sync_checkpoint(start_datetime, end_datetime):
+    # One checkpoint per calendar day: the window bounds of its last run are kept in the row
+    checkpoint, _ = SyncCheckpoint.objects.get_or_create(
+        taskname=aps.ACTIVITY_EVENTS_FETCH_TASK_NAME,
+        day=start_datetime.date(),
+        defaults={'window_start': start_datetime, 'window_end': end_datetime}
+    )
+    return checkpoint
+
+
+def update_sync_checkpoint(checkpoint, continuation_uri, n_records, max_creationtime=None):
+    # Called after each page is persisted, so continuation_uri always points to the first page not yet saved
+    checkpoint.continuation_uri = continuation_uri or ''
+    checkpoint.n_pages += 1
+    checkpoint.n_records += n_records
+    if max_creationtime and (checkpoint.watermark is None or max_creationtime > checkpoint.watermark):
+        checkpoint.watermark = max_creationtime
+    checkpoint.save(update_fields=['continuation_uri', 'n_pages', 'n_records', 'watermark', 'updated_at'])
+
+
+def get_max_creationtime(data_list):
+    max_creationtime = None
+    for item in data_list:
+        value = item.get('CreationTime') or item.get('creationtime')
+        try:
+            creationtime = datetime.fromisoformat(value).replace(tzinfo=ZoneInfo('UTC'))
+        except (TypeError, ValueError):
+            continue
+        if max_creationtime is None or creationtime > max_creationtime:
+            max_creationtime = creationtime
+    return max_creationtime
+
+
+def get_watermark_start_datetime():
+    # Start of an incremental fetch: the newest event time committed by a successful window,
+    # minus the lateness allowance. Windows that failed and were not fetched again since
+    # hold the start back so that their missing pages are retrieved.
+    checkpoints = SyncCheckpoint.objects.filter(taskname=aps.ACTIVITY_EVENTS_FETCH_TASK_NAME)
+    watermark = checkpoints.filter(status='success').aggregate(Max('watermark'))['watermark__max']
+    if watermark is None:
+        return None
+
+    start_datetime = watermark - timedelta(minutes=aps.ACTIVITY_EVENTS_FETCH_LATENESS_MINUTES)
+
+    # A day is fetched again in a later run under the same checkpoint, which is then successful
+    since = timezone.now() - timedelta(days=aps.ACTIVITY_EVENTS_FETCH_MAX_PAST_DAYS)
+    unfinished_start = checkpoints.exclude(status='success').filter(window_end__gte=since).aggregate(Min('window_start'))['window_start__min']
+    if unfinished_start is not None:
+        start_datetime = min(start_datetime, unfinished_start)
+
+    return start_datetime
+
+
+def fetch_activity_events_with_retries(start_datetime, end_datetime, api_url, is_cont_uri):
+    rate_limiter = get_rate_limiter()
+    max_retries = aps.ACTIVITY_EVENTS_API_MAX_RETRIES
+    attempt = 0
+    refresh_token = False
+
+    while True:
+        rate_limiter.acquire()
+        # The token is read from the cache for every request, so that it is renewed when it expires
+        # during rate limit waits and backoff delays
+        token = get_access_token(use_cache=not refresh_token)
+        try:
+            return fetch_activity_events(
+                start_datetime, end_datetime, token, api_url, is_cont_uri)
+        except RequestException as e:
+            response = e.response
+            if response is not None and response.status_code == 401 and not refresh_token:
+                # The cached token was revoked or expired early: request a new one once
+                refresh_token = True
+                continue
+            if attempt >= max_retries or not is_retryable_response(response):
+                raise e
+            delay = get_retry_after(response)
+            if delay is None:
+                delay = get_backoff_delay(attempt)
+            if response is not None and response.status_code == 429:
+                # Throttled: hold back every window sharing the rate limiter
+                rate_limiter.pause(delay)
+            attempt += 1
+            time.sleep(delay)
+
+
 def fetch_activity_events(start_datetime, end_datetime, token, api_url, is_cont_uri):
 
     # Construct headers with the token
@@ -182,7 +377,7 @@ def fetch_activity_events(start_datetime, end_datetime, token, api_url, is_cont_
 
     try:
         # Make the API request
-        response = requests.get(api_url, headers=headers, params=params)
+        response = get_http_session().get(api_url, headers=headers, params=params, timeout=get_http_timeout())
         response.raise_for_status()  # Raise exception for bad status codes
 
         # Extract JSON data from response
@@ -194,19 +389,48 @@ def fetch_activity_events(start_datetime, end_datetime, token, api_url, is_cont_
         raise e
     
 
-def remove_old_activity_events(retention_days):
+def remove_old_activity_events(retention_days, progress_callback=None):
+    # Calculate the cutoff time
+    cutoff_time = timezone.now() - timedelta(days=retention_days)
+    if is_activity_events_partitioned():
+        return remove_old_partitioned_activity_events(cutoff_time, progress_callback)
     # Count records before deletion
     count_before = ActivityEvent.objects.count()
-    # Get the current time
-    now = timezone.now()
-    # Calculate the cutoff time
-    cutoff_time = now - timedelta(days=retention_days)
-    # Query the ActivityEvent model to get records older than the cutoff time
-    old_records = ActivityEvent.objects.filter(creationtime__lt=cutoff_time)
-    # Count the number of records to be deleted
-    count_deleted = old_records.count()
-    # Delete the old records
-    old_records.delete()
-    count_remaining = ActivityEvent.objects.count()
+    # Delete the old records in chunks, archiving them first when enabled; their facet and rollup
+    # counts are subtracted in the transaction of each chunk
+    result = purge_activity_events(cutoff_time, progress_callback=progress_callback)
+    if is_search_index_enabled():
+        remove_old_from_search_index(cutoff_time)
+    refresh_facet_ranges()
+    n_checkpoints_deleted = remove_old_sync_checkpoints(cutoff_time)
+    count_deleted = result['n_deleted']
     # Return the number of deleted records
-    return {'n_before':count_before, 'n_deleted':count_deleted, 'n_remaining':count_remaining}
\ No newline at end of file
+    return {'n_before': count_before, 'n_deleted': count_deleted, 'n_remaining': count_before - count_deleted,
+            'n_archived': result['n_archived'], 'n_checkpoints_deleted': n_checkpoints_deleted}
+
+
+def remove_old_partitioned_activity_events(cutoff_time, progress_callback=None):
+    # Keep partitions ready for the upcoming months, as this task runs periodically
+    create_future_partitions()
+    # Estimated from planner statistics, counting would scan every partition
+    count_before = get_estimated_activity_events_count()
+    # Records of the partitions about to be dropped are archived beforehand
+    n_archived = archive_old_activity_events(cutoff_time) if aps.ACTIVITY_EVENTS_PURGE_ARCHIVE else 0
+    # Months entirely older than the cutoff are dropped as whole partitions, only the boundary month is range-deleted
+    dropped_partitions, n_dropped = drop_expired_partitions(cutoff_time)
+    result = purge_activity_events(cutoff_time, archive=False, progress_callback=progress_callback)
+    if is_search_index_enabled():
+        remove_old_from_search_index(cutoff_time)
+    refresh_facet_ranges()
+    n_checkpoints_deleted = remove_old_sync_checkpoints(cutoff_time)
+    n_deleted = n_dropped + result['n_deleted']
+    count_remaining = max(count_before - n_deleted, 0)
+    return {'n_before': count_before, 'n_deleted': n_deleted, 'n_remaining': count_remaining, 'n_archived': n_archived,
+            'dropped_partitions': dropped_partitions, 'n_checkpoints_deleted': n_checkpoints_deleted}
+
+
+def remove_old_sync_checkpoints(cutoff_time):
+    # Checkpoints of days older than both the retention and the fetch period are no longer read
+    cutoff_time = min(cutoff_time, timezone.now() - timedelta(days=aps.ACTIVITY_EVENTS_FETCH_MAX_PAST_DAYS))
+    n_deleted, _ = SyncCheckpoint.objects.filter(day__lt=cutoff_time.date()).delete()
+    return n_deleted
@@ -1,14 +1,26 @@
 import random
 import math
-from datetime import timedelta
+import numpy as np
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
 from django.utils import timezone
 from faker import Faker
 from .models import ActivityEvent
-from .common_functions import save_records_to_model
+from .common_functions import save_records_to_model, save_rows_to_model
+from .mapping_plan import MappingPlan
 
 fake = Faker('en_US')
 
+UTC = ZoneInfo('UTC')
+
 def generate_and_save_fake_data_list(n_events=6000, n_users=30, start_date=None, end_date=None):
+    data_list = generate_fake_data_list(n_events, n_users, start_date, end_date)
+    
+    save_result = save_records_to_model(data_list, ActivityEvent)
+    
+    return save_result
+
+def generate_fake_data_list(n_events=6000, n_users=30, start_date=None, end_date=None):
 
     if end_date is None:
         end_date = timezone.now()
@@ -16,7 +28,38 @@ def generate_and_save_fake_data_list(n_events=6000, n_users=30, start_date=None,
     if start_date is None:
         start_date = end_date - timedelta(days=90)
     
-    fields_dict = ActivityEvent.get_fields_dict()
+    # Columns filled by the ingestion itself are not part of an API record
+    fields_dict = {field: datatype for field, datatype in ActivityEvent.get_fields_dict().items() if field not in MappingPlan.MANAGED_FIELDS}
+
+    values_dict = generate_fake_value_pools(fields_dict, n_events, n_users)
+
+    data_list = []
+    for i in values_dict.get('id'):        
+        event_dict = {}
+        for field, datatype in fields_dict.items():
+            if field in values_dict:
+                if field == 'id':
+                    event_dict[field] = i
+                elif field in ['activityid', 'activity', 'userid', 'userkey', 'operation', 'organizationid']:                    
+                    event_dict[field] = random_from_list(values_dict[field])
+                else:
+                    event_dict[field] = random_from_list(values_dict[field], 0.2)
+            else:
+                if datatype == 'DateTimeField':
+                    if field == 'creationtime':
+                        event_dict[field] = random_iso_datetime_between(start_date, end_date)
+                    elif field not in ['created_at', 'updated_at']:
+                        iso_datetime = random_iso_datetime_between(start_date, end_date, 0.3)
+                        if iso_datetime:
+                            event_dict[field] = iso_datetime
+                else:
+                    event_dict[field] = random_string(0.3)
+        event_dict.update(random_dict(0.3))
+        data_list.append(event_dict)
+    
+    return data_list
+    
+def generate_fake_value_pools(fields_dict, n_events=6000, n_users=30):
 
     # Mapping of field names to their corresponding generation functions and the number of values to generate
     generation_map = {
@@ -46,34 +89,127 @@ def generate_and_save_fake_data_list(n_events=6000, n_users=30, start_date=None,
             values_list = generate_phrases(n_users)
             values_dict[field] = values_list
 
-    data_list = []
-    for i in values_dict.get('id'):        
-        event_dict = {}
+    return values_dict
+
+def generate_and_save_fake_data_vectorized(n_events=6000, n_users=30, start_date=None, end_date=None, seed=None, chunk_size=100000):
+    # NumPy based generator for large volumes: ids, timestamps and categorical values are sampled
+    # in vectorized batches and every chunk is loaded before the next one is generated, so memory
+    # is bounded by chunk_size. Faker is only used to build the small value pools.
+    if end_date is None:
+        end_date = timezone.now()
+
+    if start_date is None:
+        start_date = end_date - timedelta(days=90)
+
+    if seed is not None:
+        random.seed(seed)
+        fake.seed_instance(seed)
+    rng = np.random.default_rng(seed)
+
+    plan = ActivityEvent.get_mapping_plan()
+    fields_dict = {field: datatype for field, datatype in ActivityEvent.get_fields_dict().items() if field not in MappingPlan.MANAGED_FIELDS}
+    # Ids are sampled per chunk, so only the categorical pools are built up front
+    pools = generate_fake_value_pools(fields_dict, 0, n_users)
+    samplers = {field: WeightedSampler(values) for field, values in pools.items() if field != 'id'}
+    string_pool = np.array([random_string(0, 5, 15) for _ in range(1000)], dtype=object)
+    dict_pool = [random_dict(0) for _ in range(256)]
+
+    start_us = to_epoch_microseconds(start_date)
+    end_us = to_epoch_microseconds(end_date)
+
+    result = {
+        'n_created_records': 0,
+        'n_updated_records': 0,
+        'n_unchanged_records': 0,
+        'failed_records': []
+    }
+
+    for offset in range(0, n_events, chunk_size):
+        n = min(chunk_size, n_events - offset)
+        columns = {'id': random_uuid_array(rng, n)}
         for field, datatype in fields_dict.items():
-            if field in values_dict:
-                if field == 'id':
-                    event_dict[field] = i
-                elif field in ['activityid', 'activity', 'userid', 'userkey', 'operation', 'organizationid']:                    
-                    event_dict[field] = random_from_list(values_dict[field])
-                else:
-                    event_dict[field] = random_from_list(values_dict[field], 0.2)
+            if field == 'id':
+                continue
+            if field in samplers:
+                null_probability = 0 if field in ['activityid', 'activity', 'userid', 'userkey', 'operation', 'organizationid'] else 0.2
+                columns[field] = samplers[field].sample(rng, n, null_probability)
+            elif datatype == 'DateTimeField':
+                columns[field] = random_datetime_array(rng, n, start_us, end_us, 0 if field == 'creationtime' else 0.3)
             else:
-                if datatype == 'DateTimeField':
-                    if field == 'creationtime':
-                        event_dict[field] = random_iso_datetime_between(start_date, end_date)
-                    elif field not in ['created_at', 'updated_at']:
-                        iso_datetime = random_iso_datetime_between(start_date, end_date, 0.3)
-                        if iso_datetime:
-                            event_dict[field] = iso_datetime
-                else:
-                    event_dict[field] = random_string(0.3)
-        event_dict.update(random_dict(0.3))
-        data_list.append(event_dict)
-    
-    save_result = save_records_to_model(data_list, ActivityEvent)
-    
-    return save_result
-    
+                values = string_pool[rng.integers(0, len(string_pool), n)]
+                values[rng.random(n) < 0.3] = ''
+                columns[field] = values
+        extra_data = [dict_pool[i] for i in rng.integers(0, len(dict_pool), n)]
+        for i in np.flatnonzero(rng.random(n) < 0.3):
+            extra_data[i] = {}
+        columns['extra_data'] = extra_data
+
+        rows = build_rows_from_columns(plan, columns, n)
+        del columns
+        # Written in batches of the ingestion size, whatever the size of the generated chunk
+        chunk_result = save_rows_to_model(rows, ActivityEvent)
+        result['n_created_records'] += chunk_result['n_created_records']
+        result['n_updated_records'] += chunk_result['n_updated_records']
+        result['n_unchanged_records'] += chunk_result['n_unchanged_records']
+        result['failed_records'].extend(chunk_result['failed_records'])
+
+    return result
+
+def build_rows_from_columns(plan, columns, n):
+    # Assembles column arrays into the row tuples expected by the bulk loaders
+    column_values = []
+    for i, column in enumerate(plan.columns):
+        if column in columns:
+            values = columns[column]
+            column_values.append(values.tolist() if isinstance(values, np.ndarray) else values)
+        else:
+            column_values.append([plan.defaults[i]] * n)
+    hash_row = plan.hash_row
+    content_hash_index = plan.content_hash_index
+    rows = []
+    for row in zip(*column_values):
+        row = list(row)
+        row[content_hash_index] = hash_row(row)
+        rows.append(tuple(row))
+    return rows
+
+class WeightedSampler:
+    # Same 1.5 ** i weighting as random_from_list, with the cumulative weights computed once
+    def __init__(self, values):
+        self.values = np.array(values, dtype=object)
+        weights = 1.5 ** np.arange(len(values), dtype=np.float64)
+        self.cumulative = np.cumsum(weights / weights.sum())
+
+    def sample(self, rng, n, null_probability=0, null_value=''):
+        indexes = np.searchsorted(self.cumulative, rng.random(n), side='right')
+        values = self.values[np.minimum(indexes, len(self.values) - 1)]
+        if null_probability:
+            values[rng.random(n) < null_probability] = null_value
+        return values
+
+def random_uuid_array(rng, n):
+    # Version 4 UUIDs from vectorized random bytes
+    raw = rng.integers(0, 256, size=(n, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    hexs = raw.tobytes().hex()
+    return [f'{hexs[i:i + 8]}-{hexs[i + 8:i + 12]}-{hexs[i + 12:i + 16]}-{hexs[i + 16:i + 20]}-{hexs[i + 20:i + 32]}' for i in range(0, n * 32, 32)]
+
+def random_datetime_array(rng, n, start_us, end_us, null_probability=0):
+    stamps = rng.integers(start_us, max(end_us, start_us + 1), size=n).astype('datetime64[us]').tolist()
+    values = [stamp.replace(tzinfo=UTC) for stamp in stamps]
+    if null_probability:
+        for i in np.flatnonzero(rng.random(n) < null_probability):
+            values[i] = None
+    return values
+
+def to_epoch_microseconds(value):
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, time.min)
+    if timezone.is_naive(value):
+        value = value.replace(tzinfo=UTC)
+    return int(value.timestamp() * 1_000_000)
+
 def generate_emails(count=30, domain="baz.com"):
     emails = []
     for _ in range(count):
@@ -0,0 +1,144 @@
+from django.db import connections, router, DatabaseError
+from .models import ActivityEvent, ActivityEventField
+from .partition_functions import is_table_partitioned, list_partitions, get_default_partition_name
+
+# Indexes created from the ActivityEventField flags, other indexes are never touched
+MANAGED_INDEX_PREFIX = 'aeidx_'
+
+
+def get_connection():
+    return connections[router.db_for_write(ActivityEvent)]
+
+
+def get_desired_indexes():
+    # Returns {index name: column expressions} for the current filter and orderby flags
+    qn = get_connection().ops.quote_name
+    model_fields = ActivityEvent.get_fields_dict()
+    time_column = qn(ActivityEvent._meta.get_field(ActivityEvent.PARTITION_FIELD).column)
+    pk_column = qn(ActivityEvent._meta.pk.column)
+    indexes = {}
+
+    for fieldname, filter_flag, orderby_flag in ActivityEventField.objects.values_list('fieldname', 'filter', 'orderby'):
+        field_type = model_fields.get(fieldname)
+        if field_type is None:
+            continue
+        column = qn(ActivityEvent._meta.get_field(fieldname).column)
+        if filter_flag:
+            if field_type == 'DateTimeField':
+                # Date range filters; a datetime also flagged for sorting is served by its sort index
+                if not orderby_flag:
+                    indexes[f'{MANAGED_INDEX_PREFIX}f_{fieldname}'] = column
+            else:
+                # Equality filters, usually combined with a creationtime range; the composite
+                # index also serves the equality filter alone as its leading column
+                indexes[f'{MANAGED_INDEX_PREFIX}fc_{fieldname}'] = f'{column}, {time_column}'
+        if orderby_flag:
+            # The list and the API paginate on the sort key followed by the id (see pagination)
+            if field_type == 'CharField':
+                # apply_filters_to_queryset sorts CharFields by Lower(field)
+                indexes[f'{MANAGED_INDEX_PREFIX}lk_{fieldname}'] = f'LOWER({column}), {pk_column}'
+            elif column != pk_column:
+                indexes[f'{MANAGED_INDEX_PREFIX}ok_{fieldname}'] = f'{column}, {pk_column}'
+
+    return indexes
+
+
+def get_existing_indexes():
+    # Returns {index name: is valid} for the managed indexes of the activity events table
+    connection = get_connection()
+    table = ActivityEvent._meta.db_table
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT i.relname, x.indisvalid FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid "
+                "JOIN pg_class t ON t.oid = x.indrelid WHERE t.relname = %s AND pg_table_is_visible(t.oid) AND i.relname LIKE %s",
+                [table, f'{MANAGED_INDEX_PREFIX}%'])
+            return dict(cursor.fetchall())
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    return {name: True for name, constraint in constraints.items() if constraint['index'] and name.startswith(MANAGED_INDEX_PREFIX)}
+
+
+def create_index(name, expressions):
+    connection = get_connection()
+    qn = connection.ops.quote_name
+    table = ActivityEvent._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor != 'postgresql':
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {qn(name)} ON {qn(table)} ({expressions})")
+        elif not is_table_partitioned(connection, table):
+            # Built without blocking writes; runs outside a transaction
+            cursor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {qn(name)} ON {qn(table)} ({expressions})")
+        else:
+            # CONCURRENTLY is not supported on a partitioned table: the parent index is created
+            # invalid and empty, then every partition index is built concurrently and attached
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {qn(name)} ON ONLY {qn(table)} ({expressions})")
+            partitions = [partition_name for partition_name, range_start, range_end in list_partitions()] + [get_default_partition_name()]
+            for partition_name in partitions:
+                partition_index = f"{name}_{partition_name.rsplit('_', 1)[-1]}"
+                cursor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {qn(partition_index)} ON {qn(partition_name)} ({expressions})")
+                cursor.execute(
+                    "SELECT 1 FROM pg_inherits WHERE inhrelid = %s::regclass AND inhparent = %s::regclass",
+                    [qn(partition_index), qn(name)])
+                if cursor.fetchone() is None:
+                    cursor.execute(f"ALTER INDEX {qn(name)} ATTACH PARTITION {qn(partition_index)}")
+
+
+def drop_index(name):
+    connection = get_connection()
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql' and not is_table_partitioned(connection, ActivityEvent._meta.db_table):
+            cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {qn(name)}")
+        else:
+            cursor.execute(f"DROP INDEX IF EXISTS {qn(name)}")
+
+
+def sync_activity_events_indexes(dry_run=False):
+    # Creates the indexes required by the field flags and drops the managed ones no longer needed.
+    # Invalid indexes left by an interrupted concurrent build are rebuilt.
+    desired = get_desired_indexes()
+    existing = get_existing_indexes()
+    to_drop = sorted(name for name, valid in existing.items() if name not in desired or not valid)
+    to_create = sorted(name for name in desired if name not in existing or not existing[name])
+
+    if not dry_run:
+        for name in to_drop:
+            drop_index(name)
+        for name in to_create:
+            create_index(name, desired[name])
+
+    return {'created_indexes': to_create, 'dropped_indexes': to_drop}
+
+
+def get_indexes_report():
+    # Size and number of scans of every index of the activity events table (scans are PostgreSQL only)
+    connection = get_connection()
+    table = ActivityEvent._meta.db_table
+    report = []
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            # Partitioned indexes are reported with the sum over their partition indexes
+            cursor.execute(
+                "SELECT i.relname, x.indisvalid, "
+                "(SELECT COALESCE(SUM(pg_relation_size(tree.relid)), 0) FROM pg_partition_tree(i.oid) tree), "
+                "(SELECT COALESCE(SUM(s.idx_scan), 0) FROM pg_partition_tree(i.oid) tree JOIN pg_stat_user_indexes s ON s.indexrelid = tree.relid) "
+                "FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid JOIN pg_class t ON t.oid = x.indrelid "
+                "WHERE t.relname = %s AND pg_table_is_visible(t.oid) ORDER BY i.relname", [table])
+            for name, valid, size, n_scans in cursor.fetchall():
+                report.append({'name': name, 'managed': name.startswith(MANAGED_INDEX_PREFIX), 'valid': valid, 'size': int(size), 'n_scans': int(n_scans)})
+        return report
+
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+        for name, constraint in sorted(constraints.items()):
+            if not constraint['index']:
+                continue
+            try:
+                # Requires SQLite compiled with the dbstat virtual table
+                cursor.execute("SELECT SUM(pgsize) FROM dbstat WHERE name = %s", [name])
+                size = cursor.fetchone()[0]
+            except DatabaseError:
+                size = None
+            report.append({'name': name, 'managed': name.startswith(MANAGED_INDEX_PREFIX), 'valid': True, 'size': size, 'n_scans': None})
+    return report
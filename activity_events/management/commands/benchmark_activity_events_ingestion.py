@@ -0,0 +1,128 @@
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Sum
+from django.test import override_settings
+from django.test.utils import setup_databases, teardown_databases
+from api_credentials import app_settings as api_aps
+from api_credentials.models import ServiceCredential
+from ...fake_api_functions import FakeActivityEventsAPI
+from ...fetch_activity_events_functions import process_activity_events
+from ...models import SyncCheckpoint, ActivityEventField
+from ...request_scheduler import reset_rate_limiter
+from ... import app_settings as aps
+
+
+class Command(BaseCommand):
+    help = 'Measures end-to-end activity events ingestion throughput (events/s, pages/s, peak RSS)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--n_days_before', type=int, default=1, help='Number of days fetched by the benchmark run. Default is 1.')
+        parser.add_argument('--workers', type=int, default=None, help='Number of day windows processed concurrently. Defaults to ACTIVITY_EVENTS_FETCH_MAX_WORKERS.')
+        parser.add_argument('--rate_limit', type=int, default=None, help='Maximum API requests per hour. Defaults to ACTIVITY_EVENTS_API_MAX_REQUESTS_PER_HOUR.')
+        parser.add_argument('--recreate_test_db', action='store_true', default=False, help='Drop and recreate the test database (test_<name>) when it already exists.')
+        # Options of the in-process fake API
+        parser.add_argument('--fake_api', action='store_true', default=False, help='Run against an in-process fake Power BI API instead of the configured one.')
+        parser.add_argument('--events_per_day', type=int, default=20000, help='Events served per full day by the fake API. Default is 20000.')
+        parser.add_argument('--page_size', type=int, default=1000, help='Events per page served by the fake API. Default is 1000.')
+        parser.add_argument('--latency_ms', type=int, default=0, help='Latency of each fake API page request, in milliseconds. Default is 0.')
+        parser.add_argument('--throttle_rate', type=float, default=0.0, help='Probability of a fake API HTTP 429. Default is 0.')
+        parser.add_argument('--error_rate', type=float, default=0.0, help='Probability of a fake API HTTP 500. Default is 0.')
+
+    def handle(self, *args, **kwargs):
+        # Settings overridden for the duration of the run, restored afterwards
+        previous_settings = (aps.ACTIVITY_EVENTS_API_BASE_URL, api_aps.API_TOKEN_AUTHORITY_URL,
+                             aps.ACTIVITY_EVENTS_FETCH_MAX_WORKERS, aps.ACTIVITY_EVENTS_API_MAX_REQUESTS_PER_HOUR)
+        connection = connections['default']
+        previous_test_name = connection.settings_dict['TEST']['NAME']
+        server = None
+        old_databases = None
+        try:
+            # The run writes to a temporary test database, so that the fake events and checkpoints never
+            # reach the configured one; the field flags and the service credential are copied into it
+            fields = list(ActivityEventField.objects.all())
+            service_credentials = list(ServiceCredential.objects.all())
+            if connection.vendor == 'sqlite' and not previous_test_name:
+                # The in-memory test database of SQLite cannot be written by concurrent windows
+                connection.settings_dict['TEST']['NAME'] = f"{connection.settings_dict['NAME']}.benchmark"
+            test_name = connection.creation._get_test_db_name()
+            if test_database_exists(connection, test_name) and not kwargs['recreate_test_db']:
+                # setup_databases would drop it without asking
+                raise Exception(f"The test database {test_name} already exists. Use --recreate_test_db to drop and recreate it.")
+            old_databases = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+            ActivityEventField.objects.bulk_create(fields)
+            ServiceCredential.objects.bulk_create(service_credentials)
+
+            if kwargs['workers']:
+                aps.ACTIVITY_EVENTS_FETCH_MAX_WORKERS = kwargs['workers']
+            if kwargs['rate_limit']:
+                aps.ACTIVITY_EVENTS_API_MAX_REQUESTS_PER_HOUR = kwargs['rate_limit']
+            reset_rate_limiter()
+
+            credentials = {}
+            if kwargs['fake_api']:
+                fake_api = FakeActivityEventsAPI(
+                    events_per_day=kwargs['events_per_day'],
+                    page_size=kwargs['page_size'],
+                    latency_ms=kwargs['latency_ms'],
+                    throttle_rate=kwargs['throttle_rate'],
+                    error_rate=kwargs['error_rate']
+                )
+                server = fake_api.create_server('127.0.0.1', 0)
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+                base_url = f"http://127.0.0.1:{server.server_address[1]}"
+                aps.ACTIVITY_EVENTS_API_BASE_URL = base_url
+                api_aps.API_TOKEN_AUTHORITY_URL = base_url
+                credentials = {
+                    'SERVICE_CREDENTIALS_TENANT_ID': 'benchmark',
+                    'SERVICE_CREDENTIALS_CLIENT_ID': 'benchmark',
+                    'SERVICE_CREDENTIALS_CLIENT_SECRET': 'benchmark'
+                }
+
+            task_id = f"benchmark-{uuid.uuid4()}"
+            start = time.perf_counter()
+            with override_settings(**credentials):
+                result = process_activity_events(n_days_before=kwargs['n_days_before'], task_id=task_id)
+            elapsed = time.perf_counter() - start
+
+            n_events = result.get('n_created_records', 0) + result.get('n_updated_records', 0) + result.get('n_unchanged_records', 0)
+            n_pages = SyncCheckpoint.objects.filter(task_id=task_id).aggregate(Sum('n_pages'))['n_pages__sum'] or 0
+            # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+            peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+            message = (f"Ingested {n_events} events in {n_pages} pages in {elapsed:.2f}s: "
+                       f"{n_events / elapsed:.0f} events/s, {n_pages / elapsed:.2f} pages/s, peak RSS {peak_rss_mb:.0f} MB. "
+                       f"Created: {result.get('n_created_records', 0)}. Updated: {result.get('n_updated_records', 0)}. "
+                       f"Unchanged: {result.get('n_unchanged_records', 0)}. "
+                       f"Failed requests: {result.get('has_failed_requests')}. Failed records: {result.get('has_failed_records')}.")
+            self.stdout.write(self.style.SUCCESS(message))
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Error occurred: {e}"))
+
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+            if old_databases is not None:
+                teardown_databases(old_databases, verbosity=0)
+            connection.settings_dict['TEST']['NAME'] = previous_test_name
+            (aps.ACTIVITY_EVENTS_API_BASE_URL, api_aps.API_TOKEN_AUTHORITY_URL,
+             aps.ACTIVITY_EVENTS_FETCH_MAX_WORKERS, aps.ACTIVITY_EVENTS_API_MAX_REQUESTS_PER_HOUR) = previous_settings
+            reset_rate_limiter()
+
+
+def test_database_exists(connection, test_name):
+    if connection.vendor == 'sqlite':
+        return os.path.exists(test_name)
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", [test_name])
+            return cursor.fetchone() is not None
+    # Not checked on the other databases, where the flag is always required
+    return True
\ No newline at end of file
@@ -9,22 +9,28 @@ class Command(BaseCommand):
         # Number of days before the current date with no default value
         parser.add_argument('--n_days_before', type=int, default=None, 
                             help='The number of days before the current date that defines the start of the period to be updated')
+        # Continue interrupted day windows from their last persisted page
+        parser.add_argument('--resume', action='store_true', default=False,
+                            help='Resume day windows from the checkpoint of a previous run instead of fetching them again')
 
     def handle(self, *args, **kwargs):
         # Access n_days_before
         n_days_before = kwargs.get('n_days_before')
+        resume = kwargs.get('resume')
 
         try:
             # Call the function with n_days_before
             result = process_activity_events(
                 n_days_before=n_days_before, 
                 task_name=aps.ACTIVITY_EVENTS_FETCH_TASK_NAME, 
-                sync_task=True
+                sync_task=True,
+                resume=resume
             )
 
             # Extract result information
             n_created = result.get('n_created_records', 0)
             n_updated = result.get('n_updated_records', 0)
+            n_unchanged = result.get('n_unchanged_records', 0)
             failed = result.get('failed_records', None)
             start_date = result.get('start_datetime').strftime("%Y-%m-%d %H:%M:%S")
             end_date = result.get('end_datetime').strftime("%Y-%m-%d %H:%M:%S")
@@ -32,6 +38,7 @@ class Command(BaseCommand):
             # Success message
             message = (f"Activity event records have been successfully retrieved and saved for the period: "
                        f"{start_date} - {end_date}. Number of created records: {n_created}. Number of updated records: {n_updated}. "
+                       f"Number of unchanged records: {n_unchanged}. "
                        f"Failed records: {failed}.")
             self.stdout.write(self.style.SUCCESS(message))
 
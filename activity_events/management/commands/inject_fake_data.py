@@ -2,7 +2,7 @@ from django.core.management.base import BaseCommand
 from datetime import timedelta
 from django.utils.dateparse import parse_datetime
 from django.utils import timezone
-from ...generate_fake_data_functions import generate_and_save_fake_data_list
+from ...generate_fake_data_functions import generate_and_save_fake_data_list, generate_and_save_fake_data_vectorized
 import argparse
 
 def valid_date(s):
@@ -23,6 +23,10 @@ class Command(BaseCommand):
         parser.add_argument('--start_date', type=valid_date, default=None, help='Start date (format: YYYY-MM-DD). Defaults to 90 days before the end date.')
         # End date defaults to the current date
         parser.add_argument('--end_date', type=valid_date, default=None, help='End date (format: YYYY-MM-DD). Defaults to today.')
+        # Vectorized generation for large volumes, loaded chunk by chunk
+        parser.add_argument('--vectorized', action='store_true', help='Generate events with NumPy in vectorized chunks. Suited to millions of events.')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed, for reproducible datasets. Only used with --vectorized.')
+        parser.add_argument('--chunk_size', type=int, default=100000, help='Number of events generated per chunk, written in batches of ACTIVITY_EVENTS_SAVE_BATCH_SIZE. Only used with --vectorized. Default is 100000.')
 
     def handle(self, *args, **kwargs):
         try:
@@ -38,9 +42,13 @@ class Command(BaseCommand):
             start_date = kwargs.get('start_date') or (end_date - timedelta(days=90))                     
 
             # Call your fake data generation function
-            result = generate_and_save_fake_data_list(n_events, n_users, start_date, end_date)
+            if kwargs['vectorized']:
+                result = generate_and_save_fake_data_vectorized(n_events, n_users, start_date, end_date, kwargs['seed'], kwargs['chunk_size'])
+            else:
+                result = generate_and_save_fake_data_list(n_events, n_users, start_date, end_date)
             n_created = result.get('n_created_records', 0)
             n_updated = result.get('n_updated_records', 0)
+            n_unchanged = result.get('n_unchanged_records', 0)
             failed = result.get('failed_records', None)
             start = start_date.strftime("%Y-%m-%d")
             end = end_date.strftime("%Y-%m-%d")
@@ -48,6 +56,7 @@ class Command(BaseCommand):
             # Success message
             message = (f"Fake activity event records have been successfully injected for the period: "
                        f"{start} - {end}. Number of created records: {n_created}. Number of updated records: {n_updated}. "
+                       f"Number of unchanged records: {n_unchanged}. "
                        f"Failed records: {failed}.")
             self.stdout.write(self.style.SUCCESS(message))
 
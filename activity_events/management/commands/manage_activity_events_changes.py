@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from ...change_feed_functions import assign_change_sequence, get_last_change_seq
+
+
+class Command(BaseCommand):
+    help = 'Assigns change feed sequence numbers to the events that have none yet, e.g. the events loaded before the change feed existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch_size', type=int, default=None, help='Number of events numbered per transaction. Defaults to ACTIVITY_EVENTS_CHANGE_FEED_BATCH_SIZE.')
+
+    def handle(self, *args, **kwargs):
+        try:
+            n_assigned = assign_change_sequence(kwargs.get('batch_size'))
+            message = f"Number of events numbered: {n_assigned}. Last change sequence number: {get_last_change_seq()}."
+            self.stdout.write(self.style.SUCCESS(message))
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Error occurred: {e}"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from ...facet_functions import rebuild_facets
+from ... import app_settings as aps
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the facet store (distinct values with counts and date ranges) read by the filter dropdowns and the charts page'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fields', nargs='+', default=None, help='Fields to rebuild. Defaults to every field flagged for filter or chart.')
+
+    def handle(self, *args, **kwargs):
+        try:
+            result = rebuild_facets(kwargs.get('fields'))
+            message = (f"The facet store has been rebuilt. Number of values: {result['n_values']}. "
+                       f"Fields: {', '.join(result['facet_fields']) or 'none'}.")
+            self.stdout.write(self.style.SUCCESS(message))
+            if not aps.ACTIVITY_EVENTS_FACETS:
+                self.stdout.write(self.style.WARNING("Set ACTIVITY_EVENTS_FACETS to True to read the facets from the store and keep it updated."))
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Error occurred: {e}"))
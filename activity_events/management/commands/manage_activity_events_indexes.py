@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from ...index_functions import sync_activity_events_indexes, get_indexes_report
+
+
+class Command(BaseCommand):
+    help = 'Creates and drops the activity events indexes matching the filter and orderby flags of the activity event fields'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry_run', action='store_true', help='Only show the indexes that would be created and dropped.')
+        parser.add_argument('--report', action='store_true', help='Only show the size and usage of the existing indexes.')
+
+    def handle(self, *args, **kwargs):
+        try:
+            if not kwargs['report']:
+                result = sync_activity_events_indexes(dry_run=kwargs['dry_run'])
+                prefix = "Indexes to be" if kwargs['dry_run'] else "Indexes"
+                message = (f"{prefix} created: {', '.join(result['created_indexes']) or 'none'}. "
+                           f"{prefix} dropped: {', '.join(result['dropped_indexes']) or 'none'}.")
+                self.stdout.write(self.style.SUCCESS(message))
+
+            for index in get_indexes_report():
+                size = f"{index['size'] / 1024:.0f} kB" if index['size'] is not None else 'n/a'
+                n_scans = index['n_scans'] if index['n_scans'] is not None else 'n/a'
+                flags = ' (managed)' if index['managed'] else ''
+                flags += '' if index['valid'] else ' (invalid)'
+                self.stdout.write(f"{index['name']}{flags}: size {size}, scans {n_scans}")
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Error occurred: {e}"))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from ...partition_functions import (convert_activity_events_to_partitioned, create_future_partitions, list_partitions,
+                                    is_activity_events_partitioned)
+
+
+class Command(BaseCommand):
+    help = 'Partitions the activity events table by creationtime month on PostgreSQL and creates partitions ahead of time'
+
+    def add_arguments(self, parser):
+        # One-off conversion of the existing table
+        parser.add_argument('--convert', action='store_true', help='Rebuild the activity events table as a table partitioned by month. The table is locked while its rows are copied.')
+        # Number of future months with a partition
+        parser.add_argument('--months_ahead', type=int, default=None, help='Number of months ahead to create partitions for. Defaults to ACTIVITY_EVENTS_PARTITION_MONTHS_AHEAD.')
+
+    def handle(self, *args, **kwargs):
+        try:
+            months_ahead = kwargs.get('months_ahead')
+            if kwargs['convert']:
+                result = convert_activity_events_to_partitioned(months_ahead)
+                self.stdout.write(self.style.SUCCESS(f"Activity events table has been partitioned by month. Number of partitions: {result['n_partitions']}."))
+            elif not is_activity_events_partitioned():
+                self.stdout.write(self.style.WARNING("The activity events table is not partitioned. Use --convert to partition it."))
+                return
+            else:
+                created = create_future_partitions(months_ahead)
+                self.stdout.write(self.style.SUCCESS(f"Number of created partitions: {len(created)}. {', '.join(created)}"))
+
+            partitions = list_partitions()
+            message = ', '.join(f"{name} ({range_start:%Y-%m-%d} - {range_end:%Y-%m-%d})" for name, range_start, range_end in partitions)
+            self.stdout.write(f"Partitions: {message}")
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Error occurred: {e}"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from ...rollup_functions import rebuild_rollups
+from ... import app_settings as aps
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the hourly and daily rollups (number of events per chart datetime field and chart field value) read by the charts page'
+
+    def handle(self, *args, **kwargs):
+        try:
+            result = rebuild_rollups()
+            message = (f"The rollups have been rebuilt. Number of rows: {result['n_rows']}. "
+                       f"Charts: {', '.join(result['rollup_pairs']) or 'none'}.")
+            self.stdout.write(self.style.SUCCESS(message))
+            if not aps.ACTIVITY_EVENTS_ROLLUPS:
+                self.stdout.write(self.style.WARNING("Set ACTIVITY_EVENTS_ROLLUPS to True to read the charts from the rollups and keep them updated."))
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Error occurred: {e}"))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from ...search_functions import rebuild_search_index, drop_search_index
+from ... import app_settings as aps
+
+
+class Command(BaseCommand):
+    help = 'Builds the search index used by the q parameter from the fields flagged for search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drop', action='store_true', help='Drop the search index. Searches then fall back to icontains.')
+        parser.add_argument('--batch_size', type=int, default=None, help='Number of events indexed per batch. Defaults to ACTIVITY_EVENTS_PURGE_BATCH_SIZE.')
+
+    def handle(self, *args, **kwargs):
+        try:
+            if kwargs['drop']:
+                drop_search_index()
+                self.stdout.write(self.style.SUCCESS("The search index has been dropped."))
+                return
+
+            result = rebuild_search_index(kwargs.get('batch_size'))
+            message = (f"The search index has been rebuilt. Number of indexed events: {result['n_indexed']}. "
+                       f"Search fields: {', '.join(result['search_fields']) or 'none'}.")
+            self.stdout.write(self.style.SUCCESS(message))
+            if not aps.ACTIVITY_EVENTS_SEARCH_INDEX:
+                self.stdout.write(self.style.WARNING("Set ACTIVITY_EVENTS_SEARCH_INDEX to True to use it for searches and keep it updated."))
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Error occurred: {e}"))
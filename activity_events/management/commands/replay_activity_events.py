@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from ...archive_functions import replay_activity_events
+from .inject_fake_data import valid_date
+
+
+class Command(BaseCommand):
+    help = 'Replays archived Power BI API pages into activity events without calling the API'
+
+    def add_arguments(self, parser):
+        # Day partitions to replay, all of them by default
+        parser.add_argument('--start_date', type=valid_date, default=None, help='First archived day to replay (format: YYYY-MM-DD). Defaults to the oldest archived day.')
+        parser.add_argument('--end_date', type=valid_date, default=None, help='Last archived day to replay (format: YYYY-MM-DD). Defaults to the newest archived day.')
+        # Number of days replayed concurrently, the segments of a day are replayed in order
+        parser.add_argument('--workers', type=int, default=None, help='Number of archived days replayed concurrently. Defaults to ACTIVITY_EVENTS_FETCH_MAX_WORKERS.')
+
+    def handle(self, *args, **kwargs):
+        try:
+            start_date = kwargs.get('start_date')
+            end_date = kwargs.get('end_date')
+            start_date = start_date.date() if start_date else None
+            end_date = end_date.date() if end_date else None
+
+            result = replay_activity_events(start_date, end_date, kwargs.get('workers'))
+
+            n_segments = result.get('n_segments', 0)
+            n_created = result.get('n_created_records', 0)
+            n_updated = result.get('n_updated_records', 0)
+            n_unchanged = result.get('n_unchanged_records', 0)
+            failed = result.get('failed_records', None)
+
+            # Success message
+            message = (f"Archived activity events have been successfully replayed from {n_segments} segments. "
+                       f"Number of created records: {n_created}. Number of updated records: {n_updated}. "
+                       f"Number of unchanged records: {n_unchanged}. "
+                       f"Failed records: {failed}.")
+            self.stdout.write(self.style.SUCCESS(message))
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Error occurred: {e}"))
\ No newline at end of file
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from ...fake_api_functions import FakeActivityEventsAPI
+
+
+class Command(BaseCommand):
+    help = 'Runs a local stand-in for the Power BI activity events API and its token endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on. Default is 127.0.0.1.')
+        parser.add_argument('--port', type=int, default=8020, help='Port to listen on. Default is 8020.')
+        parser.add_argument('--events_per_day', type=int, default=2000, help='Number of events served for a full day window. Default is 2000.')
+        parser.add_argument('--n_users', type=int, default=30, help='Number of fake users per window. Default is 30.')
+        parser.add_argument('--page_size', type=int, default=1000, help='Number of events per page. Default is 1000.')
+        parser.add_argument('--latency_ms', type=int, default=0, help='Latency added to every page request, in milliseconds. Default is 0.')
+        parser.add_argument('--throttle_rate', type=float, default=0.0, help='Probability of answering a page request with HTTP 429. Default is 0.')
+        parser.add_argument('--retry_after', type=int, default=1, help='Retry-After seconds sent with HTTP 429. Default is 1.')
+        parser.add_argument('--error_rate', type=float, default=0.0, help='Probability of answering a page request with HTTP 500. Default is 0.')
+        parser.add_argument('--seed', type=int, default=None, help='Seed for the failure injection.')
+
+    def handle(self, *args, **kwargs):
+        fake_api = FakeActivityEventsAPI(
+            events_per_day=kwargs['events_per_day'],
+            n_users=kwargs['n_users'],
+            page_size=kwargs['page_size'],
+            latency_ms=kwargs['latency_ms'],
+            throttle_rate=kwargs['throttle_rate'],
+            retry_after=kwargs['retry_after'],
+            error_rate=kwargs['error_rate'],
+            seed=kwargs['seed']
+        )
+        server = fake_api.create_server(kwargs['host'], kwargs['port'])
+        base_url = f"http://{kwargs['host']}:{server.server_address[1]}"
+        self.stdout.write(self.style.SUCCESS(
+            f"Fake activity events API listening on {base_url}. "
+            f"Set ACTIVITY_EVENTS_API_BASE_URL and API_TOKEN_AUTHORITY_URL to this address to use it."))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Served: {fake_api.stats}")
\ No newline at end of file
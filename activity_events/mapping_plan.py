@@ -0,0 +1,189 @@
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from django.core.exceptions import ValidationError
+
+UTC = ZoneInfo('UTC')
+
+# Sentinel for columns that are not present in the API record
+MISSING = object()
+
+_plans = {}
+_plans_lock = threading.Lock()
+
+
+def get_mapping_plan(model):
+    # Plans are built once per process and model, then reused for every record
+    plan = _plans.get(model)
+    if plan is None:
+        with _plans_lock:
+            plan = _plans.get(model)
+            if plan is None:
+                plan = MappingPlan(model)
+                _plans[model] = plan
+    return plan
+
+
+class MappingPlan:
+    # Precompiled mapping from API record keys to model columns. Each mappable column gets
+    # its position in the row, a converter and its max length, so that a record is turned
+    # into a column-ordered row in a single pass without touching the model _meta API.
+
+    MANAGED_FIELDS = ('extra_data', 'created_at', 'updated_at', 'task_id', 'content_hash', 'change_seq')
+
+    def __init__(self, model):
+        self.model = model
+        fields = model._meta.concrete_fields
+        self.columns = [field.attname for field in fields]
+        self.index = {name: i for i, name in enumerate(self.columns)}
+        self.pk_index = self.index[model._meta.pk.attname]
+        self.extra_data_index = self.index['extra_data']
+        self.task_id_index = self.index['task_id']
+        self.content_hash_index = self.index['content_hash']
+        self.defaults = [field.get_default() if field.has_default() else None for field in fields]
+
+        # Columns that can be filled from the API, keyed by lowercase field name
+        self.targets = {}
+        for i, field in enumerate(fields):
+            if field.name in self.MANAGED_FIELDS:
+                continue
+            self.targets[field.name] = (i, field.name, field.get_internal_type(), getattr(field, 'max_length', None), field.null)
+
+        # Columns whose values are truncated to their max length
+        self.char_columns = [(i, field.name, field.max_length) for i, field in enumerate(fields)
+                             if field.name not in self.MANAGED_FIELDS and field.get_internal_type() == 'CharField']
+
+        # Columns that must end up with a non-empty value
+        self.required = [(i, field.name, field.null) for i, field in enumerate(fields)
+                         if not field.blank and field.name not in self.MANAGED_FIELDS]
+
+        # Columns in content hash order, with a flag for datetime serialization
+        self.hash_columns = [(i, field.get_internal_type() == 'DateTimeField') for i, field in enumerate(fields)
+                             if field.name not in model.CONTENT_HASH_EXCLUDED_FIELDS]
+
+        # API keys seen so far (e.g. 'CreationTime') mapped to their target, or None when unmapped
+        self.key_cache = {}
+
+    def get_target(self, key):
+        try:
+            return self.key_cache[key]
+        except KeyError:
+            target = self.targets.get(key.lower())
+            self.key_cache[key] = target
+            return target
+
+    def map_record(self, data):
+        # Returns the row with MISSING for absent columns, the unmapped data and the truncation warnings
+        row = [MISSING] * len(self.columns)
+        unmapped_data = {}
+        truncations = {}
+        get_target = self.get_target
+
+        for key, value in data.items():
+            target = get_target(key)
+            if target is None:
+                unmapped_data[key] = value
+                continue
+            i, name, field_type, max_length, null = target
+            if field_type == 'CharField':
+                if value is not None and not isinstance(value, str):
+                    value = str(value)
+                if value is not None and len(value) > max_length:
+                    value = self.truncate(name, value, max_length, truncations)
+            elif field_type == 'DateTimeField':
+                if value in (None, '') and null:
+                    value = None
+                elif value is not None:
+                    value = datetime.fromisoformat(value).replace(tzinfo=UTC)
+            elif field_type == 'BooleanField':
+                value = bool(value)
+            row[i] = value
+
+        self.check_required(row)
+        return row, unmapped_data, truncations
+
+    @staticmethod
+    def truncate(name, value, max_length, truncations):
+        truncations[name] = f'Value in {name} trimmed to {str(max_length)} chars (was {str(len(value))}, exceeded limit).'
+        return value[:max_length]
+
+    def check_required(self, row):
+        errors = {}
+        for i, name, null in self.required:
+            value = row[i]
+            if value is None and not null:
+                errors[name] = ['This field cannot be null.']
+            elif value is MISSING or value in ('', None):
+                errors[name] = ['This field cannot be blank.']
+
+        if errors:
+            raise ValidationError(errors)
+
+    def map_page(self, data_list, task_id=None):
+        # Turns a raw API page into column-ordered row tuples. Invalid records are reported in
+        # failed_records; truncated records are kept and their warnings collected alongside.
+        rows = []
+        truncations = {}
+        failed_records = []
+        defaults = self.defaults
+        hash_row = self.hash_row
+
+        for item in data_list:
+            id = item.get('Id') or item.get('id')
+            try:
+                if id is None:
+                    raise ValueError("Id of activity event must be provided")  # Raise exception if Id is missing
+                row, unmapped_data, record_truncations = self.map_record(item)
+            except (ValueError, ValidationError) as e:
+                failed_records.append({
+                    id: str(e)
+                })
+                continue
+            row = [defaults[i] if value is MISSING else value for i, value in enumerate(row)]
+            row[self.extra_data_index] = unmapped_data
+            if task_id:
+                row[self.task_id_index] = task_id
+            row[self.content_hash_index] = hash_row(row)
+            if record_truncations:
+                truncations[row[self.pk_index]] = record_truncations
+            rows.append(tuple(row))
+
+        return rows, truncations, failed_records
+
+    def check_rows(self, rows):
+        # Applies the checks of map_record to rows built without it (see build_rows_from_columns):
+        # too long strings are truncated and the row hashed again, rows missing a required value
+        # are reported in failed_records, as in map_page.
+        checked_rows = []
+        truncations = {}
+        failed_records = []
+        char_columns = self.char_columns
+        pk_index = self.pk_index
+
+        for row in rows:
+            record_truncations = {}
+            for i, name, max_length in char_columns:
+                value = row[i]
+                if value is not None and len(value) > max_length:
+                    if not record_truncations:
+                        row = list(row)
+                    row[i] = self.truncate(name, value, max_length, record_truncations)
+            try:
+                self.check_required(row)
+            except ValidationError as e:
+                failed_records.append({
+                    row[pk_index]: str(e)
+                })
+                continue
+            if record_truncations:
+                row[self.content_hash_index] = self.hash_row(row)
+                row = tuple(row)
+                truncations[row[pk_index]] = record_truncations
+            checked_rows.append(row)
+
+        return checked_rows, truncations, failed_records
+
+    def hash_row(self, row):
+        values = [('' if row[i] is None else row[i].isoformat()) if is_datetime else row[i]
+                  for i, is_datetime in self.hash_columns]
+        return self.model.hash_content(values)
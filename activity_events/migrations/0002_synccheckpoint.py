@@ -0,0 +1,33 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity_events', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taskname', models.CharField(max_length=120)),
+                ('window_start', models.DateTimeField()),
+                ('window_end', models.DateTimeField()),
+                ('status', models.CharField(choices=[('pending', 'PENDING'), ('success', 'SUCCESS'), ('failure', 'FAILURE')], default='pending', max_length=10)),
+                ('continuation_uri', models.TextField(blank=True, default='')),
+                ('n_pages', models.IntegerField(default=0)),
+                ('n_records', models.IntegerField(default=0)),
+                ('task_id', models.CharField(blank=True, default='', max_length=60)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-window_start'],
+                'unique_together': {('taskname', 'window_start', 'window_end')},
+            },
+        ),
+    ]
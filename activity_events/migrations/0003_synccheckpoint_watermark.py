@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity_events', '0002_synccheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='synccheckpoint',
+            name='watermark',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity_events', '0003_synccheckpoint_watermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activityevent',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
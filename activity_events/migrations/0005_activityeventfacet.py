@@ -0,0 +1,30 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity_events', '0004_activityevent_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityEventFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fieldname', models.CharField(max_length=120)),
+                ('kind', models.CharField(choices=[('value', 'VALUE'), ('range', 'RANGE')], default='value', max_length=10)),
+                ('value', models.CharField(blank=True, default='', max_length=255)),
+                ('count', models.BigIntegerField(default=0)),
+                ('min_value', models.DateTimeField(blank=True, null=True)),
+                ('max_value', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['fieldname', 'kind', 'value'],
+                'unique_together': {('fieldname', 'kind', 'value')},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity_events', '0005_activityeventfacet'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='activityevent',
+            index=models.Index(fields=['created_at', 'id'], name='activityevent_created_id'),
+        ),
+    ]
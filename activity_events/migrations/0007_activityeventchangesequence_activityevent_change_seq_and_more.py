@@ -0,0 +1,30 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity_events', '0006_activityevent_activityevent_created_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityEventChangeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_value', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='activityevent',
+            name='change_seq',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='activityevent',
+            index=models.Index(condition=models.Q(('change_seq__isnull', True)), fields=['id'], name='activityevent_pending_seq'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity_events', '0007_activityeventchangesequence_activityevent_change_seq_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityEventRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'HOUR'), ('day', 'DAY'), ('all', 'ALL')], default='hour', max_length=10)),
+                ('time_field', models.CharField(max_length=120)),
+                ('fieldname', models.CharField(blank=True, default='', max_length=120)),
+                ('bucket', models.DateTimeField(blank=True, null=True)),
+                ('value', models.CharField(blank=True, default='', max_length=255)),
+                ('count', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['granularity', 'time_field', 'fieldname', 'bucket', 'value'],
+                'unique_together': {('granularity', 'time_field', 'fieldname', 'bucket', 'value')},
+            },
+        ),
+    ]
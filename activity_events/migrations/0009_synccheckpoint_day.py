@@ -0,0 +1,52 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:02
+
+from django.db import migrations, models
+
+
+def set_checkpoint_days(apps, schema_editor):
+    # One checkpoint per task and day: the most recently updated window of the day is kept,
+    # with the newest watermark of the day's successful windows
+    SyncCheckpoint = apps.get_model('activity_events', 'SyncCheckpoint')
+    kept = {}
+    watermarks = {}
+    for checkpoint in SyncCheckpoint.objects.order_by('updated_at', 'pk'):
+        checkpoint.day = checkpoint.window_start.date()
+        key = (checkpoint.taskname, checkpoint.day)
+        if checkpoint.status == 'success' and checkpoint.watermark and (key not in watermarks or checkpoint.watermark > watermarks[key]):
+            watermarks[key] = checkpoint.watermark
+        if key in kept:
+            kept[key].delete()
+        kept[key] = checkpoint
+    for key, checkpoint in kept.items():
+        if checkpoint.status == 'success' and key in watermarks:
+            checkpoint.watermark = watermarks[key]
+        checkpoint.save(update_fields=['day', 'watermark'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity_events', '0008_activityeventrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='synccheckpoint',
+            name='day',
+            field=models.DateField(null=True),
+        ),
+        migrations.RunPython(set_checkpoint_days, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='synccheckpoint',
+            name='day',
+            field=models.DateField(),
+        ),
+        migrations.AlterModelOptions(
+            name='synccheckpoint',
+            options={'ordering': ['-day']},
+        ),
+        migrations.AlterUniqueTogether(
+            name='synccheckpoint',
+            unique_together={('taskname', 'day')},
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:55
+
+from django.db import migrations, models
+
+
+def remove_facets_and_rollups(apps, schema_editor):
+    # The stored counts have no month; they are built again the first time they are read
+    apps.get_model('activity_events', 'ActivityEventFacet').objects.all().delete()
+    apps.get_model('activity_events', 'ActivityEventRollup').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity_events', '0009_synccheckpoint_day'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_facets_and_rollups, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='activityeventfacet',
+            options={'ordering': ['fieldname', 'kind', 'value', 'month']},
+        ),
+        migrations.AlterModelOptions(
+            name='activityeventrollup',
+            options={'ordering': ['granularity', 'time_field', 'fieldname', 'bucket', 'value', 'month']},
+        ),
+        migrations.AlterUniqueTogether(
+            name='activityeventfacet',
+            unique_together=set(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='activityeventrollup',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='activityeventfacet',
+            name='month',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='activityeventrollup',
+            name='month',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='activityeventfacet',
+            unique_together={('fieldname', 'kind', 'value', 'month')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='activityeventrollup',
+            unique_together={('granularity', 'time_field', 'fieldname', 'bucket', 'value', 'month')},
+        ),
+    ]
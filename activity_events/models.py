@@ -1,9 +1,10 @@
 from django.db import models
 from django.db.models import F
-from datetime import datetime
-from zoneinfo import ZoneInfo
 from django.core.exceptions import ValidationError
+from .mapping_plan import get_mapping_plan, MISSING
 import uuid
+import hashlib
+import json
 
 class ActivityEventField(models.Model):
     fieldname = models.CharField(max_length=120, unique=True, blank=False, null=False)    
@@ -43,6 +44,29 @@ class SyncTask(models.Model):
     class Meta:
         ordering = ['-started_at']
 
+class SyncCheckpoint(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'PENDING'),
+        ('success', 'SUCCESS'),
+        ('failure', 'FAILURE'),
+    ]
+    taskname = models.CharField(max_length=120, blank=False, null=False)
+    day = models.DateField(blank=False, null=False)
+    window_start = models.DateTimeField(blank=False, null=False)
+    window_end = models.DateTimeField(blank=False, null=False)
+    status = models.CharField(max_length=10, default='pending', choices=STATUS_CHOICES, blank=False, null=False)
+    continuation_uri = models.TextField(default='', blank=True, null=False)
+    n_pages = models.IntegerField(default=0, blank=False, null=False)
+    n_records = models.IntegerField(default=0, blank=False, null=False)
+    watermark = models.DateTimeField(blank=True, null=True)
+    task_id = models.CharField(max_length=60, default='', null=False, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-day']
+        unique_together = ['taskname', 'day']
+
 class ActivityEvent(models.Model):
     activityid = models.CharField(max_length=60, default='', blank=True, null=False)
     datasetname = models.CharField(max_length=120, default='', blank=True, null=False)
@@ -95,6 +119,15 @@ class ActivityEvent(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     task_id = models.CharField(max_length=60, default='', null=False, blank=True)
+    content_hash = models.CharField(max_length=32, default='', null=False, blank=True)
+    # Position in the change feed, assigned after every insert or real update (see change_feed_functions)
+    change_seq = models.BigIntegerField(blank=True, null=True, db_index=True)
+
+    CONTENT_HASH_EXCLUDED_FIELDS = ('created_at', 'updated_at', 'task_id', 'content_hash', 'change_seq')
+    # Bookkeeping columns of the ingestion, not returned by the API and the exports
+    API_EXCLUDED_FIELDS = ('content_hash', 'change_seq')
+    # Range partition key when the table is partitioned on PostgreSQL (see partition_functions)
+    PARTITION_FIELD = 'creationtime'
 
     @classmethod
     def get_fields_dict(cls):
@@ -115,12 +148,30 @@ class ActivityEvent(models.Model):
         return {}
 
 
+    @classmethod
+    def get_mapping_plan(cls):
+        return get_mapping_plan(cls)
+
+    @classmethod
+    def map_from_dict(cls, data, task_id=None, instance=None):
+        instance_id = data.get('Id') or data.get('id')
+        if instance_id is None:
+            raise ValueError("Id of activity event must be provided")  # Raise exception if Id is missing
+        if instance is None:
+            instance = cls()
+        plan = cls.get_mapping_plan()
+        row, unmapped_data, validation_errors_max_length = plan.map_record(data)
+        # The record replaces the whole event, as in MappingPlan.map_page: fields missing from it
+        # are reset to their default, like extra_data and task_id
+        for i, name, field_type, max_length, null in plan.targets.values():
+            setattr(instance, plan.columns[i], plan.defaults[i] if row[i] is MISSING else row[i])
+        # Store unmapped data in extra_data attribute
+        instance.extra_data = unmapped_data
+        instance.task_id = task_id or plan.defaults[plan.task_id_index]
+        return instance, validation_errors_max_length
+
     @classmethod
     def create_or_update_from_dict(cls, data, task_id=None):
-        field_info = cls.get_fields_dict()
-        unmapped_data = {}
-        mapped_data = {}        
-        validation_errors_max_length = {} 
         # Determine if we need to create a new instance or update an existing one
         instance_id = data.get('Id') or data.get('id')
         if instance_id is None:
@@ -131,42 +182,105 @@ class ActivityEvent(models.Model):
         except cls.DoesNotExist:
             instance = cls()
             created = True 
-        # Process each field        
-        for field, value in data.items():
-            field_lower = field.lower()
-            if field_lower in field_info:
-                model_field = field_lower
-                field_type = field_info[field_lower]                
-                # Apply transformation based on field type
-                if field_type == 'CharField':
-                    max_length = cls._meta.get_field(field_lower).max_length
-                    val_length = len(str(value))
-                    if val_length > max_length:
-                        value = str(value)[:max_length]
-                        validation_errors_max_length[model_field] = f'Value in {field_lower} trimmed to {str(max_length)} chars (was {str(val_length)}, exceeded limit).'
-                elif field_type == 'DateTimeField':
-                    value = datetime.fromisoformat(value).replace(tzinfo=ZoneInfo('UTC'))
-                elif field_type == 'BooleanField':
-                    value = bool(value)
-                mapped_data[model_field] = value
-            else:
-                unmapped_data[field] = value        
-        # Set or update fields on the instance
-        for field, value in mapped_data.items():
-            setattr(instance, field, value)
-        # Store unmapped data in extra_data attribute
-        instance.extra_data = unmapped_data
-        if task_id:
-            instance.task_id = task_id
+        previous_content_hash = instance.content_hash
+        instance, validation_errors_max_length = cls.map_from_dict(data, task_id=task_id, instance=instance)
         try:
             instance.full_clean()  # Validate all fields
-            instance.save()  # Save the validated instance to the database
+            instance.content_hash = instance.compute_content_hash()
+            if created or instance.content_hash != previous_content_hash:
+                # Numbered again in the change feed
+                instance.change_seq = None
+                instance.save()  # Save the validated instance to the database
         except ValidationError as e:           
             raise e
         if validation_errors_max_length:
             raise ValidationError(validation_errors_max_length)
-        status = 'created' if created else 'updated'       
+        if created:
+            status = 'created'
+        elif instance.content_hash != previous_content_hash:
+            status = 'updated'
+        else:
+            status = 'unchanged'
         return instance, status
+
+    def compute_content_hash(self):
+        # Fingerprint of the event content, used to skip rewriting rows that did not change
+        content = [
+            field.value_to_string(self) if field.get_internal_type() == 'DateTimeField' else getattr(self, field.attname)
+            for field in self._meta.concrete_fields if field.name not in self.CONTENT_HASH_EXCLUDED_FIELDS
+        ]
+        return self.hash_content(content)
+
+    @staticmethod
+    def hash_content(content):
+        serialized = json.dumps(content, sort_keys=True, default=str)
+        return hashlib.blake2b(serialized.encode('utf-8'), digest_size=16).hexdigest()
+
+    @classmethod
+    def get_upsert_update_fields(cls):
+        # Concrete columns rewritten when an existing event is upserted
+        return [field.name for field in cls._meta.concrete_fields if not field.primary_key and field.name != 'created_at']
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Default ordering of the list and the API, followed by the keyset pagination tie-breaker
+            models.Index(fields=['created_at', 'id'], name='activityevent_created_id'),
+            # Events waiting for their change feed sequence number
+            models.Index(fields=['id'], condition=models.Q(change_seq__isnull=True), name='activityevent_pending_seq'),
+        ]
+
+class ActivityEventFacet(models.Model):
+    # Distinct values with their number of events (value rows) and the total number of events with
+    # the min and max of datetime fields (one range row per field without month), see facet_functions.
+    # Counts are also kept per creationtime month (value rows and range rows with a month), so that
+    # the events of a dropped partition are subtracted without reading them.
+    VALUE = 'value'
+    RANGE = 'range'
+    KIND_CHOICES = [
+        (VALUE, 'VALUE'),
+        (RANGE, 'RANGE'),
+    ]
+    fieldname = models.CharField(max_length=120, blank=False, null=False)
+    kind = models.CharField(max_length=10, default=VALUE, choices=KIND_CHOICES, blank=False, null=False)
+    value = models.CharField(max_length=255, default='', blank=True, null=False)
+    month = models.DateField(blank=True, null=True, db_index=True)
+    count = models.BigIntegerField(default=0, blank=False, null=False)
+    min_value = models.DateTimeField(blank=True, null=True)
+    max_value = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['fieldname', 'kind', 'value', 'month']
+        unique_together = ['fieldname', 'kind', 'value', 'month']
+
+class ActivityEventChangeSequence(models.Model):
+    # Last sequence number assigned by the change feed (a single row), so that numbers are never
+    # reused once the events holding them are rewritten or deleted, see change_feed_functions
+    last_value = models.BigIntegerField(default=0, blank=False, null=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+class ActivityEventRollup(models.Model):
+    # Number of events per hour and per day of a chart datetime field (time_field), in total
+    # (fieldname '') and per value of another chart field, split by creationtime month. One ALL row
+    # per (time_field, fieldname) holds the number of events counted over the whole period, see rollup_functions
+    HOUR = 'hour'
+    DAY = 'day'
+    ALL = 'all'
+    GRANULARITY_CHOICES = [
+        (HOUR, 'HOUR'),
+        (DAY, 'DAY'),
+        (ALL, 'ALL'),
+    ]
+    granularity = models.CharField(max_length=10, default=HOUR, choices=GRANULARITY_CHOICES, blank=False, null=False)
+    time_field = models.CharField(max_length=120, blank=False, null=False)
+    fieldname = models.CharField(max_length=120, default='', blank=True, null=False)
+    bucket = models.DateTimeField(blank=True, null=True)
+    value = models.CharField(max_length=255, default='', blank=True, null=False)
+    month = models.DateField(blank=True, null=True, db_index=True)
+    count = models.BigIntegerField(default=0, blank=False, null=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['granularity', 'time_field', 'fieldname', 'bucket', 'value', 'month']
+        unique_together = ['granularity', 'time_field', 'fieldname', 'bucket', 'value', 'month']
@@ -0,0 +1,240 @@
+import json
+import base64
+from datetime import datetime
+from django.db import connections, router
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+from . import app_settings as aps
+
+CURSOR_QUERY_PARAM = 'cursor'
+
+
+class KeysetPage:
+    # Page of a keyset pagination; start_index is unknown (None) when reached from the last page
+    def __init__(self, object_list, next_cursor, previous_cursor, last_cursor, start_index, count, count_is_estimated):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.last_cursor = last_cursor
+        self.start_index = start_index
+        self.count = count
+        self.count_is_estimated = count_is_estimated
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def end_index(self):
+        return None if self.start_index is None else self.start_index + len(self.object_list) - 1
+
+
+def get_ordering_keys(queryset):
+    # Returns [(name, descending, nullable)] for the ordering of the queryset, ending with the primary key
+    model = queryset.model
+    ordering = queryset.query.order_by or (model._meta.ordering if queryset.query.default_ordering else [])
+    keys = []
+    for item in ordering:
+        if not isinstance(item, str):
+            raise ValueError("Keyset pagination only supports orderings by field or annotation name.")
+        descending = item.startswith('-')
+        name = item.lstrip('-')
+        if name in queryset.query.annotations:
+            nullable = False
+        else:
+            field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+            name = 'pk' if field.primary_key else name
+            nullable = field.null
+        keys.append((name, descending, nullable))
+    if not any(name == 'pk' for name, descending, nullable in keys):
+        # The primary key makes every position unique, it follows the direction of the first key
+        keys.append(('pk', keys[0][1] if keys else False, False))
+    return keys
+
+
+def get_keyset_ordering(keys, previous):
+    # Nulls always come last in the forward direction
+    ordering = []
+    for name, descending, nullable in keys:
+        descending = descending != previous
+        if not nullable:
+            ordering.append(f'-{name}' if descending else name)
+        elif previous:
+            ordering.append(F(name).desc(nulls_first=True) if descending else F(name).asc(nulls_first=True))
+        else:
+            ordering.append(F(name).desc(nulls_last=True) if descending else F(name).asc(nulls_last=True))
+    return ordering
+
+
+def get_keyset_filter(keys, values, previous):
+    # Rows strictly after (or before, when previous) the position given by values
+    terms = []
+    equal = Q()
+    for (name, descending, nullable), value in zip(keys, values):
+        lookup = 'gt' if descending == previous else 'lt'
+        if value is None:
+            beyond = Q(**{f'{name}__isnull': False}) if previous else None
+        else:
+            beyond = Q(**{f'{name}__{lookup}': value})
+            if nullable and not previous:
+                beyond |= Q(**{f'{name}__isnull': True})
+        if beyond is not None:
+            terms.append(equal & beyond)
+        equal &= Q(**{f'{name}__isnull': True}) if value is None else Q(**{name: value})
+
+    condition = Q(pk__in=[])
+    for term in terms:
+        condition |= term
+
+    # Redundant range on the first key, so that the scan starts at the position in its index
+    name, descending, nullable = keys[0]
+    value = values[0]
+    if value is None:
+        bound = Q() if previous else Q(**{f'{name}__isnull': True})
+    else:
+        bound = Q(**{f"{name}__{'gte' if descending == previous else 'lte'}": value})
+        if nullable and not previous:
+            bound |= Q(**{f'{name}__isnull': True})
+    return bound & condition
+
+
+def to_cursor_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def from_cursor_value(queryset, name, value):
+    if value is None or name in queryset.query.annotations:
+        return value
+    field = queryset.model._meta.pk if name == 'pk' else queryset.model._meta.get_field(name)
+    return field.to_python(value)
+
+
+def encode_cursor(keys, values, offset, previous):
+    # Opaque to clients: the position, its row offset when known and the direction
+    payload = {'k': [name for name, descending, nullable in keys], 'v': values, 'o': offset, 'p': previous}
+    data = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(queryset, keys, cursor):
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(data)
+        values, offset, previous = payload['v'], payload['o'], bool(payload['p'])
+        if payload['k'] != [name for name, descending, nullable in keys]:
+            raise ValueError("The cursor was created for another ordering.")
+        if values is not None:
+            values = [from_cursor_value(queryset, name, value) for (name, descending, nullable), value in zip(keys, values)]
+    except (TypeError, KeyError, ValueError, AttributeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    return values, offset, previous
+
+
+def get_position(obj, keys):
+    # Rows are model instances or named values_list() rows
+    return [to_cursor_value(getattr(obj, name)) for name, descending, nullable in keys]
+
+
+def get_queryset_count(queryset, count_mode=None):
+    # Returns (count, is estimated); the estimate is the planner's row estimate on PostgreSQL
+    count_mode = count_mode or aps.ACTIVITY_EVENTS_COUNT_MODE
+    if count_mode == 'none':
+        return None, False
+    connection = connections[router.db_for_read(queryset.model)]
+    if count_mode == 'estimated' and connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        return int(plan[0]['Plan']['Plan Rows']), True
+    return queryset.count(), False
+
+
+def get_keyset_page(queryset, cursor, page_size, count_mode=None):
+    # Reads a page without OFFSET: the rows after (or before) the cursor position in the
+    # queryset ordering, with the primary key as tie-breaker
+    keys = get_ordering_keys(queryset)
+    values, offset, previous = decode_cursor(queryset, keys, cursor) if cursor else (None, 0, False)
+
+    page_queryset = queryset
+    if values is not None:
+        page_queryset = page_queryset.filter(get_keyset_filter(keys, values, previous))
+    rows = list(page_queryset.order_by(*get_keyset_ordering(keys, previous))[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    count, count_is_estimated = get_queryset_count(queryset, count_mode)
+    if previous:
+        rows.reverse()
+        has_previous = has_more
+        if not has_previous:
+            start = 0
+        else:
+            start = None if offset is None else max(offset - len(rows), 0)
+        # The last page is requested with a cursor without position
+        has_next = values is not None
+    else:
+        start = offset
+        has_previous = cursor is not None and offset != 0
+        has_next = has_more
+
+    next_cursor = encode_cursor(keys, get_position(rows[-1], keys), None if start is None else start + len(rows), False) if has_next and rows else None
+    previous_cursor = encode_cursor(keys, get_position(rows[0], keys), start, True) if has_previous and rows else None
+    last_cursor = encode_cursor(keys, None, None if count_is_estimated else count, True)
+    start_index = None if start is None else start + 1
+    return KeysetPage(rows, next_cursor, previous_cursor, last_cursor, start_index, count, count_is_estimated)
+
+
+class ActivityEventCursorPagination(BasePagination):
+    # Keyset pagination of the API; requests with the page parameter keep the page number pagination
+    cursor_query_param = CURSOR_QUERY_PARAM
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_number_pagination = None
+        if PageNumberPagination.page_query_param in request.query_params and self.cursor_query_param not in request.query_params:
+            self.page_number_pagination = PageNumberPagination()
+            return self.page_number_pagination.paginate_queryset(queryset, request, view)
+        try:
+            self.page = get_keyset_page(queryset, request.query_params.get(self.cursor_query_param), api_settings.PAGE_SIZE)
+        except ValueError as e:
+            raise NotFound(str(e))
+        return self.page.object_list
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), PageNumberPagination.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        if self.page_number_pagination is not None:
+            return self.page_number_pagination.get_paginated_response(data)
+        return Response({
+            'count': self.page.count,
+            'count_is_estimated': self.page.count_is_estimated,
+            'next': self.get_link(self.page.next_cursor),
+            'previous': self.get_link(self.page.previous_cursor),
+            'results': data
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {'type': 'integer', 'nullable': True},
+                'count_is_estimated': {'type': 'boolean'},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
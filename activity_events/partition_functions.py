@@ -0,0 +1,174 @@
+import re
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from django.db import connections, transaction, router
+from django.utils import timezone
+from .models import ActivityEvent
+from .facet_functions import lock_aggregates, subtract_month_from_facets
+from .rollup_functions import subtract_month_from_rollups
+from . import app_settings as aps
+
+UTC = ZoneInfo('UTC')
+
+# Monthly partitions are named <table>_pYYYYMM, rows outside every range go to <table>_default
+PARTITION_NAME_PATTERN = re.compile(r'_p(\d{4})(\d{2})$')
+
+
+def get_connection(model=ActivityEvent):
+    return connections[router.db_for_write(model)]
+
+
+def is_table_partitioned(connection, table):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)", [table])
+        return cursor.fetchone() is not None
+
+
+def is_activity_events_partitioned():
+    return is_table_partitioned(get_connection(), ActivityEvent._meta.db_table)
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=UTC)
+
+
+def add_months(value, n_months):
+    month = value.month - 1 + n_months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1, day=1)
+
+
+def get_partition_name(start):
+    return f'{ActivityEvent._meta.db_table}_p{start.strftime("%Y%m")}'
+
+
+def get_default_partition_name():
+    return f'{ActivityEvent._meta.db_table}_default'
+
+
+def list_partitions():
+    # Returns (name, range_start, range_end) of the monthly partitions, oldest first
+    connection = get_connection()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = %s AND pg_table_is_visible(parent.oid)", [ActivityEvent._meta.db_table])
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = []
+    for name in names:
+        match = PARTITION_NAME_PATTERN.search(name)
+        if match:
+            start = datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=UTC)
+            partitions.append((name, start, add_months(start, 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def get_estimated_row_count(table_names):
+    # Planner statistics, so that no partition has to be scanned
+    connection = get_connection()
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT COALESCE(SUM(GREATEST(reltuples, 0)), 0) FROM pg_class WHERE relname = ANY(%s)", [list(table_names)])
+        return int(cursor.fetchone()[0])
+
+
+def get_estimated_activity_events_count():
+    return get_estimated_row_count([name for name, range_start, range_end in list_partitions()] + [get_default_partition_name()])
+
+
+def create_partition(start):
+    # The new partition is filled with the rows of its month found in the default partition
+    # before being attached, as attaching would otherwise fail on the overlapping rows
+    connection = get_connection()
+    qn = connection.ops.quote_name
+    table = qn(ActivityEvent._meta.db_table)
+    partition = qn(get_partition_name(start))
+    default_partition = qn(get_default_partition_name())
+    end = add_months(start, 1)
+    creationtime = qn(ActivityEvent._meta.get_field(ActivityEvent.PARTITION_FIELD).column)
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {partition} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {default_partition} WHERE {creationtime} >= %s AND {creationtime} < %s RETURNING *) "
+            f"INSERT INTO {partition} SELECT * FROM moved", [start, end])
+        cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {partition} FOR VALUES FROM (%s) TO (%s)", [start, end])
+    return get_partition_name(start)
+
+
+def create_future_partitions(months_ahead=None, start=None):
+    # Makes sure a partition exists for every month from start (the current month by default) to months_ahead
+    if months_ahead is None:
+        months_ahead = aps.ACTIVITY_EVENTS_PARTITION_MONTHS_AHEAD
+    if not is_activity_events_partitioned():
+        raise ValueError("The activity events table is not partitioned. Run manage_activity_events_partitions --convert first.")
+    existing = {name for name, range_start, range_end in list_partitions()}
+    current = month_start(start or timezone.now())
+    last = add_months(month_start(timezone.now()), months_ahead)
+    created = []
+    while current <= last:
+        if get_partition_name(current) not in existing:
+            created.append(create_partition(current))
+        current = add_months(current, 1)
+    return created
+
+
+def convert_activity_events_to_partitioned(months_ahead=None):
+    # Rebuilds the events table as a table partitioned by creationtime month. PostgreSQL requires
+    # the partition key in every unique constraint, so the primary key becomes (id, creationtime).
+    if months_ahead is None:
+        months_ahead = aps.ACTIVITY_EVENTS_PARTITION_MONTHS_AHEAD
+    connection = get_connection()
+    if connection.vendor != 'postgresql':
+        raise ValueError("Partitioning is only supported on PostgreSQL.")
+    if is_activity_events_partitioned():
+        raise ValueError("The activity events table is already partitioned.")
+
+    db_table = ActivityEvent._meta.db_table
+    qn = connection.ops.quote_name
+    table = qn(db_table)
+    old_table = qn(f'{db_table}_unpartitioned')
+    id_column = qn(ActivityEvent._meta.pk.column)
+    creationtime = qn(ActivityEvent._meta.get_field(ActivityEvent.PARTITION_FIELD).column)
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        # Plain indexes are recreated on the partitioned table, unique ones cannot be
+        cursor.execute("SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexdef NOT LIKE 'CREATE UNIQUE%%'", [db_table])
+        index_definitions = [row[0] for row in cursor.fetchall()]
+        cursor.execute(f"SELECT MIN({creationtime}) FROM {table}")
+        oldest = cursor.fetchone()[0]
+
+        cursor.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(f"ALTER TABLE {table} RENAME TO {old_table}")
+        cursor.execute(f"CREATE TABLE {table} (LIKE {old_table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE ({creationtime})")
+        cursor.execute(f"CREATE TABLE {qn(get_default_partition_name())} PARTITION OF {table} DEFAULT")
+        create_future_partitions(months_ahead, oldest)
+        cursor.execute(f"INSERT INTO {table} SELECT * FROM {old_table}")
+        cursor.execute(f"DROP TABLE {old_table}")
+        # Added once the old table and its primary key index are gone, so the default name is free
+        cursor.execute(f"ALTER TABLE {table} ADD PRIMARY KEY ({id_column}, {creationtime})")
+        for index_definition in index_definitions:
+            cursor.execute(index_definition)
+
+    return {'n_partitions': len(list_partitions()), 'oldest': oldest}
+
+
+def drop_expired_partitions(cutoff_time):
+    # Detaches and drops the partitions entirely older than cutoff_time, subtracting their events
+    # from the facet and rollup counts in the same transaction, with the counts kept for their month
+    connection = get_connection()
+    qn = connection.ops.quote_name
+    table = qn(ActivityEvent._meta.db_table)
+    expired = [(name, range_start, range_end) for name, range_start, range_end in list_partitions() if range_end <= cutoff_time]
+    n_deleted = get_estimated_row_count([name for name, range_start, range_end in expired]) if expired else 0
+    for name, range_start, range_end in expired:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            lock_aggregates()
+            subtract_month_from_facets(range_start.date())
+            subtract_month_from_rollups(range_start.date())
+            cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {qn(name)}")
+            cursor.execute(f"DROP TABLE {qn(name)}")
+    return [name for name, range_start, range_end in expired], n_deleted
@@ -0,0 +1,105 @@
+import os
+import gzip
+import json
+import time
+import uuid
+from datetime import datetime
+from django.db import transaction
+from .models import ActivityEvent
+from .facet_functions import lock_aggregates, subtract_from_facets
+from .rollup_functions import subtract_from_rollups
+from .mapping_plan import MappingPlan
+from . import app_settings as aps
+
+
+def get_purge_archive_path():
+    return os.path.join(aps.MEDIA_ROOT, aps.ACTIVITY_EVENTS_PURGE_ARCHIVE_FOLDER)
+
+
+def iter_pk_chunks(queryset, batch_size):
+    # Keyset pagination over the primary key, so every chunk is an index range scan
+    last_pk = None
+    while True:
+        chunk_queryset = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        pks = list(chunk_queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return
+        last_pk = pks[-1]
+        yield pks
+
+
+def to_archive_record(values):
+    # Archived records have the shape of an API record, so they can be ingested again
+    extra_data = values.pop('extra_data', None) or {}
+    record = {}
+    for field, value in values.items():
+        if field in MappingPlan.MANAGED_FIELDS:
+            continue
+        record[field] = value.isoformat() if isinstance(value, datetime) else value
+    record.update(extra_data)
+    return record
+
+
+def archive_activity_events_chunk(pks, run_id):
+    # Appends the records to one gzip-compressed NDJSON file per creationtime month and run.
+    # Each append is a complete gzip member, so files stay readable if a later chunk fails.
+    records_by_month = {}
+    for values in ActivityEvent.objects.filter(pk__in=pks).order_by('pk').values():
+        month = values['creationtime'].strftime('%Y%m')
+        records_by_month.setdefault(month, []).append(to_archive_record(values))
+
+    for month, records in records_by_month.items():
+        month_path = os.path.join(get_purge_archive_path(), month[:4], month[4:])
+        os.makedirs(month_path, exist_ok=True)
+        file_path = os.path.join(month_path, f'activity_events_{month}_{run_id}.ndjson.gz')
+        with gzip.open(file_path, 'at', encoding='utf-8', compresslevel=aps.ACTIVITY_EVENTS_ARCHIVE_COMPRESSLEVEL) as archive:
+            for record in records:
+                archive.write(json.dumps(record, separators=(',', ':')))
+                archive.write('\n')
+    return len(pks)
+
+
+def archive_old_activity_events(cutoff_time, batch_size=None, run_id=None):
+    # Archives the records older than cutoff_time without deleting them
+    batch_size = batch_size or aps.ACTIVITY_EVENTS_PURGE_BATCH_SIZE
+    run_id = run_id or uuid.uuid4().hex
+    n_archived = 0
+    for pks in iter_pk_chunks(ActivityEvent.objects.filter(creationtime__lt=cutoff_time), batch_size):
+        n_archived += archive_activity_events_chunk(pks, run_id)
+    return n_archived
+
+
+def purge_activity_events(cutoff_time, batch_size=None, sleep_seconds=None, archive=None, progress_callback=None):
+    # Deletes the records older than cutoff_time in short transactions of batch_size records,
+    # pausing between them so that ingestion and the list view are not blocked for long. Each
+    # transaction also subtracts the deleted records from the facet and rollup counts.
+    if batch_size is None:
+        batch_size = aps.ACTIVITY_EVENTS_PURGE_BATCH_SIZE
+    if sleep_seconds is None:
+        sleep_seconds = aps.ACTIVITY_EVENTS_PURGE_SLEEP_SECONDS
+    if archive is None:
+        archive = aps.ACTIVITY_EVENTS_PURGE_ARCHIVE
+    run_id = uuid.uuid4().hex
+
+    queryset = ActivityEvent.objects.filter(creationtime__lt=cutoff_time)
+    n_to_delete = queryset.count()
+    n_deleted = 0
+    n_archived = 0
+    if progress_callback:
+        progress_callback(n_deleted, n_to_delete)
+
+    for pks in iter_pk_chunks(queryset, batch_size):
+        if archive:
+            n_archived += archive_activity_events_chunk(pks, run_id)
+        with transaction.atomic():
+            lock_aggregates()
+            chunk_queryset = ActivityEvent.objects.filter(pk__in=pks)
+            subtract_from_facets(chunk_queryset)
+            subtract_from_rollups(chunk_queryset)
+            n_deleted += chunk_queryset.delete()[0]
+        if progress_callback:
+            progress_callback(n_deleted, n_to_delete)
+        if sleep_seconds:
+            time.sleep(sleep_seconds)
+
+    return {'n_deleted': n_deleted, 'n_archived': n_archived}
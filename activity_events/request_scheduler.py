@@ -0,0 +1,88 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from django.utils import timezone
+from . import app_settings as aps
+
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    # Thread-safe token bucket shared by every fetch window of the process.
+    # A throttled response pauses the whole bucket, not only the thread that received it.
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                rate = aps.ACTIVITY_EVENTS_API_MAX_REQUESTS_PER_HOUR / 3600
+                _rate_limiter = TokenBucket(rate, aps.ACTIVITY_EVENTS_API_BURST)
+    return _rate_limiter
+
+
+def reset_rate_limiter():
+    # Rebuilds the shared bucket from the current settings on next use
+    global _rate_limiter
+    with _rate_limiter_lock:
+        _rate_limiter = None
+
+
+def is_retryable_response(response):
+    # Connection errors and timeouts have no response and are always retried
+    return response is None or response.status_code in RETRYABLE_STATUS_CODES
+
+
+def get_retry_after(response):
+    # Retry-After can be given either in seconds or as an HTTP date
+    if response is None:
+        return None
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0, (parsedate_to_datetime(value) - timezone.now()).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def get_backoff_delay(attempt):
+    # Exponential backoff with full jitter
+    base = aps.ACTIVITY_EVENTS_API_BACKOFF_BASE_SECONDS
+    max_delay = aps.ACTIVITY_EVENTS_API_BACKOFF_MAX_SECONDS
+    return random.uniform(0, min(max_delay, base * 2 ** attempt))
\ No newline at end of file
@@ -0,0 +1,280 @@
+from collections import Counter
+from django.db import connections, router, transaction
+from django.db.models import Q, F, Count, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+from .models import ActivityEvent, ActivityEventField, ActivityEventRollup
+from .facet_functions import to_facet_value, to_partition_month, partition_month_expression, lock_aggregates
+from . import app_settings as aps
+
+BUCKET_GRANULARITIES = (ActivityEventRollup.HOUR, ActivityEventRollup.DAY)
+
+
+def get_connection():
+    return connections[router.db_for_write(ActivityEventRollup)]
+
+
+def is_rollup_store_enabled(target_model=ActivityEvent):
+    return aps.ACTIVITY_EVENTS_ROLLUPS and target_model is ActivityEvent
+
+
+def get_chart_rollup_pairs():
+    # (time_field, fieldname) pairs read by the charts page: every chart datetime field in total
+    # (fieldname '') and by every other chart field
+    chart_fields = list(ActivityEventField.objects.filter(chart=True).values_list('fieldname', flat=True))
+    fields = ActivityEvent.get_filtered_fields_dict(chart_fields)
+    time_fields = [fieldname for fieldname, field_type in fields.items() if field_type == 'DateTimeField']
+    dimensions = [fieldname for fieldname, field_type in fields.items() if field_type != 'DateTimeField']
+    return [(time_field, fieldname) for time_field in time_fields for fieldname in [''] + dimensions]
+
+
+def get_rollup_pairs(target_model=ActivityEvent):
+    # Pairs whose rollups have been built (they have an ALL row); only those are maintained
+    if not is_rollup_store_enabled(target_model):
+        return []
+    return list(ActivityEventRollup.objects.filter(granularity=ActivityEventRollup.ALL).values_list('time_field', 'fieldname'))
+
+
+def to_bucket(value, granularity, current_timezone=None):
+    # Start of the hour or day of value in the current time zone, as TruncHour and TruncDay do
+    value = timezone.localtime(value, current_timezone).replace(minute=0, second=0, microsecond=0)
+    if granularity == ActivityEventRollup.DAY:
+        value = value.replace(hour=0)
+    return value
+
+
+def build_pair_rollups(time_field, fieldname, queryset=None):
+    # Computes the rollups of a pair from the events table, returns (granularity, time_field,
+    # fieldname, bucket, value, month, count) rows; the daily buckets are summed from the hourly
+    # ones, so the events are read once
+    queryset = ActivityEvent.objects.all() if queryset is None else queryset
+    queryset = queryset.filter(**{f'{time_field}__isnull': False}).order_by()
+    group_fields = [fieldname] if fieldname else []
+    current_timezone = timezone.get_current_timezone()
+    hour_counts = Counter()
+    day_counts = Counter()
+    day_buckets = {}
+
+    rows = queryset.annotate(rollup_bucket=TruncHour(time_field), rollup_month=partition_month_expression()).values_list(
+        'rollup_bucket', 'rollup_month', *group_fields).annotate(count=Count('pk'))
+    for row in rows:
+        hour, month = row[0], row[1]
+        value = to_facet_value(row[2]) if fieldname else ''
+        if hour not in day_buckets:
+            day_buckets[hour] = to_bucket(hour, ActivityEventRollup.DAY, current_timezone)
+        hour_counts[(hour, value, month)] += row[-1]
+        day_counts[(day_buckets[hour], value, month)] += row[-1]
+
+    rollups = [(granularity, time_field, fieldname, bucket, value, month, count)
+               for granularity, counts in ((ActivityEventRollup.HOUR, hour_counts), (ActivityEventRollup.DAY, day_counts))
+               for (bucket, value, month), count in sorted(counts.items())]
+    rollups.append((ActivityEventRollup.ALL, time_field, fieldname, None, '', None, sum(day_counts.values())))
+    return rollups
+
+
+def sum_rollup_months(rollups):
+    # Adds up the months of every bucket, returns (granularity, time_field, fieldname, bucket, value, count) rows
+    counts = Counter()
+    for granularity, time_field, fieldname, bucket, value, month, count in rollups:
+        counts[(granularity, time_field, fieldname, bucket, value)] += count
+    return [(*key, count) for key, count in counts.items()]
+
+
+def insert_rollups(rollups):
+    # Multi-row INSERT statements, much cheaper than bulk_create or a statement per row for the
+    # number of rows of a rebuild
+    connection = get_connection()
+    table = connection.ops.quote_name(ActivityEventRollup._meta.db_table)
+    adapt = connection.ops.adapt_datetimefield_value
+    adapt_month = connection.ops.adapt_datefield_value
+    now = adapt(timezone.now())
+    columns = ['granularity', 'time_field', 'fieldname', 'bucket', 'value', 'month', 'count', 'updated_at']
+    fields = [ActivityEventRollup._meta.get_field(column) for column in columns]
+    batch_size = min(connection.ops.bulk_batch_size(fields, rollups) or 1, 1000)
+    row_placeholder = f"({', '.join(['%s'] * len(columns))})"
+
+    with connection.cursor() as cursor:
+        for i in range(0, len(rollups), batch_size):
+            batch = rollups[i:i + batch_size]
+            params = [param for granularity, time_field, fieldname, bucket, value, month, count in batch
+                      for param in (granularity, time_field, fieldname, adapt(bucket), value, adapt_month(month), count, now)]
+            cursor.execute(f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join([row_placeholder] * len(batch))}", params)
+
+
+def rebuild_rollups(pairs=None):
+    # Recomputes the rollups of the given pairs, by default of every pair read by the charts page,
+    # in which case the rollups of pairs no longer charted are removed
+    remove_others = pairs is None
+    if pairs is None:
+        pairs = get_chart_rollup_pairs()
+    n_rows = 0
+
+    with transaction.atomic(using=get_connection().alias):
+        lock_aggregates()
+        for time_field, fieldname in pairs:
+            rollups = build_pair_rollups(time_field, fieldname)
+            ActivityEventRollup.objects.filter(time_field=time_field, fieldname=fieldname).delete()
+            insert_rollups(rollups)
+            n_rows += len(rollups) - 1
+        if remove_others:
+            kept = Q(pk__in=[])
+            for time_field, fieldname in pairs:
+                kept |= Q(time_field=time_field, fieldname=fieldname)
+            ActivityEventRollup.objects.exclude(kept).delete()
+
+    return {'rollup_pairs': [f'{time_field}/{fieldname}' if fieldname else time_field for time_field, fieldname in pairs], 'n_rows': n_rows}
+
+
+def get_rollup_fields(pairs):
+    return sorted({time_field for time_field, fieldname in pairs} | {fieldname for time_field, fieldname in pairs if fieldname})
+
+
+def snapshot_rollup_values(pks, pairs):
+    # Current values of the rollup fields and creationtime of the given events, {pk: {fieldname: value}}
+    if not pks or not pairs:
+        return {}
+    fields = sorted({*get_rollup_fields(pairs), ActivityEvent.PARTITION_FIELD})
+    rows = ActivityEvent.objects.filter(pk__in=list(pks)).order_by().values_list('pk', *fields)
+    return {row[0]: dict(zip(fields, row[1:])) for row in rows}
+
+
+def update_rollups(pairs, old_values, new_values):
+    # Applies the changes between two snapshots of the written events (missing from old_values when
+    # created): each event is removed from the buckets of its old values and added to the new ones
+    bucket_deltas = Counter()
+    total_deltas = Counter()
+    current_timezone = timezone.get_current_timezone()
+
+    for pk, new in new_values.items():
+        old = old_values.get(pk)
+        if old == new:
+            continue
+        for values, sign in ((old, -1), (new, 1)):
+            if values is None:
+                continue
+            month = to_partition_month(values[ActivityEvent.PARTITION_FIELD])
+            for time_field, fieldname in pairs:
+                time_value = values[time_field]
+                if time_value is None:
+                    continue
+                value = to_facet_value(values[fieldname]) if fieldname else ''
+                total_deltas[(time_field, fieldname)] += sign
+                for granularity in BUCKET_GRANULARITIES:
+                    bucket_deltas[(granularity, time_field, fieldname, to_bucket(time_value, granularity, current_timezone), value, month)] += sign
+
+    apply_rollup_deltas(bucket_deltas, total_deltas)
+
+
+def apply_rollup_deltas(bucket_deltas, total_deltas):
+    # Increments the stored counts in a single statement per row, so concurrent ingestion
+    # workers never overwrite each other's counts
+    connection = get_connection()
+    qn = connection.ops.quote_name
+    table = qn(ActivityEventRollup._meta.db_table)
+    adapt = connection.ops.adapt_datetimefield_value
+    adapt_month = connection.ops.adapt_datefield_value
+    now = adapt(timezone.now())
+
+    params = [(granularity, time_field, fieldname, adapt(bucket), value, adapt_month(month), delta, now)
+              for (granularity, time_field, fieldname, bucket, value, month), delta in bucket_deltas.items() if delta]
+    if not params and not any(total_deltas.values()):
+        return
+    # Rows are always locked in the same order, so that concurrent batches cannot deadlock
+    params.sort(key=lambda row: row[:6])
+
+    sql = (
+        f"INSERT INTO {table} (granularity, time_field, fieldname, bucket, value, month, count, updated_at) VALUES (%s, %s, %s, %s, %s, %s, %s, %s) "
+        f"ON CONFLICT (granularity, time_field, fieldname, bucket, value, month) DO UPDATE SET count = {table}.count + EXCLUDED.count, "
+        f"updated_at = EXCLUDED.updated_at"
+    )
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        if params:
+            cursor.executemany(sql, params)
+            # Buckets without any event left
+            cursor.executemany(
+                f"DELETE FROM {table} WHERE granularity = %s AND time_field = %s AND fieldname = %s AND bucket = %s AND value = %s AND month = %s AND count <= 0",
+                [row[:6] for row in params if row[6] < 0])
+        for (time_field, fieldname), delta in sorted(total_deltas.items()):
+            if delta:
+                ActivityEventRollup.objects.filter(granularity=ActivityEventRollup.ALL, time_field=time_field, fieldname=fieldname).update(
+                    count=F('count') + delta, updated_at=timezone.now())
+
+
+def subtract_from_rollups(queryset):
+    # Called by the retention, in the transaction deleting the events of queryset, after lock_aggregates()
+    pairs = get_rollup_pairs()
+    if not pairs:
+        return
+    bucket_deltas = Counter()
+    total_deltas = Counter()
+    for time_field, fieldname in pairs:
+        for granularity, time_field, fieldname, bucket, value, month, count in build_pair_rollups(time_field, fieldname, queryset):
+            if granularity == ActivityEventRollup.ALL:
+                total_deltas[(time_field, fieldname)] -= count
+            else:
+                bucket_deltas[(granularity, time_field, fieldname, bucket, value, month)] -= count
+    apply_rollup_deltas(bucket_deltas, total_deltas)
+
+
+def subtract_month_from_rollups(month):
+    # Called by the retention before the partition of month is dropped, after lock_aggregates():
+    # the daily counts of the month are subtracted from the totals, without reading its events
+    month_counts = ActivityEventRollup.objects.filter(granularity=ActivityEventRollup.DAY, month=month).values_list(
+        'time_field', 'fieldname').annotate(count=Sum('count')).order_by('time_field', 'fieldname')
+    for time_field, fieldname, count in list(month_counts):
+        ActivityEventRollup.objects.filter(granularity=ActivityEventRollup.ALL, time_field=time_field, fieldname=fieldname).update(
+            count=F('count') - count, updated_at=timezone.now())
+    ActivityEventRollup.objects.filter(month=month).delete()
+
+
+def shift_rollups(rollups, granularities, tzinfo):
+    # Cuts hourly rollups into the buckets of tzinfo, returns None when tzinfo is not a whole number
+    # of hours away from the hours of the rollups
+    counts = Counter()
+    for _, time_field, fieldname, bucket, value, count in rollups:
+        if timezone.localtime(bucket, tzinfo).minute:
+            return None
+        for granularity in granularities:
+            counts[(granularity, time_field, fieldname, to_bucket(bucket, granularity, tzinfo), value)] += count
+    return [(*key, count) for key, count in counts.items()]
+
+
+def get_rollup_series(pairs, since, granularities=BUCKET_GRANULARITIES, tzinfo=None):
+    # Returns {(time_field, fieldname): {granularity: [[bucket, value, count], ...]}} for the buckets
+    # from since on, the value being None for the totals. Pairs requested for the first time are
+    # built beforehand. The buckets are cut in tzinfo, by default in the current time zone the
+    # rollups are stored in; in another time zone they are summed from the hourly rollups, or
+    # computed from the events when it is not a whole number of hours away.
+    stored_timezone = timezone.get_current_timezone()
+    tzinfo = tzinfo or stored_timezone
+    series = {pair: {granularity: [] for granularity in granularities} for pair in pairs}
+    rollups = None
+
+    if is_rollup_store_enabled():
+        built = set(get_rollup_pairs())
+        missing = [pair for pair in pairs if pair not in built]
+        if missing:
+            rebuild_rollups(missing)
+        is_stored_timezone = str(tzinfo) == str(stored_timezone)
+        # In another time zone, the hours from the start of the first bucket of every granularity
+        stored_since = {granularity: to_bucket(since, granularity, tzinfo) for granularity in granularities}
+        if not is_stored_timezone:
+            stored_since = {ActivityEventRollup.HOUR: min(stored_since.values())}
+        condition = Q(pk__in=[])
+        for time_field, fieldname in pairs:
+            for granularity, since_bucket in stored_since.items():
+                condition |= Q(granularity=granularity, time_field=time_field, fieldname=fieldname, bucket__gte=since_bucket)
+        rollups = ActivityEventRollup.objects.filter(condition).values_list('granularity', 'time_field', 'fieldname', 'bucket', 'value').annotate(
+            count=Sum('count')).order_by('granularity', 'time_field', 'fieldname', 'bucket', 'value')
+        if not is_stored_timezone:
+            rollups = shift_rollups(rollups, granularities, tzinfo)
+
+    if rollups is None:
+        with timezone.override(tzinfo):
+            rollups = sum_rollup_months(rollup for time_field, fieldname in pairs
+                                        for rollup in build_pair_rollups(time_field, fieldname, ActivityEvent.objects.filter(**{f'{time_field}__gte': since}))
+                                        if rollup[0] in granularities)
+
+    for granularity, time_field, fieldname, bucket, value, count in rollups:
+        series[(time_field, fieldname)][granularity].append([bucket, value if fieldname else None, count])
+    return series
@@ -0,0 +1,172 @@
+import hashlib
+from zoneinfo import ZoneInfo
+from django.core.cache import cache
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from .models import ActivityEvent, ActivityEventField
+from .purge_functions import iter_pk_chunks
+from . import app_settings as aps
+
+UTC = ZoneInfo('UTC')
+
+# Trigram indexes cannot serve shorter search terms, those fall back to icontains
+SEARCH_MIN_LENGTH = 3
+# Separates the field values in the search text, so that a term never matches across two fields
+SEARCH_TEXT_SEPARATOR = '\n'
+# Fixed width, so that creationtime strings of the FTS5 table compare chronologically
+SEARCH_TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+SEARCH_REBUILD_PENDING_KEY = 'activity_events:search_rebuild_pending'
+# Whether the shadow table exists is checked by every ingestion batch and search request
+SEARCH_INDEX_EXISTS_KEY = 'activity_events:search_index_exists'
+SEARCH_INDEX_EXISTS_TIMEOUT = 300
+
+
+def get_connection():
+    return connections[router.db_for_write(ActivityEvent)]
+
+
+def get_search_table():
+    return f'{ActivityEvent._meta.db_table}_search'
+
+
+def get_search_fields():
+    search_fields = ActivityEventField.objects.filter(search=True).values_list('fieldname', flat=True)
+    return list(ActivityEvent.get_filtered_fields_dict(list(search_fields)))
+
+
+def search_index_exists():
+    exists = cache.get(SEARCH_INDEX_EXISTS_KEY)
+    if exists is None:
+        connection = get_connection()
+        with connection.cursor() as cursor:
+            exists = get_search_table() in connection.introspection.table_names(cursor)
+        cache.set(SEARCH_INDEX_EXISTS_KEY, exists, SEARCH_INDEX_EXISTS_TIMEOUT)
+    return exists
+
+
+def clear_search_index_exists_cache():
+    cache.delete(SEARCH_INDEX_EXISTS_KEY)
+
+
+def is_search_index_enabled(target_model=ActivityEvent):
+    return aps.ACTIVITY_EVENTS_SEARCH_INDEX and target_model is ActivityEvent and search_index_exists()
+
+
+def get_search_rowid(pk):
+    # Stable FTS5 rowid for an event id (SQLite may renumber the rowids of the events table on VACUUM)
+    return int.from_bytes(hashlib.blake2b(pk.encode('utf-8'), digest_size=8).digest(), 'big') & 0x7FFFFFFFFFFFFFFF
+
+
+def create_search_index():
+    # PostgreSQL: shadow table with a GIN trigram index, which serves LIKE '%term%'.
+    # SQLite: FTS5 shadow table with the trigram tokenizer, which matches substrings.
+    connection = get_connection()
+    qn = connection.ops.quote_name
+    table = qn(get_search_table())
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} (id varchar(60) PRIMARY KEY, creationtime timestamp with time zone, search_text text NOT NULL)")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {qn(get_search_table() + '_creationtime')} ON {table} (creationtime)")
+            create_trigram_index(cursor, qn)
+        elif connection.vendor == 'sqlite':
+            cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(search_text, id UNINDEXED, creationtime UNINDEXED, tokenize='trigram')")
+        else:
+            raise ValueError("The search index is only supported on PostgreSQL and SQLite.")
+    clear_search_index_exists_cache()
+
+
+def create_trigram_index(cursor, qn):
+    # pg_trgm ships with the PostgreSQL contrib modules (included in the postgres Docker images)
+    cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {qn(get_search_table() + '_trgm')} ON {qn(get_search_table())} USING gin (search_text gin_trgm_ops)")
+
+
+def drop_search_index():
+    connection = get_connection()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {connection.ops.quote_name(get_search_table())}")
+    clear_search_index_exists_cache()
+
+
+def update_search_index(pks, search_fields=None):
+    # Writes the search text of the given events, built from the fields currently flagged for search
+    if not pks:
+        return 0
+    if search_fields is None:
+        search_fields = get_search_fields()
+    connection = get_connection()
+    qn = connection.ops.quote_name
+    table = qn(get_search_table())
+    pks = list(pks)
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # Built in the database, in a single statement
+            main_table = qn(ActivityEvent._meta.db_table)
+            columns = ', '.join(f'{qn(ActivityEvent._meta.get_field(field).column)}::text' for field in search_fields) or "''"
+            cursor.execute(
+                f"INSERT INTO {table} (id, creationtime, search_text) "
+                f"SELECT {qn(ActivityEvent._meta.pk.column)}, {qn(ActivityEvent._meta.get_field(ActivityEvent.PARTITION_FIELD).column)}, "
+                f"lower(concat_ws(%s, {columns})) FROM {main_table} WHERE {qn(ActivityEvent._meta.pk.column)} = ANY(%s) "
+                f"ON CONFLICT (id) DO UPDATE SET creationtime = EXCLUDED.creationtime, search_text = EXCLUDED.search_text",
+                [SEARCH_TEXT_SEPARATOR, pks])
+        else:
+            rows = ActivityEvent.objects.filter(pk__in=pks).values_list('pk', ActivityEvent.PARTITION_FIELD, *search_fields)
+            params = [
+                (get_search_rowid(row[0]), SEARCH_TEXT_SEPARATOR.join('' if value is None else str(value) for value in row[2:]).lower(),
+                 row[0], row[1].strftime(SEARCH_TIME_FORMAT))
+                for row in rows
+            ]
+            cursor.executemany(f"DELETE FROM {table} WHERE rowid = %s", [(params_row[0],) for params_row in params])
+            cursor.executemany(f"INSERT INTO {table} (rowid, search_text, id, creationtime) VALUES (%s, %s, %s, %s)", params)
+    return len(pks)
+
+
+def remove_old_from_search_index(cutoff_time):
+    # Entries of deleted events never match (searches are joined on the events table), they are
+    # removed by the retention task to keep the shadow table small
+    connection = get_connection()
+    table = connection.ops.quote_name(get_search_table())
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f"DELETE FROM {table} WHERE creationtime < %s", [cutoff_time])
+        else:
+            cursor.execute(f"DELETE FROM {table} WHERE creationtime < %s", [cutoff_time.astimezone(UTC).strftime(SEARCH_TIME_FORMAT)])
+
+
+def rebuild_search_index(batch_size=None):
+    # Creates the shadow table if needed and rewrites every entry in place with the current
+    # search flags, so searches keep working while the rebuild runs
+    batch_size = batch_size or aps.ACTIVITY_EVENTS_PURGE_BATCH_SIZE
+    create_search_index()
+    search_fields = get_search_fields()
+    n_indexed = 0
+    for pks in iter_pk_chunks(ActivityEvent.objects.all(), batch_size):
+        n_indexed += update_search_index(pks, search_fields)
+    return {'n_indexed': n_indexed, 'search_fields': search_fields}
+
+
+def get_search_index_filter(target_model, value):
+    # Returns a filter on the ids matched by the search index, or None when the search
+    # has to use icontains instead
+    if len(value) < SEARCH_MIN_LENGTH or not is_search_index_enabled(target_model):
+        return None
+    connection = get_connection()
+    table = connection.ops.quote_name(get_search_table())
+    if connection.vendor == 'postgresql':
+        term = value.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        sql = f"SELECT id FROM {table} WHERE search_text LIKE %s ESCAPE '\\'"
+        params = [f'%{term}%']
+    else:
+        # A quoted phrase of trigrams matches the term as a substring
+        sql = f"SELECT id FROM {table} WHERE {table} MATCH %s"
+        params = ['"' + value.replace('"', '""') + '"']
+    return Q(pk__in=RawSQL(sql, params))
+
+
+def schedule_search_index_rebuild():
+    # Called when search flags change; several changes saved together trigger a single rebuild
+    from .tasks import rebuild_search
+    if cache.add(SEARCH_REBUILD_PENDING_KEY, True, timeout=60):
+        rebuild_search.apply_async(countdown=10)
@@ -4,4 +4,15 @@ from .models import ActivityEvent
 class ActivityEventSerializer(serializers.ModelSerializer):
     class Meta:
         model = ActivityEvent
-        fields = '__all__'
\ No newline at end of file
+        exclude = ActivityEvent.API_EXCLUDED_FIELDS
+
+    def __init__(self, *args, fields=None, **kwargs):
+        # Optional projection, returned in the order of the given field names
+        self.projection = fields
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.projection is None:
+            return fields
+        return {name: fields[name] for name in self.projection}
\ No newline at end of file
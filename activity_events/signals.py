@@ -0,0 +1,41 @@
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import ActivityEventField, ActivityEventFacet, ActivityEventRollup
+from .search_functions import schedule_search_index_rebuild, search_index_exists
+from . import app_settings as aps
+
+
+@receiver(pre_save, sender=ActivityEventField)
+def remember_search_flag(sender, instance, **kwargs):
+    instance._previous_search = sender.objects.filter(pk=instance.pk).values_list('search', flat=True).first() if instance.pk else None
+
+
+@receiver([post_save, post_delete], sender=ActivityEventField)
+def rebuild_search_index_on_flag_change(sender, instance, **kwargs):
+    # The search text is built from the flagged fields, so it is rebuilt when the flags change
+    if not aps.ACTIVITY_EVENTS_SEARCH_INDEX:
+        return
+    if kwargs.get('signal') is post_delete:
+        changed = instance.search
+    else:
+        changed = bool(instance.search) != bool(getattr(instance, '_previous_search', None))
+    if changed and search_index_exists():
+        transaction.on_commit(schedule_search_index_rebuild)
+
+
+@receiver([post_save, post_delete], sender=ActivityEventField)
+def remove_facets_on_flag_change(sender, instance, **kwargs):
+    # Facets are only maintained for fields flagged for filter or chart; newly flagged fields
+    # are built the first time they are read
+    if kwargs.get('signal') is post_delete or not (instance.filter or instance.chart):
+        ActivityEventFacet.objects.filter(fieldname=instance.fieldname).delete()
+
+
+@receiver([post_save, post_delete], sender=ActivityEventField)
+def remove_rollups_on_flag_change(sender, instance, **kwargs):
+    # Rollups are only maintained for fields flagged for chart; newly flagged fields are built
+    # the first time the charts page is read
+    if kwargs.get('signal') is post_delete or not instance.chart:
+        ActivityEventRollup.objects.filter(Q(time_field=instance.fieldname) | Q(fieldname=instance.fieldname)).delete()
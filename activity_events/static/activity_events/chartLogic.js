@@ -9,6 +9,78 @@ const sourceData = JSON.parse(document.getElementById('chart-data').textContent)
 let datetimeCharts = {};
 let charChart;
 
+// Requests of the series already loaded or loading, by time field, granularity and field
+const seriesRequests = {};
+
+// Columns of the series rows: [bucket, value, count]
+const BUCKET_COLUMN = 0;
+const VALUE_COLUMN = 1;
+const COUNT_COLUMN = 2;
+
+// Time zone the axes are rendered in; the buckets of the series are cut in it too, so that the
+// weeks, months and years summed from the daily rows start at the local midnight
+const timeZone = Intl.DateTimeFormat().resolvedOptions().timeZone;
+
+//////////////////////////////
+
+/**
+ * Loads the rows of a series from the chart series endpoint, bucketed in the time zone of the browser. Each series
+ * is requested once, so the charts only download the series they display, and the requests of different charts run concurrently.
+ * @param {string} timeField - The datetime field of the series ('' when there is no datetime field).
+ * @param {string} datetimeLevel - The level of datetime granularity; hourly rows are used for 'hour', daily rows otherwise.
+ * @param {string} fieldname - The field the series is broken down by ('' for the total number of events).
+ * @returns {Promise<Array<Array>|undefined>} The rows of the series, each as [bucket, value, count].
+ */
+
+function getSeriesRows(timeField, datetimeLevel, fieldname) {
+    const granularity = datetimeLevel === 'hour' ? 'hour' : 'day';
+    const key = [timeField, granularity, fieldname].join('|');
+
+    if (!seriesRequests[key]) {
+        const params = new URLSearchParams({ time_field: timeField, fieldname: fieldname, granularity: granularity });
+        if (timeZone) {
+            params.set('tz', timeZone);
+        }
+        seriesRequests[key] = fetch(`${sourceData.series_url}?${params}`)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`Series request failed with status ${response.status}.`);
+                }
+                return response.json();
+            })
+            .then(series => series.rows)
+            .catch(error => {
+                // Requested again on the next update
+                delete seriesRequests[key];
+                console.error(error);
+                return undefined;
+            });
+    }
+    return seriesRequests[key];
+}
+
+//////////////////////////////
+
+/**
+ * Calls a function once the element is visible, so that the series of the charts below the fold are not loaded upfront.
+ * @param {HTMLElement} element - The element to observe.
+ * @param {Function} callback - The function called when the element becomes visible.
+ */
+
+function whenVisible(element, callback) {
+    if (typeof IntersectionObserver === 'undefined') {
+        callback();
+        return;
+    }
+    const observer = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) {
+            observer.disconnect();
+            callback();
+        }
+    }, { rootMargin: '200px' });
+    observer.observe(element);
+}
+
 //////////////////////////////
 
 /**
@@ -28,9 +100,10 @@ function updateDateTimeChartOptions(chart, datetimeLevel) {
 /**
  * Updates the datetime chart based on user selections for time unit, legend, and date range.
  * @param {string} fieldname - The identifier used to locate relevant UI elements and update the chart.
+ * @returns {Promise<void>} Resolved once the chart is updated.
  */
 
-function updateDateTimeChart(fieldname) {
+async function updateDateTimeChart(fieldname) {
     const timeunitSelector = document.getElementById(`${fieldname}-time-unit-selector`);
     if (!timeunitSelector) {
         console.error(`Time unit selector for ${fieldname} not found.`);
@@ -57,21 +130,22 @@ function updateDateTimeChart(fieldname) {
 
     const datetimeChart = datetimeCharts[fieldname];
 
-    const mappedAttributes = datetimeChart?.mappedAttributes;
-    if (!mappedAttributes) {
+    if (!datetimeChart?.mappedAttributes) {
         console.error(`Mapped fields for ${fieldname} not found.`);
         return;
     }
 
+    const mappedAttributes = { ...datetimeChart.mappedAttributes };
     const datetimeLevel = timeunitSelector.value;    
     const groupKeys = [];
     const legendStrValue = legendSelector.value;
+    let legendField = '';
 
     if (legendStrValue === "") {
         delete mappedAttributes.legend;
     } else {
-        const legendValue = Number(legendStrValue);
-        mappedAttributes.legend = legendValue;
+        legendField = sourceData.fields[Number(legendStrValue)];
+        mappedAttributes.legend = VALUE_COLUMN;
         groupKeys.push('legend');
     }
 
@@ -81,10 +155,16 @@ function updateDateTimeChart(fieldname) {
     let endDate = dateFns.parseISO(endDateInput.value);
     endDate = endDate.toString() === 'Invalid Date' ? "" : dateFns.endOfDay(endDate);
 
-    const data = sourceData?.dataset;
+    // Responses of earlier selections arriving after this one are ignored
+    const requestId = (datetimeChart.requestId || 0) + 1;
+    datetimeChart.requestId = requestId;
+    const data = await getSeriesRows(fieldname, datetimeLevel, legendField);
+    if (datetimeChart.requestId !== requestId) {
+        return;
+    }
     if (!data) {
         console.error('Source data is undefined or invalid.');
-        return null;
+        return;
     }
     const reducedData = extractMappedAttributes(data, mappedAttributes);
     const filteredData = (startDate || endDate) ? filterData(reducedData, undefined, { 'x': { 'start': startDate, 'end': endDate } }) : reducedData;
@@ -115,8 +195,9 @@ function updateDateTimeChart(fieldname) {
  * Updates the character chart based on selected field, date range, and sort direction. 
  * This function retrieves the user's input from the UI elements (field selector, start date, end date, 
  * and sort direction) and uses these values to filter, aggregate, sort, and update the chart data.
+ * @returns {Promise<void>} Resolved once the chart is updated.
  */
-function updateCharChart() {
+async function updateCharChart() {
     // Retrieve and validate UI elements
     const fieldSelector = document.getElementById('charfield-selector');
     if (!fieldSelector) {
@@ -142,14 +223,14 @@ function updateCharChart() {
 
     // Retrieve the chart and its mapped attributes
     const chart = charChart;
-    const mappedAttributes = chart?.mappedAttributes;
-    if (!mappedAttributes) {
+    if (!chart?.mappedAttributes) {
         console.error('Mapped fields for chart not found.');
         return;
     }
+    const mappedAttributes = { ...chart.mappedAttributes };
 
-    // Update mapped attributes based on selected field
-    mappedAttributes.label = fieldSelector.value;
+    // Series of the selected field
+    const fieldIndex = Number(fieldSelector.value);
    
     // Parse and validate date inputs
     let startDate = dateFns.parseISO(startDateInput.value);
@@ -160,13 +241,22 @@ function updateCharChart() {
 
     // Update date field in mapped attributes if dates are valid
     if (startDate || endDate) {
-        mappedAttributes.date = sourceData.fieldtypes.indexOf('DateTimeField');
+        mappedAttributes.date = BUCKET_COLUMN;
     } else {
         delete mappedAttributes.date;
     }
 
-    // Extract, filter, aggregate, and sort data
-    const data = sourceData.dataset;
+    // Extract, filter, aggregate, and sort data; responses of earlier selections arriving after this one are ignored
+    const requestId = (chart.requestId || 0) + 1;
+    chart.requestId = requestId;
+    const data = await getCharFieldRows(fieldIndex);
+    if (chart.requestId !== requestId) {
+        return;
+    }
+    if (!data) {
+        console.error('Source data is undefined or invalid.');
+        return;
+    }
     const reducedData = extractMappedAttributes(data, mappedAttributes);
     const filteredData = (startDate || endDate) 
         ? filterData(reducedData, undefined, { date: { start: startDate, end: endDate } }) 
@@ -183,7 +273,7 @@ function updateCharChart() {
     
     // Generate new dataset and update the chart
     const color = pickColor(colorPalette.slice(), true);
-    const displayname = sourceData.displaynames[mappedAttributes['label']];
+    const displayname = sourceData.displaynames[fieldIndex];
     const dataset = createDataset(values, 'Activity Events by ' + displayname, color);
     chart.data = { labels, datasets: [dataset] };
     chart.mappedAttributes = mappedAttributes;
@@ -193,7 +283,7 @@ function updateCharChart() {
 //////////////////////////////
 
 /**
- * Initializes a datetime chart with default settings and data.
+ * Initializes an empty datetime chart with default settings.
  * @param {string} fieldname - The identifier for the chart.
  * @param {Object} mappedAttributes - Attributes used for mapping data.
  * @param {string} datetimeLevel - The level of datetime granularity for the chart.
@@ -208,21 +298,9 @@ function initializeDateTimeChart(fieldname, mappedAttributes, datetimeLevel) {
     }
 
     const ctx = canvasElement.getContext('2d');
-    const data = sourceData?.dataset;
-    if (!data) {
-        console.error('Source data is undefined or invalid.');
-        return null;
-    }
 
-    // Process data and create chart
-    const reducedData = extractMappedAttributes(data, mappedAttributes);
-    const aggregatedData = aggregateByAttributes(reducedData, 'y', [], { 'x': datetimeLevel });
-    const sortedData = sortDataByDateField(aggregatedData, 'x');    
-    const color = pickColor(colorPalette.slice(), false);        
-    const dataset = createDataset(sortedData, 'Activity Events', color);
-    const chartData = { datasets: [dataset] };
-
-    // Create the chart
+    // Create an empty chart
+    const chartData = { datasets: [] };
     const datetimeChart = createLineChart(ctx, chartData, datetimeLevel, datetimeFormats, datetimeFormats[datetimeLevel]);
 
     // Explicitly set the mappedAttributes
@@ -234,7 +312,21 @@ function initializeDateTimeChart(fieldname, mappedAttributes, datetimeLevel) {
 //////////////////////////////
 
 /**
- * Initializes a char chart with mapped attributes and default settings.
+ * Returns the daily rows of a field broken down by value, for the first datetime field.
+ * @param {number} fieldIndex - The index of the field in the source data fields.
+ * @returns {Promise<Array<Array>|undefined>} The rows of the series, each as [bucket, value, count].
+ */
+
+function getCharFieldRows(fieldIndex) {
+    const { fieldtypes, fields } = sourceData;
+    const timeField = fieldtypes.includes('DateTimeField') ? fields[fieldtypes.indexOf('DateTimeField')] : '';
+    return getSeriesRows(timeField, 'day', fields[fieldIndex]);
+}
+
+//////////////////////////////
+
+/**
+ * Initializes an empty char chart with mapped attributes and default settings.
  * 
  * @param {Object} mappedAttributes - Attributes used to map and extract data.
  * @returns {Object|null} The initialized chart object or null if initialization fails.
@@ -250,28 +342,8 @@ function initializeCharChart(mappedAttributes) {
     // Get the canvas context
     const ctx = canvasElement.getContext('2d');
 
-    // Retrieve and validate source data
-    const data = sourceData?.dataset;
-    if (!data) {
-        console.error('Source data is undefined or invalid.');
-        return null;
-    }
-
-    // Process data: extract, aggregate, and prepare labels and values
-    const reducedData = extractMappedAttributes(data, mappedAttributes);
-    const aggregatedData = aggregateByAttributes(reducedData, 'value', ['label']);
-    const labels = aggregatedData.map(item => item.label);
-    const values = aggregatedData.map(item => item.value);
-
-    // Generate chart dataset
-    const color = pickColor(colorPalette.slice(), true);
-    const displayname = sourceData.displaynames[mappedAttributes['label']];
-    const dataset = createDataset(values, 'Activity Events by ' + displayname, color);
-
-    // Define chart data structure
-    const chartData = { labels, datasets: [dataset] };
-
-    // Create and return the bar chart
+    // Create an empty chart
+    const chartData = { labels: [], datasets: [] };
     const cChart = createBarChart(ctx, chartData);
     cChart.mappedAttributes = mappedAttributes;
 
@@ -281,16 +353,20 @@ function initializeCharChart(mappedAttributes) {
 //////////////////////////////
 
 /**
- * Initializes charts by setting up event listeners and creating chart instances.
+ * Initializes charts by setting up event listeners and creating chart instances. The series of each chart
+ * are loaded when it becomes visible.
  */
 function initializeCharts() {
     const { fieldtypes, fields } = sourceData;
 
     fields.forEach((field, n) => {
         if (fieldtypes[n] === 'DateTimeField') {
-            const mappedAttributes = { 'x': n, 'y': fields.length - 1 };
+            const mappedAttributes = { 'x': BUCKET_COLUMN, 'y': COUNT_COLUMN };
             const datetimeChart = initializeDateTimeChart(field, mappedAttributes, 'day');
             datetimeCharts[field] = datetimeChart;
+            if (datetimeChart) {
+                whenVisible(document.getElementById(field + '-canvas'), () => updateDateTimeChart(field));
+            }
 
             // Setup event listeners for all relevant inputs
             ['time-unit-selector', 'legend-selector', 'start-date-input', 'end-date-input'].forEach(type => {
@@ -326,9 +402,11 @@ function initializeCharts() {
             });
         }
 
-        const index = fieldtypes.indexOf('CharField');
-        const mappedAttributes = {label: index, value: fields.length - 1 };
+        const mappedAttributes = { label: VALUE_COLUMN, value: COUNT_COLUMN };
         charChart = initializeCharChart(mappedAttributes);
+        if (charChart) {
+            whenVisible(document.getElementById('charfield-canvas'), updateCharChart);
+        }
     }
 }
 
@@ -0,0 +1,112 @@
+import io
+import csv
+import json
+from django.utils import timezone
+from .models import ActivityEvent
+from . import app_settings as aps
+
+STREAM_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def get_stream_fields(fields_param, target_model=ActivityEvent):
+    # Comma-separated projection of the fields param, by default all concrete fields but the
+    # excluded ones, in the order of the ModelSerializer (primary key first)
+    pk_name = target_model._meta.pk.name
+    excluded = getattr(target_model, 'API_EXCLUDED_FIELDS', ())
+    model_fields = [pk_name] + [field.name for field in target_model._meta.concrete_fields if field.name not in (pk_name, *excluded)]
+    if not fields_param:
+        return model_fields
+    fields = [field.strip() for field in fields_param.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in model_fields]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}.")
+    return list(dict.fromkeys(fields))
+
+
+def get_datetime_formatter():
+    # Same representation as the REST framework serializers; the current time zone is
+    # resolved once instead of for every value
+    current_timezone = timezone.get_current_timezone()
+
+    def format_datetime(value):
+        value = value.astimezone(current_timezone).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+
+    return format_datetime
+
+
+def get_value_converters(fields, target_model=ActivityEvent, json_fields_as_text=False):
+    # (index, converter) of the values that are not written as they are
+    converters = []
+    format_datetime = get_datetime_formatter()
+    for i, fieldname in enumerate(fields):
+        field_type = target_model._meta.get_field(fieldname).get_internal_type()
+        if field_type == 'DateTimeField':
+            converters.append((i, format_datetime))
+        elif field_type == 'JSONField' and json_fields_as_text:
+            converters.append((i, lambda value: json.dumps(value, separators=(',', ':'))))
+    return converters
+
+
+def iter_rows(queryset, fields, converters, chunk_size):
+    # values_list with iterator() reads through a server-side cursor on PostgreSQL (and in
+    # fetchmany batches elsewhere), so memory use does not grow with the number of rows
+    for row in queryset.values_list(*fields).iterator(chunk_size=chunk_size):
+        if converters:
+            row = list(row)
+            for i, convert in converters:
+                if row[i] is not None:
+                    row[i] = convert(row[i])
+        yield row
+
+
+def to_api_records(rows, fields):
+    # Builds the records of the API from values_list() rows starting with the given fields, with
+    # the same representation as ActivityEventSerializer but without a model instance and a
+    # field serializer per value
+    converters = get_value_converters(fields)
+    n_fields = len(fields)
+    records = []
+    for row in rows:
+        values = list(row[:n_fields])
+        for i, convert in converters:
+            if values[i] is not None:
+                values[i] = convert(values[i])
+        records.append(dict(zip(fields, values)))
+    return records
+
+
+def iter_ndjson(queryset, fields, chunk_size=None):
+    chunk_size = chunk_size or aps.ACTIVITY_EVENTS_STREAM_CHUNK_SIZE
+    converters = get_value_converters(fields)
+    lines = []
+    for row in iter_rows(queryset, fields, converters, chunk_size):
+        lines.append(json.dumps(dict(zip(fields, row)), separators=(',', ':')))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def iter_csv(queryset, fields, chunk_size=None):
+    # Same dialect as the CSV export
+    chunk_size = chunk_size or aps.ACTIVITY_EVENTS_STREAM_CHUNK_SIZE
+    converters = get_value_converters(fields, json_fields_as_text=True)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';', quoting=csv.QUOTE_MINIMAL)
+    writer.writerow(fields)
+    n_rows = 0
+    for row in iter_rows(queryset, fields, converters, chunk_size):
+        writer.writerow(row)
+        n_rows += 1
+        if n_rows % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
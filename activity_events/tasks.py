@@ -1,17 +1,31 @@
 from celery import shared_task
 from .fetch_activity_events_functions import process_activity_events, remove_old_activity_events
 from .generate_csv_functions import generate_activity_events_csv_to_file, remove_old_csv_files
+from .index_functions import sync_activity_events_indexes
+from .search_functions import rebuild_search_index, clear_search_index_exists_cache, SEARCH_REBUILD_PENDING_KEY
+from django.core.cache import cache
+from . import app_settings as aps
 #from celery.utils.log import get_task_logger
 
 #logger = get_task_logger(__name__)
 
-@shared_task(bind=True)
-def fetch_and_update_activity_events(self, n_days_before=None):
+@shared_task(bind=True, max_retries=aps.ACTIVITY_EVENTS_FETCH_TASK_MAX_RETRIES)
+def fetch_and_update_activity_events(self, n_days_before=None, resume=False):
     task_id = self.request.id
     task_name = self.name
-    result = process_activity_events(n_days_before=n_days_before, ask_id=task_id, task_name=task_name)
+    # A retried task continues from the checkpoints left by the failed attempt
+    resume = resume or bool(self.request.retries)
+    countdown = aps.ACTIVITY_EVENTS_FETCH_TASK_RETRY_DELAY_SECONDS * 2 ** self.request.retries
+    try:
+        result = process_activity_events(n_days_before=n_days_before, task_id=task_id, task_name=task_name, resume=resume)
+    except Exception as e:
+        raise self.retry(exc=e, countdown=countdown)
+
+    if result.get('has_failed_requests'):
+        # The windows with failed requests are resumed by the retry, the completed ones are skipped
+        raise self.retry(exc=Exception(f'details:{result}'), countdown=countdown)
 
-    if result.get('has_failed_requests') or result.get('has_failed_records'):
+    if result.get('has_failed_records'):
         raise Exception(f'details:{result}')   
 
     return result
@@ -21,7 +35,7 @@ def generate_csv(request_data):
     try:
         result = generate_activity_events_csv_to_file(request_data)
     except Exception as e:
-         raise e(f"Error generating CSV: {e}")
+         raise Exception(f"Error generating CSV: {e}") from e
     return result
 
 @shared_task
@@ -29,13 +43,38 @@ def cleanup_old_csv_files(retention_hours):
     try:
         result = remove_old_csv_files(retention_hours)
     except Exception as e:
-         raise e(f"Error removing csv files: {e}")
+         raise Exception(f"Error removing csv files: {e}") from e
+    return result
+
+@shared_task(bind=True)
+def cleanup_old_activity_events(self, retention_days):
+    def report_progress(n_deleted, n_to_delete):
+        # Visible in the task result while the records are being purged
+        if self.request.id:
+            self.update_state(state='PROGRESS', meta={'n_deleted': n_deleted, 'n_to_delete': n_to_delete})
+
+    try:
+        result = remove_old_activity_events(retention_days, report_progress)
+    except Exception as e:
+         raise Exception(f"Error removing activity event records: {e}") from e
+    return result
+
+@shared_task
+def sync_indexes():
+    # Also picks up a search table created or dropped outside of the app
+    clear_search_index_exists_cache()
+    try:
+        result = sync_activity_events_indexes()
+    except Exception as e:
+        raise Exception(f"Error synchronizing activity events indexes: {e}") from e
     return result
 
 @shared_task
-def cleanup_old_activity_events(retention_days):
+def rebuild_search():
+    # Flag changes made while this task runs schedule another rebuild
+    cache.delete(SEARCH_REBUILD_PENDING_KEY)
     try:
-        result = remove_old_activity_events(retention_days)
+        result = rebuild_search_index()
     except Exception as e:
-         raise e(f"Error removing activity event records: {e}")
+        raise Exception(f"Error rebuilding the activity events search index: {e}") from e
     return result
@@ -50,7 +50,7 @@ def has_non_empty_query_params(dic):
     Checks if a dictionary has non-empty query parameters.
 
     This function evaluates whether a dictionary contains non-empty values
-    for keys other than 'page' and those starting with 'orderby'. It also
+    for keys other than 'page', 'cursor' and those starting with 'orderby'. It also
     counts the 'orderby_' keys with non-empty values. The function returns
     True if there is at least one non-empty value or if there are two or
     more non-empty 'orderby_' keys.
@@ -70,8 +70,8 @@ def has_non_empty_query_params(dic):
         if key.startswith('orderby_'):
             if value not in (None, ''):  # Skip empty values
                 orderby_count += 1
-        elif key != 'page':
-            # Exclude 'page' key and 'orderby' keys, check if value is non-empty
+        elif key not in ('page', 'cursor'):
+            # Exclude 'page' and 'cursor' keys and 'orderby' keys, check if value is non-empty
             if isinstance(value, (str, list, dict)) and not value:
                 continue  # Skip empty values of type string, list, or dict
             if value:
@@ -129,13 +129,14 @@ def build_query_string_for_admin_activity_events(request_get):
 def build_query_string(request_get):
     """
     Generates a query string with the current GET parameters,
-    excluding the 'page' parameter.
+    excluding the 'page' and 'cursor' parameters.
 
     :param request_get: The GET parameters dictionary from Django HttpRequest.
     :return: A query string, prefixed with '?', or an empty string if no parameters are present.
     """
     params = request_get.copy()
     params.pop('page', None)
+    params.pop('cursor', None)
     return urlencode(params, doseq=True)
 
 ##############################
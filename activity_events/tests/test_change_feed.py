@@ -0,0 +1,75 @@
+import json
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from ..models import ActivityEvent
+from ..change_feed_functions import assign_change_sequence, get_changes_queryset, get_last_change_seq
+from ..common_functions import save_records_to_model
+from ..generate_fake_data_functions import generate_and_save_fake_data_vectorized
+from ..purge_functions import to_archive_record
+from .. import app_settings as aps
+
+
+class ChangeFeedTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        generate_and_save_fake_data_vectorized(60, 4, cls.now - timedelta(days=5), cls.now, seed=37)
+        cls.pks = list(ActivityEvent.objects.order_by('pk').values_list('pk', flat=True))
+
+    def get_records(self, pks, **values):
+        records = [to_archive_record(event) for event in ActivityEvent.objects.filter(pk__in=pks).order_by('pk').values()]
+        for record in records:
+            record.update(values)
+        return records
+
+    def test_events_are_numbered_once(self):
+        self.assertEqual(list(ActivityEvent.objects.order_by('change_seq').values_list('change_seq', flat=True)), list(range(1, 61)))
+        self.assertEqual(get_last_change_seq(), 60)
+        assign_change_sequence()
+        self.assertEqual(get_last_change_seq(), 60)
+
+    def test_updates_are_numbered_again(self):
+        updated = self.get_records(self.pks[10:16], workload='Changed')
+        unchanged = self.get_records(self.pks[40:44])
+        save_records_to_model(updated + unchanged, ActivityEvent, 'task')
+        save_records_to_model(self.get_records(self.pks[10:12], workload='Changed again'), ActivityEvent, 'task', batch_size=0)
+
+        queryset, last_seq = get_changes_queryset(ActivityEvent.objects.all(), 60)
+        self.assertEqual(last_seq, 68)
+        # An event updated twice only appears at its latest position
+        self.assertEqual(list(queryset.values_list('pk', flat=True)), self.pks[12:16] + self.pks[10:12])
+        self.assertEqual(list(queryset.values_list('change_seq', flat=True)), [63, 64, 65, 66, 67, 68])
+
+    def test_numbers_are_assigned_in_batches(self):
+        ActivityEvent.objects.update(change_seq=None)
+        with mock.patch.object(aps, 'ACTIVITY_EVENTS_CHANGE_FEED_BATCH_SIZE', 7):
+            assign_change_sequence()
+        self.assertEqual(sorted(ActivityEvent.objects.values_list('change_seq', flat=True)), list(range(61, 121)))
+
+    def test_limit(self):
+        queryset, last_seq = get_changes_queryset(ActivityEvent.objects.all(), 20, 15)
+        self.assertEqual(list(queryset.values_list('change_seq', flat=True)), list(range(21, 36)))
+        self.assertEqual(last_seq, 35)
+        queryset, last_seq = get_changes_queryset(ActivityEvent.objects.all(), 60, 15)
+        self.assertFalse(queryset.exists())
+        self.assertEqual(last_seq, 60)
+
+    def test_changes_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user('consumer', password='password'))
+        response = client.get('/api/changes/', {'since': 52, 'limit': 5, 'fields': 'activity'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Last-Change-Seq'], '57')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([list(record) for record in records], [['id', 'change_seq', 'activity']] * 5)
+        self.assertEqual([record['change_seq'] for record in records], [53, 54, 55, 56, 57])
+        self.assertEqual(client.get('/api/changes/', {'since': 60})['X-Last-Change-Seq'], '60')
+        self.assertEqual(client.get('/api/changes/', {'since': -1}).status_code, 400)
+        self.assertEqual(client.get('/api/changes/', {'limit': 'all'}).status_code, 400)
+        # The sequence numbers are not part of the other representations
+        self.assertNotIn('change_seq', client.get('/api/').json()['results'][0])
@@ -0,0 +1,73 @@
+import json
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.test import TestCase
+from django.utils import timezone
+from ..models import ActivityEvent, ActivityEventField, ActivityEventRollup
+from ..generate_fake_data_functions import generate_and_save_fake_data_vectorized
+from ..rollup_functions import get_rollup_series
+from .. import app_settings as aps
+
+
+class ChartSeriesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        ActivityEventField.objects.create(fieldname='creationtime', fieldtype='DateTimeField', chart=True)
+        ActivityEventField.objects.create(fieldname='activity', fieldtype='CharField', chart=True, displayname='Activity')
+        ActivityEventField.objects.create(fieldname='workspacename', fieldtype='CharField', filter=True)
+        generate_and_save_fake_data_vectorized(150, 10, cls.now - timedelta(days=20), cls.now, seed=47)
+        cls.user = get_user_model().objects.create_user('viewer', password='password')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def get_rows(self, params):
+        response = self.client.get('/charts/series/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['rows']
+
+    def get_expected_rows(self, time_field, fieldname, granularity, tzinfo=None):
+        since = timezone.now() - timedelta(days=aps.ACTIVITY_EVENTS_CHART_MAX_PAST_DAYS)
+        rows = get_rollup_series([(time_field, fieldname)], since, [granularity], tzinfo)[(time_field, fieldname)][granularity]
+        return json.loads(json.dumps(rows, cls=DjangoJSONEncoder))
+
+    def test_series_match_rollups(self):
+        for fieldname in ('', 'activity'):
+            for granularity in (ActivityEventRollup.HOUR, ActivityEventRollup.DAY):
+                with self.subTest(fieldname=fieldname, granularity=granularity):
+                    rows = self.get_rows({'time_field': 'creationtime', 'fieldname': fieldname, 'granularity': granularity})
+                    self.assertEqual(rows, self.get_expected_rows('creationtime', fieldname, granularity))
+                    self.assertEqual(sum(row[2] for row in rows), 150)
+
+    def test_series_in_browser_time_zone(self):
+        for tz in ('America/Los_Angeles', 'Asia/Kolkata'):
+            with self.subTest(tz=tz):
+                rows = self.get_rows({'time_field': 'creationtime', 'fieldname': 'activity', 'tz': tz})
+                self.assertEqual(rows, self.get_expected_rows('creationtime', 'activity', ActivityEventRollup.DAY, ZoneInfo(tz)))
+                self.assertEqual(sum(row[2] for row in rows), 150)
+                # The days start at the local midnight
+                self.assertTrue(all(datetime.fromisoformat(row[0].replace('Z', '+00:00')).astimezone(ZoneInfo(tz)).hour == 0 for row in rows))
+
+    def test_values_without_time_field(self):
+        rows = self.get_rows({'fieldname': 'activity'})
+        self.assertEqual({row[1]: row[2] for row in rows}, {activity: ActivityEvent.objects.filter(activity=activity).count()
+                                                            for activity in ActivityEvent.objects.values_list('activity', flat=True).distinct()})
+        self.assertTrue(all(row[0] is None for row in rows))
+
+    def test_invalid_requests(self):
+        for params in ({'time_field': 'activity'}, {'time_field': 'creationtime', 'fieldname': 'creationtime'}, {'fieldname': 'workspacename'}, {},
+                       {'time_field': 'creationtime', 'granularity': 'month'}, {'time_field': 'creationtime', 'tz': 'Mars/Olympus_Mons'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/charts/series/', params).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get('/charts/series/', {'time_field': 'creationtime'}).status_code, 302)
+
+    def test_page_links_series(self):
+        data = self.client.get('/charts/').context['data']
+        self.assertEqual(dict(zip(data['fields'], data['displaynames'])), {'activity': 'Activity', 'creationtime': 'creationtime'})
+        self.assertEqual(data['series_url'], '/charts/series/')
+        self.assertNotIn('series', data)
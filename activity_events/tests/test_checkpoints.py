@@ -0,0 +1,123 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+from django.test import TestCase
+from django.utils import timezone
+from requests import Response
+from requests.exceptions import HTTPError
+from .. import fetch_activity_events_functions as fetch_functions
+from ..models import ActivityEvent, SyncCheckpoint
+from .. import app_settings as aps
+
+
+def api_record(i, creationtime):
+    return {'Id': f'page-event-{i}', 'CreationTime': creationtime.strftime('%Y-%m-%dT%H:%M:%S'), 'Activity': 'ViewReport',
+            'Operation': 'ViewReport', 'OrganizationId': 'org', 'UserId': 'user@example.com', 'UserKey': 'key'}
+
+
+class CheckpointTestCase(TestCase):
+    start = datetime(2024, 3, 9, tzinfo=dt_timezone.utc)
+    end = datetime(2024, 3, 9, 23, 59, 59, 999000, tzinfo=dt_timezone.utc)
+    base_url = f'{aps.ACTIVITY_EVENTS_API_BASE_URL}/v1.0/myorg/admin/activityevents'
+
+    def setUp(self):
+        # Pages of the window keyed by url: three pages of two events, chained by continuationUri
+        self.pages = {}
+        urls = [self.base_url, 'https://api/continuation/1', 'https://api/continuation/2']
+        for n, url in enumerate(urls):
+            events = [api_record(2 * n + i, self.start + timedelta(hours=2 * n + i)) for i in range(2)]
+            next_url = urls[n + 1] if n + 1 < len(urls) else None
+            self.pages[url] = {'activityEventEntities': events, 'continuationUri': next_url, 'lastResultSet': next_url is None}
+        self.failing_urls = set()
+        self.requests = []
+        patcher = mock.patch.multiple(fetch_functions, get_access_token=lambda use_cache=True: 'token', fetch_activity_events=self.fetch_activity_events)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.multiple(aps, ACTIVITY_EVENTS_API_MAX_RETRIES=0, ACTIVITY_EVENTS_ARCHIVE_PAGES=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fetch_activity_events(self, start_datetime, end_datetime, token, api_url, is_cont_uri):
+        self.requests.append(api_url)
+        if api_url in self.failing_urls or api_url not in self.pages:
+            response = Response()
+            response.status_code = 400 if api_url not in self.pages else 503
+            raise HTTPError(f'{response.status_code} Error', response=response)
+        return self.pages[api_url]
+
+    def fetch_window(self, resume):
+        return fetch_functions.get_json_and_save_activity_events(self.start, self.end, 'task', resume)
+
+
+class CheckpointResumeTests(CheckpointTestCase):
+
+    def test_interrupted_window_resumes_from_continuation_uri(self):
+        self.failing_urls.add('https://api/continuation/2')
+        result = self.fetch_window(resume=False)
+        self.assertEqual(len(result['failed_requests']), 1)
+        checkpoint = SyncCheckpoint.objects.get()
+        self.assertEqual((checkpoint.status, checkpoint.n_pages, checkpoint.n_records, checkpoint.continuation_uri),
+                         ('failure', 2, 4, 'https://api/continuation/2'))
+        self.assertEqual(ActivityEvent.objects.count(), 4)
+
+        self.failing_urls.clear()
+        self.requests.clear()
+        result = self.fetch_window(resume=True)
+        # The pages already saved are not requested again
+        self.assertEqual(self.requests, ['https://api/continuation/2'])
+        self.assertEqual((result['resumed_from_page'], result['n_created_records'], result['failed_requests']), (2, 2, []))
+        checkpoint.refresh_from_db()
+        self.assertEqual((checkpoint.status, checkpoint.n_pages, checkpoint.n_records, checkpoint.continuation_uri), ('success', 3, 6, ''))
+        self.assertEqual(ActivityEvent.objects.count(), 6)
+
+        # A completed window is skipped when resumed, and fetched again otherwise
+        self.requests.clear()
+        self.assertEqual(self.fetch_window(resume=True)['resumed_from_page'], 3)
+        self.assertEqual(self.requests, [])
+        self.assertEqual(self.fetch_window(resume=False)['n_unchanged_records'], 6)
+        self.assertEqual(len(self.requests), 3)
+
+    def test_expired_continuation_uri_fetches_whole_window(self):
+        SyncCheckpoint.objects.create(taskname=aps.ACTIVITY_EVENTS_FETCH_TASK_NAME, day=self.start.date(), window_start=self.start, window_end=self.end,
+                                      status='failure', continuation_uri='https://api/continuation/expired', n_pages=5, n_records=10)
+        result = self.fetch_window(resume=True)
+        self.assertEqual(self.requests, ['https://api/continuation/expired', self.base_url, 'https://api/continuation/1', 'https://api/continuation/2'])
+        self.assertEqual((result['n_created_records'], result['failed_requests']), (6, []))
+        checkpoint = SyncCheckpoint.objects.get()
+        self.assertEqual((checkpoint.status, checkpoint.n_pages, checkpoint.n_records), ('success', 3, 6))
+
+
+class WatermarkTests(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+
+    def add_checkpoint(self, days_ago, status, watermark=None):
+        window_start = (self.now - timedelta(days=days_ago)).replace(hour=0, minute=0, second=0, microsecond=0)
+        return SyncCheckpoint.objects.create(taskname=aps.ACTIVITY_EVENTS_FETCH_TASK_NAME, day=window_start.date(), window_start=window_start,
+                                             window_end=window_start + timedelta(days=1) - timedelta(microseconds=1000), status=status, watermark=watermark)
+
+    def test_start_is_newest_committed_event_minus_lateness(self):
+        self.assertIsNone(fetch_functions.get_watermark_start_datetime())
+        self.add_checkpoint(2, 'success', self.now - timedelta(days=2, hours=-5))
+        self.add_checkpoint(1, 'success', self.now - timedelta(hours=20))
+        # Windows of other tasks and failed windows do not move the watermark
+        SyncCheckpoint.objects.create(taskname='other', day=self.now.date(), window_start=self.now, window_end=self.now, status='success', watermark=self.now)
+        self.add_checkpoint(0, 'pending', self.now)
+        with mock.patch.object(aps, 'ACTIVITY_EVENTS_FETCH_LATENESS_MINUTES', 30):
+            self.assertEqual(fetch_functions.get_watermark_start_datetime(), self.now - timedelta(hours=20, minutes=30))
+
+    def test_unfinished_windows_hold_start_back(self):
+        self.add_checkpoint(1, 'success', self.now - timedelta(hours=3))
+        failed = self.add_checkpoint(4, 'failure')
+        # Older than the fetch period, so never fetched again
+        self.add_checkpoint(aps.ACTIVITY_EVENTS_FETCH_MAX_PAST_DAYS + 3, 'failure')
+        self.assertEqual(fetch_functions.get_watermark_start_datetime(), failed.window_start)
+
+    def test_incremental_fetch_starts_at_watermark(self):
+        self.add_checkpoint(1, 'success', self.now - timedelta(hours=6))
+        with mock.patch.object(fetch_functions, 'process_ativity_events_between_datetimes', return_value={'details': []}) as process:
+            result = fetch_functions.process_activity_events(task_id='task')
+        start_datetime, end_datetime = process.call_args.args[:2]
+        self.assertEqual(start_datetime, self.now - timedelta(hours=6, minutes=aps.ACTIVITY_EVENTS_FETCH_LATENESS_MINUTES))
+        self.assertEqual(result['start_datetime'], start_datetime)
+        self.assertGreaterEqual(end_datetime, self.now)
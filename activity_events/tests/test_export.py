@@ -0,0 +1,71 @@
+import csv
+import io
+import json
+import math
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from ..models import ActivityEvent, ActivityEventField
+from ..generate_fake_data_functions import generate_and_save_fake_data_vectorized
+from ..serializers import ActivityEventSerializer
+from .. import app_settings as aps
+
+
+class ExportStreamTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        ActivityEventField.objects.create(fieldname='activity', fieldtype='CharField', filter=True)
+        ActivityEventField.objects.create(fieldname='creationtime', fieldtype='DateTimeField', filter=True)
+        generate_and_save_fake_data_vectorized(90, 6, cls.now - timedelta(days=30), cls.now, seed=23)
+        cls.user = get_user_model().objects.create_user('exporter', password='password')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_stream(self, params):
+        response = self.client.get('/api/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return response, [chunk.decode() if isinstance(chunk, bytes) else chunk for chunk in response.streaming_content]
+
+    def test_ndjson_has_api_representation(self):
+        response, chunks = self.get_stream({})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="activity_events.ndjson"')
+        records = [json.loads(line) for line in ''.join(chunks).splitlines()]
+        self.assertEqual(len(records), 90)
+        expected = json.loads(JSONRenderer().render(ActivityEventSerializer(ActivityEvent.objects.all(), many=True).data))
+        self.assertEqual(records, expected)
+
+    def test_filters_and_fields(self):
+        activity = ActivityEvent.objects.order_by('pk').first().activity
+        since = (self.now - timedelta(days=10)).date()
+        _, chunks = self.get_stream({'activity': activity, 'creationtime__gte': since.isoformat(), 'fields': 'activity,id,creationtime'})
+        records = [json.loads(line) for line in ''.join(chunks).splitlines()]
+        queryset = ActivityEvent.objects.filter(activity=activity, creationtime__date__gte=since)
+        self.assertEqual(sorted(record['id'] for record in records), sorted(queryset.values_list('pk', flat=True)))
+        self.assertTrue(all(list(record) == ['activity', 'id', 'creationtime'] for record in records))
+
+    def test_csv_is_written_in_chunks(self):
+        with mock.patch.object(aps, 'ACTIVITY_EVENTS_STREAM_CHUNK_SIZE', 7):
+            response, chunks = self.get_stream({'format': 'csv', 'fields': 'id,extra_data,lastrefreshtime'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(len(chunks), math.ceil(90 / 7) + (90 % 7 == 0))
+        rows = list(csv.reader(io.StringIO(''.join(chunks)), delimiter=';'))
+        self.assertEqual(rows[0], ['id', 'extra_data', 'lastrefreshtime'])
+        self.assertEqual(len(rows), 91)
+        event = ActivityEvent.objects.get(pk=rows[1][0])
+        self.assertEqual(json.loads(rows[1][1]), event.extra_data)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.get('/api/export/', {'format': 'xml'}).status_code, 400)
+        response = self.client.get('/api/export/', {'fields': 'id,content_hash'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('content_hash', response.json()['fields'])
+        self.assertIn(APIClient().get('/api/export/').status_code, (401, 403))
@@ -0,0 +1,97 @@
+from datetime import timedelta
+from unittest import mock
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+from .. import common_functions
+from ..models import ActivityEvent, ActivityEventField, ActivityEventFacet
+from ..common_functions import save_records_to_model
+from ..facet_functions import get_facets, rebuild_facets
+from ..fetch_activity_events_functions import remove_old_activity_events
+from ..generate_fake_data_functions import generate_and_save_fake_data_vectorized
+from ..purge_functions import to_archive_record
+from .. import app_settings as aps
+
+
+class FacetTests(TestCase):
+    fieldnames = ['activity', 'workspacename', 'creationtime', 'lastrefreshtime']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        for fieldname, fieldtype in [('activity', 'CharField'), ('workspacename', 'CharField'), ('creationtime', 'DateTimeField'), ('lastrefreshtime', 'DateTimeField')]:
+            ActivityEventField.objects.create(fieldname=fieldname, fieldtype=fieldtype, filter=True)
+        generate_and_save_fake_data_vectorized(220, 7, cls.now - timedelta(days=75), cls.now, seed=13)
+
+    def setUp(self):
+        patcher = mock.patch.multiple(aps, ACTIVITY_EVENTS_PURGE_SLEEP_SECONDS=0, ACTIVITY_EVENTS_PURGE_ARCHIVE=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_changed_records(self, n_events, offset=0):
+        # Stored events with other values and times, as fetched again from the API
+        pks = list(ActivityEvent.objects.order_by('pk').values_list('pk', flat=True)[offset:offset + n_events])
+        records = [to_archive_record(values) for values in ActivityEvent.objects.filter(pk__in=pks).order_by('pk').values()]
+        for i, record in enumerate(records):
+            record['activity'] = f'Renamed{i % 4}'
+            if i % 3 == 0:
+                record['creationtime'] = (self.now - timedelta(days=40 - i, hours=i)).isoformat()
+            if i % 5 == 0:
+                record['lastrefreshtime'] = None
+        return records
+
+    def get_stored_facets(self):
+        return sorted(ActivityEventFacet.objects.values_list('fieldname', 'kind', 'value', 'month', 'count', 'min_value', 'max_value'), key=str)
+
+    def test_incremental_facets_equal_rebuild(self):
+        get_facets(self.fieldnames)
+        save_records_to_model(self.get_changed_records(30), ActivityEvent, 'task')
+        save_records_to_model(self.get_changed_records(12, offset=100), ActivityEvent, 'task', batch_size=0)
+        generate_and_save_fake_data_vectorized(40, 4, self.now - timedelta(days=3), self.now, seed=14)
+        remove_old_activity_events(45)
+
+        incremental = self.get_stored_facets()
+        rebuild_facets(self.fieldnames)
+        self.assertEqual(incremental, self.get_stored_facets())
+
+    def test_facets_match_events(self):
+        facets = get_facets(['activity', 'creationtime', 'lastrefreshtime'])
+        values = dict(facets['activity']['values'])
+        self.assertEqual(values, {activity: ActivityEvent.objects.filter(activity=activity).count()
+                                  for activity in ActivityEvent.objects.values_list('activity', flat=True).distinct()})
+        self.assertEqual(facets['creationtime']['count'], 220)
+        self.assertEqual(facets['creationtime']['min_value'], ActivityEvent.objects.order_by('creationtime').first().creationtime)
+        self.assertEqual(facets['lastrefreshtime']['max_value'], ActivityEvent.objects.order_by('-lastrefreshtime').exclude(lastrefreshtime=None).first().lastrefreshtime)
+        # Computed from the events when the store is disabled
+        with mock.patch.object(aps, 'ACTIVITY_EVENTS_FACETS', False):
+            self.assertEqual(get_facets(['activity', 'creationtime', 'lastrefreshtime']), facets)
+
+    def test_first_build_is_repeatable(self):
+        rebuild_facets(['workspacename'])
+        rebuild_facets(['workspacename'])
+        self.assertEqual(ActivityEventFacet.objects.filter(fieldname='workspacename', kind=ActivityEventFacet.RANGE, month__isnull=True).count(), 1)
+        self.assertFalse(ActivityEventFacet.objects.exclude(fieldname='workspacename').exists())
+
+    def test_single_saves_hold_shared_lock(self):
+        get_facets(['activity', 'creationtime'])
+        calls = []
+        lock_aggregates = common_functions.lock_aggregates
+        snapshot_facet_values = common_functions.snapshot_facet_values
+
+        def recording_lock_aggregates(shared=False):
+            calls.append(('lock', shared, len(connection.atomic_blocks)))
+            lock_aggregates(shared)
+
+        def recording_snapshot_facet_values(pks, facet_fields):
+            calls.append(('snapshot', len(connection.atomic_blocks)))
+            return snapshot_facet_values(pks, facet_fields)
+
+        depth = len(connection.atomic_blocks)
+        with mock.patch.multiple(common_functions, lock_aggregates=recording_lock_aggregates, snapshot_facet_values=recording_snapshot_facet_values):
+            save_records_to_model(self.get_changed_records(6), ActivityEvent, 'task', batch_size=0)
+        # The lock is taken first, and the counts are read and updated in the same transaction
+        self.assertEqual(calls, [('lock', True, depth + 1), ('snapshot', depth + 1), ('snapshot', depth + 1)])
+
+        incremental = self.get_stored_facets()
+        rebuild_facets(['activity', 'creationtime'])
+        self.assertEqual(incremental, self.get_stored_facets())
@@ -0,0 +1,84 @@
+from datetime import timedelta
+from unittest import mock
+from django.db import DatabaseError
+from django.test import TestCase
+from django.utils import timezone
+from .. import common_functions
+from ..models import ActivityEvent
+from ..common_functions import save_rows_to_model
+from ..generate_fake_data_functions import generate_and_save_fake_data_vectorized
+from .. import app_settings as aps
+
+
+class VectorizedGeneratorTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.end = timezone.now()
+        cls.start = cls.end - timedelta(days=12)
+        # Generated chunks larger and smaller than the write batches
+        with mock.patch.object(aps, 'ACTIVITY_EVENTS_SAVE_BATCH_SIZE', 40):
+            cls.result = generate_and_save_fake_data_vectorized(250, 8, cls.start, cls.end, seed=21, chunk_size=90)
+
+    def test_events_are_saved(self):
+        self.assertEqual((self.result['n_created_records'], self.result['failed_records']), (250, []))
+        self.assertEqual(ActivityEvent.objects.count(), 250)
+        self.assertFalse(ActivityEvent.objects.exclude(creationtime__range=(self.start, self.end)).exists())
+        self.assertLessEqual(ActivityEvent.objects.values('userid').distinct().count(), 8)
+        self.assertFalse(ActivityEvent.objects.filter(userkey='').exists())
+
+    def test_rows_are_hashed_like_records(self):
+        for event in ActivityEvent.objects.order_by('pk')[:25]:
+            self.assertEqual(event.content_hash, event.compute_content_hash())
+
+    def test_same_seed_generates_same_events(self):
+        result = generate_and_save_fake_data_vectorized(250, 8, self.start, self.end, seed=21, chunk_size=90)
+        self.assertEqual((result['n_created_records'], result['n_unchanged_records']), (0, 250))
+
+
+class SaveRowsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        generate_and_save_fake_data_vectorized(10, 3, now - timedelta(days=3), now, seed=5)
+        cls.plan = ActivityEvent.get_mapping_plan()
+        # Rows of new events, built from the generated ones
+        cls.rows = []
+        for n, row in enumerate(ActivityEvent.objects.order_by('pk').values_list(*cls.plan.columns)):
+            row = list(row)
+            row[cls.plan.pk_index] = f'row-{n}'
+            row[cls.plan.content_hash_index] = cls.plan.hash_row(row)
+            cls.rows.append(tuple(row))
+
+    def set_value(self, n, name, value):
+        row = list(self.rows[n])
+        row[self.plan.index[name]] = value
+        row[self.plan.content_hash_index] = self.plan.hash_row(row)
+        self.rows[n] = tuple(row)
+
+    def test_rows_are_checked(self):
+        max_length = ActivityEvent._meta.get_field('workspacename').max_length
+        self.set_value(2, 'userid', '')
+        self.set_value(6, 'workspacename', 'w' * (max_length + 25))
+        result = save_rows_to_model(self.rows, ActivityEvent, 4)
+        self.assertEqual(result['n_created_records'], 8)
+        self.assertEqual(sorted(pk for failed in result['failed_records'] for pk in failed), ['row-2', 'row-6'])
+        self.assertFalse(ActivityEvent.objects.filter(pk='row-2').exists())
+        event = ActivityEvent.objects.get(pk='row-6')
+        self.assertEqual(event.workspacename, 'w' * max_length)
+        self.assertEqual(event.content_hash, event.compute_content_hash())
+
+    def test_failing_chunk_is_saved_row_by_row(self):
+        upsert_rows = common_functions.upsert_rows
+
+        def failing_upsert_rows(rows, target_model, truncations=None):
+            if any(row[self.plan.pk_index] == 'row-5' for row in rows):
+                raise DatabaseError('row-5 cannot be written')
+            return upsert_rows(rows, target_model, truncations)
+
+        with mock.patch.object(common_functions, 'upsert_rows', failing_upsert_rows):
+            result = save_rows_to_model(self.rows, ActivityEvent, 4)
+        self.assertEqual(result['n_created_records'], 9)
+        self.assertEqual(result['failed_records'], [{'row-5': 'row-5 cannot be written'}])
+        self.assertEqual(ActivityEvent.objects.filter(pk__startswith='row-').count(), 9)
@@ -0,0 +1,66 @@
+from datetime import timedelta
+from urllib.parse import parse_qs, urlparse
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.settings import api_settings
+from rest_framework.test import APIClient
+from ..models import ActivityEvent, ActivityEventField
+from ..generate_fake_data_functions import generate_and_save_fake_data_vectorized
+from .. import app_settings as aps
+
+
+class FastSerializationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        ActivityEventField.objects.create(fieldname='workload', fieldtype='CharField', filter=True)
+        generate_and_save_fake_data_vectorized(140, 12, now - timedelta(days=9), now, seed=29)
+        pks = list(ActivityEvent.objects.order_by('pk').values_list('pk', flat=True))
+        ActivityEvent.objects.filter(pk__in=pks[:25]).update(lastrefreshtime=None, extra_data=None)
+        cls.user = get_user_model().objects.create_user('reader', password='password')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        patcher = mock.patch.object(aps, 'ACTIVITY_EVENTS_COUNT_MODE', 'exact')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_response(self, fast, params):
+        with mock.patch.object(aps, 'ACTIVITY_EVENTS_API_FAST_SERIALIZATION', fast):
+            response = self.client.get('/api/', params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assert_same_content(self, params):
+        content = self.get_response(True, params).content
+        self.assertEqual(content, self.get_response(False, params).content)
+        return content
+
+    def test_fast_path_is_byte_identical(self):
+        orderings = [{}, {'orderby_field': 'lastrefreshtime', 'orderby_direction': 'desc'}, {'orderby_field': 'workspacename', 'orderby_direction': 'asc'}]
+        with mock.patch.object(api_settings, 'PAGE_SIZE', 60):
+            for params in [{'page': 1}] + orderings:
+                with self.subTest(params=params):
+                    self.assert_same_content(params)
+                    # Following page, read from the next cursor
+                    if 'page' not in params:
+                        next_url = self.get_response(True, params).json()['next']
+                        cursor = parse_qs(urlparse(next_url).query)['cursor'][0]
+                        self.assert_same_content(dict(params, cursor=cursor))
+
+    def test_fields_and_filters(self):
+        workload = ActivityEvent.objects.exclude(workload='').order_by('pk').first().workload
+        for params in ({'fields': 'creationtime,id,extra_data'}, {'fields': 'activity', 'workload': workload}):
+            with self.subTest(params=params):
+                self.assert_same_content(params)
+                results = self.get_response(True, params).json()['results']
+                self.assertTrue(results)
+                self.assertTrue(all(list(record) == params['fields'].split(',') for record in results))
+        self.assertEqual(self.get_response(True, {'fields': 'activity', 'workload': workload}).json()['count'],
+                         ActivityEvent.objects.filter(workload=workload).count())
+        with mock.patch.object(aps, 'ACTIVITY_EVENTS_API_FAST_SERIALIZATION', True):
+            self.assertEqual(self.client.get('/api/', {'fields': 'change_seq'}).status_code, 400)
@@ -0,0 +1,115 @@
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock
+from django.test import SimpleTestCase
+from requests import Response
+from requests.exceptions import HTTPError
+from .. import fetch_activity_events_functions as fetch_functions
+from ..request_scheduler import reset_rate_limiter
+
+
+def http_error(status_code, headers=None):
+    response = Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    return HTTPError(f'{status_code} Error', response=response)
+
+
+class FetchTestCase(SimpleTestCase):
+    start = datetime(2024, 5, 1, tzinfo=dt_timezone.utc)
+    end = datetime(2024, 5, 1, 23, 59, 59, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        reset_rate_limiter()
+        self.addCleanup(reset_rate_limiter)
+        self.token_requests = []
+        self.responses = []
+        self.requests = []
+        patcher = mock.patch.multiple(fetch_functions, get_access_token=self.get_access_token, fetch_activity_events=self.fetch_activity_events)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_access_token(self, use_cache=True):
+        self.token_requests.append(use_cache)
+        return 'cached-token' if use_cache else f'new-token-{len(self.token_requests)}'
+
+    def fetch_activity_events(self, start_datetime, end_datetime, token, api_url, is_cont_uri):
+        # Pops the next scripted response: an exception to raise or a page
+        self.requests.append((token, api_url))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def get_pages(self):
+        failed_requests = []
+        pages = list(fetch_functions.iter_activity_events_pages(self.start, self.end, failed_requests))
+        return pages, failed_requests
+
+
+class TokenRefreshTests(FetchTestCase):
+
+    def test_unauthorized_request_is_retried_with_new_token(self):
+        self.responses = [
+            {'activityEventEntities': [{'Id': '1'}], 'continuationUri': 'https://api/next', 'lastResultSet': False},
+            http_error(401),
+            {'activityEventEntities': [{'Id': '2'}], 'lastResultSet': True},
+        ]
+        pages, failed_requests = self.get_pages()
+        self.assertEqual(pages, [([{'Id': '1'}], 'https://api/next'), ([{'Id': '2'}], None)])
+        self.assertEqual(failed_requests, [])
+        self.assertEqual(self.token_requests, [True, True, False])
+        self.assertEqual(self.requests[2], ('new-token-3', 'https://api/next'))
+
+    def test_token_is_refreshed_only_once(self):
+        self.responses = [http_error(401), http_error(401)]
+        pages, failed_requests = self.get_pages()
+        self.assertEqual(pages, [])
+        self.assertEqual(self.token_requests, [True, False])
+        self.assertEqual(len(failed_requests), 1)
+        self.assertIn('401', failed_requests[0]['error'])
+
+
+class RetryTests(FetchTestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.multiple(fetch_functions, time=mock.DEFAULT, get_rate_limiter=mock.DEFAULT)
+        mocks = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.sleep = mocks['time'].sleep
+        self.rate_limiter = mocks['get_rate_limiter'].return_value
+
+    def test_throttled_request_waits_for_retry_after(self):
+        self.responses = [http_error(429, {'Retry-After': '7'}), {'activityEventEntities': [{'Id': '1'}], 'lastResultSet': True}]
+        pages, failed_requests = self.get_pages()
+        self.assertEqual(pages, [([{'Id': '1'}], None)])
+        self.assertEqual(failed_requests, [])
+        self.sleep.assert_called_once_with(7.0)
+        # Every window sharing the limiter is held back
+        self.rate_limiter.pause.assert_called_once_with(7.0)
+        self.assertEqual(self.rate_limiter.acquire.call_count, 2)
+
+    def test_server_errors_are_retried_with_backoff(self):
+        self.responses = [http_error(503), http_error(500), {'activityEventEntities': [], 'lastResultSet': True}]
+        with mock.patch.multiple(fetch_functions.aps, ACTIVITY_EVENTS_API_BACKOFF_BASE_SECONDS=2, ACTIVITY_EVENTS_API_BACKOFF_MAX_SECONDS=3):
+            pages, failed_requests = self.get_pages()
+        self.assertEqual((pages, failed_requests), ([([], None)], []))
+        delays = [call.args[0] for call in self.sleep.call_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertTrue(0 <= delays[0] <= 2 and 0 <= delays[1] <= 3)
+        self.rate_limiter.pause.assert_not_called()
+
+    def test_retries_are_bounded(self):
+        self.responses = [http_error(429, {'Retry-After': '1'}) for _ in range(3)]
+        with mock.patch.object(fetch_functions.aps, 'ACTIVITY_EVENTS_API_MAX_RETRIES', 2):
+            pages, failed_requests = self.get_pages()
+        self.assertEqual(pages, [])
+        self.assertEqual(self.sleep.call_count, 2)
+        self.assertEqual(len(failed_requests), 1)
+
+    def test_client_errors_are_not_retried(self):
+        self.responses = [http_error(400)]
+        pages, failed_requests = self.get_pages()
+        self.assertEqual(pages, [])
+        self.sleep.assert_not_called()
+        self.assertIn('400', failed_requests[0]['error'])
@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+from django.db import transaction
+from django.test import TestCase
+from ..models import ActivityEvent
+from ..common_functions import save_records_to_model
+
+
+def make_record(i, **values):
+    # A record as returned by the activity events API
+    record = {
+        'Id': f'event-{i:04d}',
+        'CreationTime': (datetime(2024, 5, 1, 8) + timedelta(minutes=37 * i)).isoformat(),
+        'Activity': ['ViewReport', 'ExportReport', 'ShareReport'][i % 3],
+        'Operation': ['ViewReport', 'ExportReport', 'ShareReport'][i % 3],
+        'OrganizationId': 'org-1',
+        'UserId': f'user{i % 4}@example.com',
+        'UserKey': f'key-{i % 4}',
+        'Workload': 'PowerBI',
+        'WorkSpaceName': f'Workspace {i % 5}',
+        'ArtifactAccessRequestInfo': {'RequestId': i},
+    }
+    record.update(values)
+    return record
+
+
+class BulkUpsertTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        save_records_to_model([make_record(i) for i in range(12)], ActivityEvent, 'setup')
+
+    def save_and_roll_back(self, records, batch_size):
+        # Saves the records and returns the result and the stored events, then restores the fixture
+        with transaction.atomic():
+            result = save_records_to_model(records, ActivityEvent, 'task', batch_size=batch_size)
+            events = {event.pk: event for event in ActivityEvent.objects.all()}
+            transaction.set_rollback(True)
+        return result, events
+
+    def test_counts_of_mixed_batch(self):
+        records = [make_record(i) for i in range(12, 16)]
+        records += [make_record(i, Activity='RenameReport') for i in (2, 5, 7)]
+        # A repeated id is counted as created then updated, the last occurrence wins
+        records.append(make_record(13, WorkSpaceName='Renamed'))
+
+        for batch_size in (1000, 3, 0):
+            with self.subTest(batch_size=batch_size):
+                result, events = self.save_and_roll_back(records, batch_size)
+                self.assertEqual((result['n_created_records'], result['n_updated_records'], result['failed_records']), (4, 4, []))
+                self.assertEqual(len(events), 16)
+                self.assertEqual(events['event-0005'].activity, 'RenameReport')
+                self.assertEqual(events['event-0013'].workspacename, 'Renamed')
+                self.assertEqual(events['event-0013'].extra_data, {'ArtifactAccessRequestInfo': {'RequestId': 13}})
+                self.assertEqual(events['event-0013'].task_id, 'task')
+
+    def test_invalid_records_are_reported(self):
+        records = [make_record(i) for i in range(20, 26)]
+        records[1]['UserId'] = ''
+        records[4]['WorkSpaceName'] = 'x' * 500
+
+        for batch_size in (1000, 2, 0):
+            with self.subTest(batch_size=batch_size):
+                result, events = self.save_and_roll_back(records, batch_size)
+                self.assertEqual(result['n_created_records'], 4)
+                self.assertEqual(sorted(pk for failed in result['failed_records'] for pk in failed), ['event-0021', 'event-0024'])
+                self.assertNotIn('event-0021', events)
+                # Too long values are truncated and still saved, but reported as failed
+                self.assertEqual(len(events['event-0024'].workspacename), ActivityEvent._meta.get_field('workspacename').max_length)
+
+
+class UnchangedEventTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.records = [make_record(i, Workload='Fabric', ReportType='PaginatedReport') for i in range(100, 109)]
+        save_records_to_model(cls.records, ActivityEvent, 'first')
+
+    def get_stored(self):
+        return {pk: (updated_at, task_id, content_hash) for pk, updated_at, task_id, content_hash
+                in ActivityEvent.objects.values_list('pk', 'updated_at', 'task_id', 'content_hash')}
+
+    def test_identical_records_are_not_rewritten(self):
+        stored = self.get_stored()
+        for batch_size in (1000, 4, 0):
+            with self.subTest(batch_size=batch_size):
+                result = save_records_to_model(self.records, ActivityEvent, 'second', batch_size=batch_size)
+                self.assertEqual((result['n_created_records'], result['n_updated_records'], result['n_unchanged_records']), (0, 0, 9))
+                self.assertEqual(self.get_stored(), stored)
+
+    def test_changed_records_are_rewritten(self):
+        stored = self.get_stored()
+        records = [dict(record) for record in self.records]
+        records[0]['ReportType'] = 'PowerBIReport'
+        # Unmapped keys are part of the content too
+        records[3]['ArtifactAccessRequestInfo'] = {'RequestId': 'changed'}
+        records[5]['CreationTime'] = '2024-05-02T10:00:00'
+
+        for batch_size in (1000, 0):
+            with self.subTest(batch_size=batch_size):
+                with transaction.atomic():
+                    result = save_records_to_model(records, ActivityEvent, 'second', batch_size=batch_size)
+                    changed = {pk for pk, values in self.get_stored().items() if values != stored[pk]}
+                    task_ids = dict(ActivityEvent.objects.values_list('pk', 'task_id'))
+                    transaction.set_rollback(True)
+                self.assertEqual((result['n_updated_records'], result['n_unchanged_records']), (3, 6))
+                self.assertEqual(changed, {'event-0100', 'event-0103', 'event-0105'})
+                self.assertEqual(task_ids['event-0103'], 'second')
+                self.assertEqual(task_ids['event-0104'], 'first')
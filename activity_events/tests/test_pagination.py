@@ -0,0 +1,68 @@
+from datetime import timedelta
+from django.test import TestCase
+from django.utils import timezone
+from ..models import ActivityEvent
+from ..generate_fake_data_functions import generate_and_save_fake_data_vectorized
+from ..pagination import get_keyset_page, get_ordering_keys, get_keyset_ordering
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        generate_and_save_fake_data_vectorized(180, 6, cls.now - timedelta(days=20), cls.now, seed=11)
+        pks = list(ActivityEvent.objects.order_by('pk').values_list('pk', flat=True))
+        # Nullable keys with many nulls and ties
+        ActivityEvent.objects.filter(pk__in=pks[:70]).update(lastrefreshtime=None)
+        ActivityEvent.objects.filter(pk__in=pks[-40:]).update(lastrefreshtime=cls.now)
+        ActivityEvent.objects.filter(pk__in=pks[70:100]).update(workspacename='')
+
+    def walk(self, queryset, page_size):
+        # Rows read by following the next cursors, then the previous cursors from the last page
+        forward = []
+        page = get_keyset_page(queryset, None, page_size, 'exact')
+        forward.extend(page.object_list)
+        while page.has_next:
+            page = get_keyset_page(queryset, page.next_cursor, page_size, 'exact')
+            forward.extend(page.object_list)
+
+        backward = []
+        page = get_keyset_page(queryset, page.last_cursor, page_size, 'exact')
+        backward[:0] = page.object_list
+        while page.has_previous:
+            page = get_keyset_page(queryset, page.previous_cursor, page_size, 'exact')
+            backward[:0] = page.object_list
+        return [event.pk for event in forward], [event.pk for event in backward]
+
+    def test_walks_match_full_ordering(self):
+        for ordering in (['lastrefreshtime'], ['-lastrefreshtime'], ['workspacename', '-lastrefreshtime'], ['-creationtime'], []):
+            with self.subTest(ordering=ordering):
+                queryset = ActivityEvent.objects.order_by(*ordering) if ordering else ActivityEvent.objects.all()
+                keys = get_ordering_keys(queryset)
+                expected = list(queryset.order_by(*get_keyset_ordering(keys, False)).values_list('pk', flat=True))
+                forward, backward = self.walk(queryset, 17)
+                self.assertEqual(forward, expected)
+                self.assertEqual(backward, expected)
+
+    def test_filtered_walk(self):
+        queryset = ActivityEvent.objects.filter(lastrefreshtime__isnull=False).order_by('-lastrefreshtime')
+        forward, backward = self.walk(queryset, 9)
+        self.assertEqual(forward, list(queryset.order_by(*get_keyset_ordering(get_ordering_keys(queryset), False)).values_list('pk', flat=True)))
+        self.assertEqual(backward, forward)
+        self.assertFalse(ActivityEvent.objects.filter(pk__in=forward, lastrefreshtime__isnull=True).exists())
+
+    def test_page_indexes_and_count(self):
+        queryset = ActivityEvent.objects.order_by('-lastrefreshtime')
+        page = get_keyset_page(queryset, None, 50, 'exact')
+        page = get_keyset_page(queryset, page.next_cursor, 50, 'exact')
+        self.assertEqual((page.start_index, page.end_index, page.count), (51, 100, 180))
+        self.assertFalse(page.count_is_estimated)
+        self.assertTrue(page.has_previous)
+
+    def test_invalid_cursor(self):
+        page = get_keyset_page(ActivityEvent.objects.order_by('activity'), None, 10, 'exact')
+        with self.assertRaises(ValueError):
+            get_keyset_page(ActivityEvent.objects.order_by('workspacename'), page.next_cursor, 10, 'exact')
+        with self.assertRaises(ValueError):
+            get_keyset_page(ActivityEvent.objects.all(), 'not-a-cursor', 10, 'exact')
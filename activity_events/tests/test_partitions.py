@@ -0,0 +1,60 @@
+from datetime import date, datetime, timedelta
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from ..models import ActivityEvent, ActivityEventField, ActivityEventFacet, ActivityEventRollup
+from ..facet_functions import get_facets, rebuild_facets, lock_aggregates, subtract_month_from_facets, refresh_facet_ranges, to_partition_month, UTC
+from ..rollup_functions import get_rollup_series, get_chart_rollup_pairs, rebuild_rollups, subtract_month_from_rollups
+from ..generate_fake_data_functions import generate_and_save_fake_data_vectorized
+
+
+class MonthSubtractionTests(TestCase):
+    # The counts of a month are subtracted as when its partition is dropped, which works on every backend
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        for fieldname, fieldtype in [('activity', 'CharField'), ('creationtime', 'DateTimeField'), ('workload', 'CharField')]:
+            ActivityEventField.objects.create(fieldname=fieldname, fieldtype=fieldtype, filter=fieldname != 'workload', chart=True)
+        generate_and_save_fake_data_vectorized(180, 9, cls.now - timedelta(days=100), cls.now, seed=17)
+
+    def get_stored(self):
+        facets = ActivityEventFacet.objects.values_list('fieldname', 'kind', 'value', 'month', 'count', 'min_value', 'max_value')
+        rollups = ActivityEventRollup.objects.values_list('granularity', 'time_field', 'fieldname', 'bucket', 'value', 'month', 'count')
+        return sorted(facets, key=str), sorted(rollups, key=str)
+
+    def test_dropped_month_equals_rebuild(self):
+        fieldnames = ['activity', 'creationtime', 'workload']
+        pairs = get_chart_rollup_pairs()
+        get_facets(fieldnames)
+        get_rollup_series(pairs, self.now - timedelta(days=365))
+        month = to_partition_month(ActivityEvent.objects.order_by('creationtime').first().creationtime)
+        month_start = datetime(month.year, month.month, 1, tzinfo=UTC)
+        month_end = datetime(month.year + month.month // 12, month.month % 12 + 1, 1, tzinfo=UTC)
+
+        with transaction.atomic():
+            lock_aggregates()
+            with CaptureQueriesContext(connection) as queries:
+                subtract_month_from_facets(month)
+                subtract_month_from_rollups(month)
+            ActivityEvent.objects.filter(creationtime__gte=month_start, creationtime__lt=month_end).delete()
+        refresh_facet_ranges()
+        # Only the stored counts are read
+        table = connection.ops.quote_name(ActivityEvent._meta.db_table)
+        self.assertFalse([query['sql'] for query in queries if table in query['sql']])
+        self.assertFalse(ActivityEventFacet.objects.filter(month=month).exists() or ActivityEventRollup.objects.filter(month=month).exists())
+
+        stored = self.get_stored()
+        rebuild_facets(fieldnames)
+        rebuild_rollups(pairs)
+        self.assertEqual(stored, self.get_stored())
+        self.assertEqual(get_facets(['creationtime'])['creationtime']['count'], ActivityEvent.objects.count())
+
+    def test_counts_are_kept_per_month(self):
+        get_facets(['activity'])
+        months = ActivityEventFacet.objects.filter(fieldname='activity', kind=ActivityEventFacet.RANGE, month__isnull=False)
+        self.assertEqual(set(months.values_list('month', flat=True)),
+                         {to_partition_month(creationtime) for creationtime in ActivityEvent.objects.values_list('creationtime', flat=True)})
+        self.assertEqual(sum(months.values_list('count', flat=True)), 180)
+        self.assertTrue(all(isinstance(month, date) and month.day == 1 for month in months.values_list('month', flat=True)))
@@ -0,0 +1,67 @@
+import glob
+import gzip
+import json
+import math
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from django.test import TestCase
+from django.utils import timezone
+from .. import purge_functions
+from ..models import ActivityEvent
+from ..common_functions import save_records_to_model
+from ..fetch_activity_events_functions import remove_old_activity_events
+from ..generate_fake_data_functions import generate_and_save_fake_data_vectorized
+from ..purge_functions import purge_activity_events
+from .. import app_settings as aps
+
+
+class PurgeTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        generate_and_save_fake_data_vectorized(140, 5, cls.now - timedelta(days=60), cls.now, seed=31)
+        cls.cutoff_time = cls.now - timedelta(days=25)
+        cls.n_old = ActivityEvent.objects.filter(creationtime__lt=cls.cutoff_time).count()
+
+    def setUp(self):
+        patcher = mock.patch.object(purge_functions, 'time')
+        self.sleep = patcher.start().sleep
+        self.addCleanup(patcher.stop)
+        archive_path = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_path.cleanup)
+        patcher = mock.patch.object(aps, 'MEDIA_ROOT', archive_path.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_old_events_are_deleted_in_chunks(self):
+        progress = []
+        result = purge_activity_events(self.cutoff_time, batch_size=16, sleep_seconds=0.5, archive=False,
+                                       progress_callback=lambda n_deleted, n_to_delete: progress.append((n_deleted, n_to_delete)))
+        n_chunks = math.ceil(self.n_old / 16)
+        self.assertEqual(result, {'n_deleted': self.n_old, 'n_archived': 0})
+        self.assertEqual(progress, [(min(16 * n, self.n_old), self.n_old) for n in range(n_chunks + 1)])
+        self.assertEqual(self.sleep.call_count, n_chunks)
+        self.assertEqual(ActivityEvent.objects.count(), 140 - self.n_old)
+        self.assertFalse(ActivityEvent.objects.filter(creationtime__lt=self.cutoff_time).exists())
+
+    def test_archived_events_can_be_ingested_again(self):
+        stored = dict(ActivityEvent.objects.filter(creationtime__lt=self.cutoff_time).values_list('pk', 'content_hash'))
+        result = purge_activity_events(self.cutoff_time, batch_size=25, sleep_seconds=0, archive=True)
+        self.assertEqual(result, {'n_deleted': self.n_old, 'n_archived': self.n_old})
+
+        records = []
+        for file_path in glob.glob(os.path.join(purge_functions.get_purge_archive_path(), '*', '*', '*.ndjson.gz')):
+            with gzip.open(file_path, 'rt', encoding='utf-8') as archive:
+                records.extend(json.loads(line) for line in archive)
+        self.assertEqual(len(records), self.n_old)
+        save_records_to_model(records, ActivityEvent, 'restore')
+        self.assertEqual(dict(ActivityEvent.objects.filter(creationtime__lt=self.cutoff_time).values_list('pk', 'content_hash')), stored)
+
+    def test_retention_task_result(self):
+        with mock.patch.multiple(aps, ACTIVITY_EVENTS_PURGE_BATCH_SIZE=7, ACTIVITY_EVENTS_PURGE_ARCHIVE=False):
+            result = remove_old_activity_events(25)
+        self.assertEqual((result['n_before'], result['n_deleted'], result['n_remaining']), (140, self.n_old, 140 - self.n_old))
+        self.assertEqual(self.sleep.call_count, math.ceil(self.n_old / 7))
@@ -0,0 +1,50 @@
+import tempfile
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock
+from django.db import connection
+from django.test import TransactionTestCase
+from ..models import ActivityEvent
+from ..archive_functions import archive_activity_events_page, list_archived_segments, replay_activity_events
+from .. import app_settings as aps
+
+
+def api_record(id, activity, creationtime):
+    return {'Id': id, 'CreationTime': creationtime, 'Activity': activity, 'Operation': activity,
+            'OrganizationId': 'org', 'UserId': 'replay@example.com', 'UserKey': 'replay-key'}
+
+
+class ReplayTests(TransactionTestCase):
+    # Replays run in worker threads, which only see committed events
+
+    def setUp(self):
+        archive_path = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_path.cleanup)
+        patcher = mock.patch.multiple(aps, MEDIA_ROOT=archive_path.name, ACTIVITY_EVENTS_SAVE_BATCH_SIZE=2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.first_day = datetime(2024, 6, 3, tzinfo=dt_timezone.utc)
+        self.second_day = datetime(2024, 6, 4, tzinfo=dt_timezone.utc)
+        # Successive versions of the same events in the segments of a day, in fetch order
+        for n in range(4):
+            page = [api_record(f'replayed-{i}', f'Version{n}', '2024-06-03T10:00:00') for i in range(3)]
+            archive_activity_events_page(page, self.first_day, 'fetch')
+        archive_activity_events_page([api_record('replayed-next-day', 'ViewReport', '2024-06-04T08:00:00')], self.second_day, 'fetch')
+
+    def test_last_fetched_version_wins(self):
+        # Days are replayed concurrently, except on the in-memory SQLite test database that locks writers out
+        for max_workers in ((1,) if connection.vendor == 'sqlite' else (1, 2)):
+            with self.subTest(max_workers=max_workers):
+                ActivityEvent.objects.all().delete()
+                result = replay_activity_events(max_workers=max_workers)
+                self.assertEqual(result['n_segments'], 5)
+                self.assertEqual((result['n_created_records'], result['n_updated_records'], result['failed_records']), (4, 9, []))
+                self.assertEqual(dict(ActivityEvent.objects.values_list('pk', 'activity')), {
+                    'replayed-0': 'Version3', 'replayed-1': 'Version3', 'replayed-2': 'Version3', 'replayed-next-day': 'ViewReport'})
+                self.assertEqual(set(ActivityEvent.objects.values_list('task_id', flat=True)), {result['task_id']})
+
+    def test_replay_between_dates(self):
+        self.assertEqual(len(list_archived_segments(self.first_day.date(), self.first_day.date())), 4)
+        result = replay_activity_events(self.second_day.date(), self.second_day.date())
+        self.assertEqual((result['n_segments'], result['n_created_records']), (1, 1))
+        self.assertEqual(list(ActivityEvent.objects.values_list('pk', flat=True)), ['replayed-next-day'])
@@ -0,0 +1,102 @@
+from datetime import timedelta
+from unittest import mock
+from zoneinfo import ZoneInfo
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+from .. import common_functions
+from ..models import ActivityEvent, ActivityEventField, ActivityEventRollup
+from ..common_functions import save_records_to_model
+from ..fetch_activity_events_functions import remove_old_activity_events
+from ..generate_fake_data_functions import generate_and_save_fake_data_vectorized
+from ..purge_functions import to_archive_record
+from ..rollup_functions import get_rollup_series, get_chart_rollup_pairs, rebuild_rollups, build_pair_rollups, sum_rollup_months
+from .. import app_settings as aps
+
+
+class RollupTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        for fieldname, fieldtype in [('creationtime', 'DateTimeField'), ('lastrefreshtime', 'DateTimeField'), ('activity', 'CharField'), ('workload', 'CharField')]:
+            ActivityEventField.objects.create(fieldname=fieldname, fieldtype=fieldtype, chart=True)
+        generate_and_save_fake_data_vectorized(260, 5, cls.now - timedelta(days=50), cls.now, seed=41)
+
+    def setUp(self):
+        patcher = mock.patch.multiple(aps, ACTIVITY_EVENTS_PURGE_SLEEP_SECONDS=0, ACTIVITY_EVENTS_PURGE_ARCHIVE=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pairs = get_chart_rollup_pairs()
+        get_rollup_series(self.pairs, self.now - timedelta(days=365))
+
+    def get_changed_records(self, n_events, offset=0):
+        # Stored events moved to other hours, as fetched again from the API
+        pks = list(ActivityEvent.objects.order_by('pk').values_list('pk', flat=True)[offset:offset + n_events])
+        records = [to_archive_record(values) for values in ActivityEvent.objects.filter(pk__in=pks).order_by('pk').values()]
+        for i, record in enumerate(records):
+            record['workload'] = f'Workload{i % 2}'
+            record['creationtime'] = (self.now - timedelta(days=i % 7, hours=3 * i)).isoformat()
+            if i % 3:
+                record['lastrefreshtime'] = None
+        return records
+
+    def get_stored_rollups(self):
+        return sorted(ActivityEventRollup.objects.values_list('granularity', 'time_field', 'fieldname', 'bucket', 'value', 'month', 'count'), key=str)
+
+    def assert_rollups_equal_rebuild(self):
+        incremental = self.get_stored_rollups()
+        rebuild_rollups(self.pairs)
+        self.assertEqual(incremental, self.get_stored_rollups())
+
+    def test_incremental_rollups_equal_rebuild(self):
+        save_records_to_model(self.get_changed_records(35), ActivityEvent, 'task')
+        generate_and_save_fake_data_vectorized(30, 3, self.now - timedelta(days=2), self.now, seed=42)
+        remove_old_activity_events(30)
+        self.assert_rollups_equal_rebuild()
+
+    def test_single_saves_hold_shared_lock(self):
+        calls = []
+        lock_aggregates = common_functions.lock_aggregates
+        snapshot_rollup_values = common_functions.snapshot_rollup_values
+
+        def recording_lock_aggregates(shared=False):
+            calls.append(('lock', shared, len(connection.atomic_blocks)))
+            lock_aggregates(shared)
+
+        def recording_snapshot_rollup_values(pks, pairs):
+            calls.append(('snapshot', len(connection.atomic_blocks)))
+            return snapshot_rollup_values(pks, pairs)
+
+        depth = len(connection.atomic_blocks)
+        with mock.patch.multiple(common_functions, lock_aggregates=recording_lock_aggregates, snapshot_rollup_values=recording_snapshot_rollup_values):
+            save_records_to_model(self.get_changed_records(9, offset=120), ActivityEvent, 'task', batch_size=0)
+        self.assertEqual(calls, [('lock', True, depth + 1), ('snapshot', depth + 1), ('snapshot', depth + 1)])
+        self.assert_rollups_equal_rebuild()
+
+    def test_series_match_events(self):
+        series = get_rollup_series([('creationtime', ''), ('lastrefreshtime', 'activity')], self.now - timedelta(days=365))
+        for granularity in (ActivityEventRollup.HOUR, ActivityEventRollup.DAY):
+            self.assertEqual(sum(row[2] for row in series[('creationtime', '')][granularity]), 260)
+            self.assertEqual(sum(row[2] for row in series[('lastrefreshtime', 'activity')][granularity]),
+                             ActivityEvent.objects.exclude(lastrefreshtime=None).count())
+        # Only the buckets from since on
+        since = self.now - timedelta(days=10)
+        days = get_rollup_series([('creationtime', '')], since, [ActivityEventRollup.DAY])[('creationtime', '')][ActivityEventRollup.DAY]
+        self.assertTrue(all(row[0] >= since - timedelta(days=1) for row in days))
+
+    def test_series_in_other_time_zones(self):
+        pairs = [('creationtime', ''), ('creationtime', 'workload')]
+        sort_key = lambda row: (row[0], row[1] or '')
+        since = self.now - timedelta(days=365)
+        for tzinfo in (ZoneInfo('America/New_York'), ZoneInfo('Asia/Kolkata')):
+            with self.subTest(tzinfo=tzinfo):
+                series = get_rollup_series(pairs, since, [ActivityEventRollup.DAY], tzinfo)
+                for time_field, fieldname in pairs:
+                    # Computed from the events with the days of tzinfo
+                    with timezone.override(tzinfo):
+                        expected = [[rollup[3], rollup[4] if fieldname else None, rollup[5]]
+                                    for rollup in sum_rollup_months(build_pair_rollups(time_field, fieldname)) if rollup[0] == ActivityEventRollup.DAY]
+                    rows = series[(time_field, fieldname)][ActivityEventRollup.DAY]
+                    self.assertEqual(sorted(rows, key=sort_key), sorted(expected, key=sort_key))
+                    self.assertTrue(all(timezone.localtime(row[0], tzinfo).hour == 0 for row in rows))
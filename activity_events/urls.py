@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import ActivityEventListView, export_csv_vw, check_csv_status_vw, download_csv_vw, charts_vw, ActivityEventAPIListView
+from .views import ActivityEventListView, export_csv_vw, check_csv_status_vw, download_csv_vw, charts_vw, chart_series_vw, ActivityEventAPIListView, ActivityEventFacetsAPIView, ActivityEventStreamAPIView, ActivityEventChangesAPIView
 
 
 app_name = 'activity_events'
@@ -10,5 +10,9 @@ urlpatterns = [
     path('check_csv_status/<str:task_id>/', check_csv_status_vw, name='check_csv_status'),
     path('download_csv/<str:file_name>', download_csv_vw, name='download_csv'),
     path('charts/', charts_vw, name='charts'),
+    path('charts/series/', chart_series_vw, name='chart_series'),
     path('api/', ActivityEventAPIListView.as_view(), name='api_events_list'),
+    path('api/export/', ActivityEventStreamAPIView.as_view(), name='api_events_export'),
+    path('api/changes/', ActivityEventChangesAPIView.as_view(), name='api_events_changes'),
+    path('api/facets/', ActivityEventFacetsAPIView.as_view(), name='api_events_facets'),
 ]
@@ -1,21 +1,30 @@
 import os
 from datetime import timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from django.views.generic import ListView
-from django.db.models import Min, Max, Count
-from django.db.models.functions import TruncHour
 from django.utils.dateformat import DateFormat
-from django.http import HttpResponse, HttpResponseNotFound, JsonResponse
+from django.http import HttpResponse, HttpResponseNotFound, JsonResponse, Http404, StreamingHttpResponse
 from django.shortcuts import render
+from django.urls import reverse
 from django.utils import timezone
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
 from django_celery_results.models import TaskResult
 from celery.result import AsyncResult
 from rest_framework import generics
-from .models import ActivityEvent, ActivityEventField, SyncTask
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
+from rest_framework.negotiation import BaseContentNegotiation
+from .models import ActivityEvent, ActivityEventField, ActivityEventRollup, SyncTask
 from .tasks import generate_csv
 from .serializers import ActivityEventSerializer
 from .common_functions import apply_filters_to_queryset, get_latest_successful_task_time
+from .facet_functions import get_facets
+from .rollup_functions import get_rollup_series, BUCKET_GRANULARITIES
+from .pagination import get_keyset_page, get_ordering_keys, ActivityEventCursorPagination, CURSOR_QUERY_PARAM
+from .stream_functions import get_stream_fields, iter_ndjson, iter_csv, to_api_records, STREAM_FORMATS
+from .change_feed_functions import get_changes_queryset
 from . import app_settings as aps
 #from django.utils.dateparse import parse_date
 
@@ -32,6 +41,14 @@ class ActivityEventListView(LoginRequiredMixin, ListView):
         queryset = apply_filters_to_queryset(request_data, queryset, ActivityEventField, ActivityEvent)
         return queryset
 
+    def paginate_queryset(self, queryset, page_size):
+        # Keyset pagination: pages are read from the cursor position instead of an OFFSET
+        try:
+            page = get_keyset_page(queryset, self.request.GET.get(CURSOR_QUERY_PARAM), page_size)
+        except ValueError as e:
+            raise Http404(str(e))
+        return (None, page, page.object_list, page.has_next or page.has_previous)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # Fetch up to maximum number objects field definitions for displaying
@@ -49,20 +66,22 @@ class ActivityEventListView(LoginRequiredMixin, ListView):
         # Fetch fields that are marked for filtering
         filter_fields = ActivityEventField.objects.filter(filter=True)
         filter_values = {}
-        
+        # Distinct values and date ranges are read from the facet store in a single query
+        facets = get_facets([field.fieldname for field in filter_fields])
+
         for field in filter_fields:
             field_name = field.fieldname
             display_name = field.displayname
+            if field_name not in facets:
+                continue
+            facet = facets[field_name]
             if field.fieldtype == 'DateTimeField':
-                # Fetch the min and max date for date fields
-                min_date = ActivityEvent.objects.aggregate(Min(field_name))['%s__min' % field_name]                
-                max_date = ActivityEvent.objects.aggregate(Max(field_name))['%s__max' % field_name]                
-                min_date = DateFormat(min_date).format('Y-m-d')
-                max_date = DateFormat(max_date).format('Y-m-d')                            
+                # The min and max date for date fields
+                min_date = DateFormat(facet['min_value']).format('Y-m-d') if facet['min_value'] else None
+                max_date = DateFormat(facet['max_value']).format('Y-m-d') if facet['max_value'] else None
                 filter_values[field_name] = {'displayname':display_name, 'start':f'{field_name}__gte', 'end':f'{field_name}__lte', 'values': {'min_date': min_date, 'max_date': max_date}}
             else:
-                distinct_values = ActivityEvent.objects.order_by(field_name).values_list(field_name, flat=True).distinct()
-                distinct_values = [value if value != '' else '<blank>' for value in distinct_values]
+                distinct_values = [value if value != '' else '<blank>' for value, count in facet['values']]
                 filter_values[field_name] = {'displayname':display_name, 'values':distinct_values}
 
         orderby_values =  ActivityEventField.objects.filter(orderby=True)   
@@ -126,41 +145,27 @@ def charts_vw(request):
 
     # Get field types and prepare display names and types as lists
     fields = ActivityEvent.get_filtered_fields_dict(filtered_fields)
-    displaynames, fieldtypes, fieldsextra, group_fields = [], [], [], []
-    queryset = None
+    displaynames, fieldtypes, fieldsextra = [], [], []
+    facets = get_facets(list(fields))
+    since = timezone.now() - timedelta(days=aps.ACTIVITY_EVENTS_CHART_MAX_PAST_DAYS)
 
     for field_name, field_info_list in fields.items():
         if field_info_list[0] == 'DateTimeField':
-            max_past_days = aps.ACTIVITY_EVENTS_CHART_MAX_PAST_DAYS                
-            since = timezone.now() - timedelta(days=max_past_days)
-            queryset = ActivityEvent.objects.filter(**{f'{field_name}__gte':since})
-            break
-    
-    for field_name, field_info_list in fields.items():
-        if field_info_list[0] == 'DateTimeField':
-            new_field_name = f'{field_name}_at_hour_level'
-            group_fields.append(new_field_name)
-            queryset = queryset.annotate(**{new_field_name: TruncHour(field_name)})            
-            min_max_values = queryset.aggregate(min_value=Min(field_name), max_value=Max(field_name))
-            min_date = DateFormat(min_max_values['min_value']).format('Y-m-d') if min_max_values['min_value'] else None
-            max_date = DateFormat(min_max_values['max_value']).format('Y-m-d') if min_max_values['max_value'] else None
+            # The stored range is clamped to the charted period
+            min_value, max_value = facets[field_name]['min_value'], facets[field_name]['max_value']
+            if min_value and max_value and max_value >= since:
+                min_value = max(min_value, since)
+            else:
+                min_value = max_value = None
+            min_date = DateFormat(min_value).format('Y-m-d') if min_value else None
+            max_date = DateFormat(max_value).format('Y-m-d') if max_value else None
             fieldsextra.append([min_date, max_date])                     
         else:
-            group_fields.append(field_name)
-            if queryset is None:
-                queryset = ActivityEvent.objects.all()
-            distinct_values = queryset.order_by(field_name).values_list(field_name, flat=True).distinct()
-            distinct_values = [value if value != '' else '<blank>' for value in distinct_values]
+            distinct_values = [value if value != '' else '<blank>' for value, count in facets[field_name]['values']]
             fieldsextra.append(distinct_values)
 
         fieldtypes.append(field_info_list[0])
         displaynames.append(field_name if field_info_list[1] == '' else field_info_list[1])
-    
-
-    queryset = queryset.values(*group_fields).annotate(count=Count('id')).order_by(*group_fields)
- 
-    # Convert queryset to a list of results
-    results = [[item[field] for field in group_fields] + [item['count']] for item in queryset]
 
     args_dict = {'sync_model': SyncTask,
         'celery_model': TaskResult,
@@ -174,19 +179,55 @@ def charts_vw(request):
     
     # Prepare the response dictionary
     response = {
-        'fields': group_fields + ['count'],  # Include 'count' as a field
-        'fieldtypes': fieldtypes + ['IntegerField'],  # Include count as IntegerField
-        'displaynames': displaynames + ['Count'],  # List of display names with "Count"
-        'fieldsextra': fieldsextra + [[]], # Include the extra fields data
-        'dataset': results,
+        'fields': list(fields),
+        'fieldtypes': fieldtypes,
+        'displaynames': displaynames,
+        'fieldsextra': fieldsextra,
+        'series_url': reverse('activity_events:chart_series'),
         'last_data_update_time': last_data_update_time        
     }
 
     return render(request, 'activity_events/activityevent_charts.html', {'data': response})
 
+@login_required
+def chart_series_vw(request):
+    # Series of a single chart, requested by the charts page when the chart is displayed:
+    # the datetime field (none for the bar chart without datetime field), the field it is broken
+    # down by (none for the total), the granularity of the buckets and the time zone of the browser
+    # they are cut in (the TIME_ZONE setting by default)
+    time_field = request.GET.get('time_field', '')
+    field_name = request.GET.get('fieldname', '')
+    granularity = request.GET.get('granularity', ActivityEventRollup.DAY)
+    filtered_fields = list(ActivityEventField.objects.filter(chart=True).values_list('fieldname', flat=True))
+    fieldtypes = ActivityEvent.get_filtered_fields_dict(filtered_fields)
+
+    if time_field and fieldtypes.get(time_field) != 'DateTimeField':
+        return JsonResponse({'error': 'Invalid time_field'}, status=400)
+    if field_name and fieldtypes.get(field_name) in (None, 'DateTimeField'):
+        return JsonResponse({'error': 'Invalid fieldname'}, status=400)
+    if not time_field and not field_name:
+        return JsonResponse({'error': 'A time_field or a fieldname is required'}, status=400)
+    if granularity not in BUCKET_GRANULARITIES:
+        return JsonResponse({'error': 'Invalid granularity'}, status=400)
+    try:
+        tzinfo = ZoneInfo(request.GET['tz']) if request.GET.get('tz') else None
+    except (ZoneInfoNotFoundError, ValueError, OSError):
+        return JsonResponse({'error': 'Invalid tz'}, status=400)
+
+    if time_field:
+        # Only the buckets of this chart are read: [[bucket, value, count], ...]
+        since = timezone.now() - timedelta(days=aps.ACTIVITY_EVENTS_CHART_MAX_PAST_DAYS)
+        rows = get_rollup_series([(time_field, field_name)], since, [granularity], tzinfo)[(time_field, field_name)][granularity]
+    else:
+        # Without datetime field, the number of events per value is read from the facets
+        rows = [[None, value, count] for value, count in get_facets([field_name])[field_name]['values']]
+
+    return JsonResponse({'time_field': time_field, 'fieldname': field_name, 'granularity': granularity, 'rows': rows})
+
 
 class ActivityEventAPIListView(generics.ListAPIView):
     serializer_class = ActivityEventSerializer
+    pagination_class = ActivityEventCursorPagination
 
     def get_queryset(self):
         queryset = ActivityEvent.objects.all()
@@ -194,4 +235,122 @@ class ActivityEventAPIListView(generics.ListAPIView):
         fields_model = ActivityEventField 
         target_model = ActivityEvent
         queryset = apply_filters_to_queryset(request_data, queryset, fields_model, target_model)
-        return queryset
\ No newline at end of file
+        return queryset
+
+    def get_api_fields(self):
+        try:
+            return get_stream_fields(self.request.query_params.get('fields'))
+        except ValueError as e:
+            raise ValidationError({'fields': str(e)})
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs['fields'] = self.get_api_fields()
+        return super().get_serializer(*args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        fields = self.get_api_fields()
+        if not aps.ACTIVITY_EVENTS_API_FAST_SERIALIZATION:
+            return super().list(request, *args, **kwargs)
+        # Reads only the requested columns with values_list() and builds the records directly
+        queryset = self.filter_queryset(self.get_queryset())
+        # The pagination reads the position of the boundary rows from their sort keys
+        key_names = [name for name, descending, nullable in get_ordering_keys(queryset)]
+        queryset = queryset.values_list(*fields, *[name for name in key_names if name not in fields], named=True)
+
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(to_api_records(queryset, fields))
+        return self.get_paginated_response(to_api_records(page, fields))
+
+
+class ActivityEventFacetsAPIView(APIView):
+    # Distinct values with their number of events and date ranges of the filter fields
+
+    def get(self, request):
+        filter_fields = dict(ActivityEventField.objects.filter(filter=True).values_list('fieldname', 'displayname'))
+        facets = get_facets(list(filter_fields))
+        response = {
+            field_name: {
+                'displayname': filter_fields[field_name],
+                'count': facet['count'],
+                'min_value': facet['min_value'],
+                'max_value': facet['max_value'],
+                'values': [{'value': value, 'count': count} for value, count in facet['values']]
+            }
+            for field_name, facet in facets.items()
+        }
+        return Response(response)
+
+
+class StreamContentNegotiation(BaseContentNegotiation):
+    # The format param selects the stream format, errors are always rendered as JSON
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return (renderers[0], renderers[0].media_type)
+
+
+class ActivityEventStreamAPIView(APIView):
+    # Streams every event matching the filters of the API as NDJSON or CSV in a single response
+    content_negotiation_class = StreamContentNegotiation
+    filename = 'activity_events'
+
+    def get_fields(self, request):
+        return get_stream_fields(request.query_params.get('fields'))
+
+    def get_queryset(self, request):
+        return apply_filters_to_queryset(request.query_params, ActivityEvent.objects.all(), ActivityEventField, ActivityEvent)
+
+    def get(self, request):
+        request_data = request.query_params
+        stream_format = request_data.get('format') or 'ndjson'
+        if stream_format not in STREAM_FORMATS:
+            raise ValidationError({'format': f"Supported formats: {', '.join(STREAM_FORMATS)}."})
+        try:
+            fields = self.get_fields(request)
+        except ValueError as e:
+            raise ValidationError({'fields': str(e)})
+
+        queryset = self.get_queryset(request)
+        if stream_format == 'csv':
+            content = iter_csv(queryset, fields)
+        else:
+            content = iter_ndjson(queryset, fields)
+        response = StreamingHttpResponse(content, content_type=STREAM_FORMATS[stream_format])
+        response['Content-Disposition'] = f'attachment; filename="{self.filename}.{stream_format}"'
+        return response
+
+
+class ActivityEventChangesAPIView(ActivityEventStreamAPIView):
+    # Streams the events inserted or updated after the since sequence number, in sequence order.
+    # X-Last-Change-Seq is the since value of the next request.
+    filename = 'activity_events_changes'
+
+    def get_fields(self, request):
+        fields = super().get_fields(request)
+        # Consumers always need the id of the event and its position in the feed
+        return [name for name in (ActivityEvent._meta.pk.name, 'change_seq') if name not in fields] + fields
+
+    def get_queryset(self, request):
+        request_data = request.query_params
+        try:
+            since = int(request_data.get('since') or 0)
+            if since < 0:
+                raise ValueError
+        except ValueError:
+            raise ValidationError({'since': "A non-negative integer is required."})
+        try:
+            limit = int(request_data.get('limit') or 0)
+            if limit < 0:
+                raise ValueError
+        except ValueError:
+            raise ValidationError({'limit': "A non-negative integer is required."})
+        queryset, self.last_seq = get_changes_queryset(super().get_queryset(request), since, limit)
+        return queryset
+
+    def get(self, request):
+        response = super().get(request)
+        response['X-Last-Change-Seq'] = str(self.last_seq)
+        return response
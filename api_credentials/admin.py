@@ -26,7 +26,7 @@ class ServiceCredentialAdmin(admin.ModelAdmin):
     
     def admin_check_response(self, request, pk):
         try:
-            get_access_token(pk)
+            get_access_token(pk, use_cache=False)
             message = f'Response 200: successful service authentication!'
             level = messages.SUCCESS                     
         except Exception as e:
@@ -0,0 +1,7 @@
+from django.conf import settings
+
+API_TOKEN_AUTHORITY_URL = getattr(settings, 'API_TOKEN_AUTHORITY_URL', 'https://login.microsoftonline.com')
+API_HTTP_POOL_SIZE = getattr(settings, 'API_HTTP_POOL_SIZE', 10)
+API_HTTP_CONNECT_TIMEOUT = getattr(settings, 'API_HTTP_CONNECT_TIMEOUT', 10)
+API_HTTP_READ_TIMEOUT = getattr(settings, 'API_HTTP_READ_TIMEOUT', 120)
+API_ACCESS_TOKEN_REFRESH_MARGIN = getattr(settings, 'API_ACCESS_TOKEN_REFRESH_MARGIN', 300)
\ No newline at end of file
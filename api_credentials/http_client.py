@@ -0,0 +1,37 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from . import app_settings as aps
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_http_session():
+    # Keep one pooled session per worker process so connections are reused between requests.
+    # Keyed by pid so forked Celery workers never share sockets with their parent.
+    pid = os.getpid()
+    session = _sessions.get(pid)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(pid)
+            if session is None:
+                session = create_http_session()
+                _sessions.clear()
+                _sessions[pid] = session
+    return session
+
+
+def create_http_session():
+    session = requests.Session()
+    pool_size = aps.API_HTTP_POOL_SIZE
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+    return session
+
+
+def get_http_timeout():
+    return (aps.API_HTTP_CONNECT_TIMEOUT, aps.API_HTTP_READ_TIMEOUT)
\ No newline at end of file
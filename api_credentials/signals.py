@@ -0,0 +1,10 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import ServiceCredential
+from .util import clear_access_token_cache
+
+
+@receiver([post_save, post_delete], sender=ServiceCredential)
+def invalidate_access_token(sender, instance, **kwargs):
+    # Drop the cached token so the next request authenticates with the edited credentials
+    clear_access_token_cache(instance.tenant_id, instance.client_id)
\ No newline at end of file
@@ -1,3 +1,45 @@
-from django.test import TestCase
+from unittest import mock
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from .models import ServiceCredential
+from .util import get_access_token, get_access_token_cache_key
 
-# Create your tests here.
+
+@override_settings(SERVICE_CREDENTIALS_TENANT_ID=None, SERVICE_CREDENTIALS_CLIENT_ID=None, SERVICE_CREDENTIALS_CLIENT_SECRET=None)
+class AccessTokenCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.credential = ServiceCredential.objects.create(name='Test', tenant_id='tenant', client_id='client', client_secret='secret')
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.tokens = iter(['token-1', 'token-2', 'token-3'])
+        patcher = mock.patch('api_credentials.util.get_http_session')
+        self.session = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.session.post.side_effect = lambda *args, **kwargs: mock.Mock(json=lambda: {'access_token': next(self.tokens), 'expires_in': 3599})
+
+    def test_token_is_reused_until_refreshed(self):
+        self.assertEqual(get_access_token(), 'token-1')
+        self.assertEqual(get_access_token(), 'token-1')
+        self.assertEqual(self.session.post.call_count, 1)
+        self.assertEqual(self.session.post.call_args.kwargs['data']['client_secret'], 'secret')
+        # Bypassing the cache requests a new token, which is shared afterwards
+        self.assertEqual(get_access_token(use_cache=False), 'token-2')
+        self.assertEqual(get_access_token(), 'token-2')
+
+    def test_short_lived_token_is_not_cached(self):
+        self.session.post.side_effect = lambda *args, **kwargs: mock.Mock(json=lambda: {'access_token': next(self.tokens), 'expires_in': 60})
+        self.assertEqual(get_access_token(), 'token-1')
+        self.assertEqual(get_access_token(), 'token-2')
+
+    def test_saving_credential_invalidates_token(self):
+        self.assertEqual(get_access_token(), 'token-1')
+        self.credential.client_secret = 'new-secret'
+        self.credential.save()
+        self.assertEqual(get_access_token(), 'token-2')
+        self.assertEqual(self.session.post.call_args.kwargs['data']['client_secret'], 'new-secret')
+        self.credential.delete()
+        self.assertIsNone(cache.get(get_access_token_cache_key('tenant', 'client')))
@@ -1,10 +1,13 @@
 import requests
 from .models import ServiceCredential
+from .http_client import get_http_session, get_http_timeout
+from . import app_settings as aps
 from django.conf import settings
+from django.core.cache import cache
 from django.http import Http404
 from django.shortcuts import get_object_or_404
 
-def get_access_token(service_credential_pk=None):
+def get_access_token(service_credential_pk=None, use_cache=True):
 
     credentials = {}
 
@@ -36,19 +39,27 @@ def get_access_token(service_credential_pk=None):
         else:
             service_credential = get_object_or_404(ServiceCredential, pk=service_credential_pk)
 
-        # Populate the credentials dictionary from the ServiceCredential instance
+        # Populate the credentials dictionary from the ServiceCredential instance.
+        # The client secret is only decrypted when a new token has to be requested.
         credentials = {
             'tenant_id': service_credential.tenant_id,
             'client_id': service_credential.client_id,
-            'client_secret': service_credential.client_secret
+            'client_secret': None
         }
 
     tenant_id = credentials['tenant_id']
     client_id = credentials['client_id']
-    client_secret = credentials['client_secret']
+
+    cache_key = get_access_token_cache_key(tenant_id, client_id)
+    if use_cache:
+        access_token = cache.get(cache_key)
+        if access_token:
+            return access_token
+
+    client_secret = credentials['client_secret'] or service_credential.client_secret
 
     # Azure AD Token endpoint URL
-    token_url = f'https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token'
+    token_url = f'{aps.API_TOKEN_AUTHORITY_URL}/{tenant_id}/oauth2/v2.0/token'
 
     # Headers for the request
     headers = {
@@ -65,12 +76,18 @@ def get_access_token(service_credential_pk=None):
 
     try:
         # Make the POST request to obtain the access token
-        response = requests.post(token_url, headers=headers, data=data)
+        response = get_http_session().post(token_url, headers=headers, data=data, timeout=get_http_timeout())
         response.raise_for_status()  # Raise HTTPError for non-2xx responses
 
         # Parse JSON response to extract the access token
         token_response = response.json()
         access_token = token_response.get('access_token')
+
+        # Share the token with every process until shortly before it expires
+        timeout = int(token_response.get('expires_in', 0)) - aps.API_ACCESS_TOKEN_REFRESH_MARGIN
+        if access_token and timeout > 0:
+            cache.set(cache_key, access_token, timeout)
+
         return access_token
 
     except requests.exceptions.RequestException as e:
@@ -79,4 +96,12 @@ def get_access_token(service_credential_pk=None):
 
     except Exception as e:
         # Handle other unexpected exceptions (e.g., JSON parsing errors)
-        raise Exception(f'Error: {str(e)}')
\ No newline at end of file
+        raise Exception(f'Error: {str(e)}')
+
+
+def get_access_token_cache_key(tenant_id, client_id):
+    return f'api_credentials:access_token:{tenant_id}:{client_id}'
+
+
+def clear_access_token_cache(tenant_id, client_id):
+    cache.delete(get_access_token_cache_key(tenant_id, client_id))
\ No newline at end of file
@@ -138,6 +138,18 @@ encryption_key_str = os.environ.get("ENCRYPTION_KEY", '19-IXXsVB4ngQkRcSr6mb6quu
 
 ENCRYPTION_KEY = encryption_key_str.encode()
 
+# Cache shared by the web and Celery processes (e.g. Power BI access tokens).
+# Falls back to the per-process local memory cache when no location is configured.
+CACHE_LOCATION = os.environ.get("CACHE_LOCATION")
+
+if CACHE_LOCATION:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_LOCATION,
+        }
+    }
+
 CELERY_BROKER_URL = os.environ.get("CELERY_BROKER", "redis://localhost:6379/0")
 CELERY_RESULT_BACKEND = 'django-db'
 CELERY_CACHE_BACKEND = 'django-cache'